@@ -10,7 +10,7 @@ class CustomUserAdmin(UserAdmin):
     
     fieldsets = UserAdmin.fieldsets + (
         ('Additional Info', {
-            'fields': ('role', 'phone_number', 'address')
+            'fields': ('role', 'phone_number', 'address', 'delivery_capacity')
         }),
     )
     
@@ -0,0 +1,57 @@
+import copy
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from apps.core.cache import LRUCache
+
+user_cache = LRUCache(max_size=settings.JWT_USER_CACHE_SIZE, ttl=settings.JWT_USER_CACHE_TTL)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps recently seen users in memory instead of
+    loading them from the users table on every request.
+
+    Entries are dropped when the user is saved or deleted in this process
+    (see accounts.signals); other processes pick up changes after
+    JWT_USER_CACHE_TTL seconds.
+    """
+
+    def get_user(self, validated_token):
+        # Revocation checks compare against the stored password hash
+        if api_settings.CHECK_REVOKE_TOKEN or not settings.JWT_USER_CACHE_TTL:
+            return super().get_user(validated_token)
+
+        # Tokens carry the id as a string, keys are normalised to match
+        user_id = str(validated_token.get(api_settings.USER_ID_CLAIM))
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        # Each request gets its own instance, views are free to modify it
+        return copy.copy(user)
+
+
+def authenticate_token(request):
+    """
+    Resolve the user for a plain Django view from the Authorization header.
+    Returns None when the token is missing or invalid.
+    """
+    authenticator = CachedJWTAuthentication()
+    try:
+        result = authenticator.authenticate(request)
+        if result is not None:
+            return result[0]
+    except (InvalidToken, AuthenticationFailed):
+        pass
+    return None
+
+
+async def aauthenticate_token(request):
+    # The user lookup may hit the database on a cache miss
+    return await sync_to_async(authenticate_token)(request)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_user_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='delivery_capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,54 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import user_cache
+from .models import User
 
-# Create your tests here.
+
+@override_settings(JWT_USER_CACHE_TTL=60)
+class CachedJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='customer', password='pass', first_name='Old')
+
+    def setUp(self):
+        user_cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def profile(self):
+        return self.client.get('/api/v1/auth/profile/')
+
+    def test_cache_hit_skips_the_users_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.profile().status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.profile()
+        self.assertEqual(response.json()['data']['username'], 'customer')
+
+    def test_requests_get_their_own_instance(self):
+        self.profile()
+        cached = user_cache.get(str(self.user.pk))
+        response = self.client.put('/api/v1/auth/profile/', {'first_name': 'New'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cached.first_name, 'Old')
+
+    def test_saving_the_user_evicts_the_entry(self):
+        self.profile()
+        self.assertIsNotNone(user_cache.get(str(self.user.pk)))
+
+        User.objects.filter(pk=self.user.pk).update(first_name='Stale')
+        self.assertEqual(self.profile().json()['data']['first_name'], 'Old')
+
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'New'
+        user.save()
+        self.assertIsNone(user_cache.get(str(self.user.pk)))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.profile().json()['data']['first_name'], 'New')
+
+    def test_deleting_the_user_evicts_the_entry(self):
+        self.profile()
+        User.objects.get(pk=self.user.pk).delete()
+        self.assertIsNone(user_cache.get(str(self.user.pk)))
+        self.assertEqual(self.profile().status_code, 401)
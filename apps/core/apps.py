@@ -0,0 +1,20 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.core'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from .metrics import install_query_recorder
+        from .serializers import install_serializer_timing
+
+        if settings.METRICS_ENABLED:
+            connection_created.connect(install_query_recorder, dispatch_uid='core.metrics.query_recorder')
+            # Connections opened before ready() don't send the signal
+            for connection in connections.all(initialized_only=True):
+                install_query_recorder(connection=connection)
+            install_serializer_timing()
@@ -1,27 +1,42 @@
+from django.http import JsonResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from . import routers
+
+
+def build_envelope(success, message, data, status_code):
+    return {
+        "success": success,
+        "message": message,
+        "status_code": status_code,
+        "data": data if data is not None else {}
+    }
+
 
 class BaseAPIView(APIView):
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Authentication has run, so the read-your-writes pin can be checked
+        request.replica_token = routers.start_request(request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        routers.finish_request(request, response, getattr(request, 'replica_token', None))
+        return response
     
     def success_response(self, message="Thank you for your request", data=None, status_code=status.HTTP_200_OK):
-        return Response(
-            {
-                "success": True,
-                "message": message,
-                "status_code": status_code,
-                "data": data if data is not None else {}
-            }, 
-            status=status_code
-        )
+        return Response(build_envelope(True, message, data, status_code), status=status_code)
         
     def error_response(self, message="I am sorry for your request", data=None, status_code=status.HTTP_400_BAD_REQUEST):
-        return Response(
-            {
-                "success": False,
-                "message": message,
-                "status_code": status_code,
-                "data": data if data is not None else {}
-            }, 
-            status=status_code
-        )
+        return Response(build_envelope(False, message, data, status_code), status=status_code)
+
+
+def json_success_response(message="Thank you for your request", data=None, status_code=status.HTTP_200_OK):
+    return JsonResponse(build_envelope(True, message, data, status_code), status=status_code)
+
+
+def json_error_response(message="I am sorry for your request", data=None, status_code=status.HTTP_400_BAD_REQUEST):
+    # Same envelope as BaseAPIView, for plain Django views
+    return JsonResponse(build_envelope(False, message, data, status_code), status=status_code)
@@ -0,0 +1,30 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """
+    Return a 304 response when the client's If-None-Match / If-Modified-Since
+    validators still match, otherwise None. Call it before serializing.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None and response.status_code == 304:
+        return set_validators(response, etag=etag, last_modified=last_modified)
+    return None
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Clients must revalidate, but can keep the body around
+    response['Cache-Control'] = 'private, no-cache'
+    return response
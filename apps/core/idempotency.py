@@ -0,0 +1,126 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+
+def _claim_key(user, scope, key, request_hash):
+    """
+    Return (record, created). `record` is None when a concurrent retry won
+    the race for the key, which the caller treats as still in progress.
+    """
+    now = timezone.now()
+    claim = {
+        'request_hash': request_hash,
+        'status_code': None,
+        'response_data': None,
+        'locked_until': now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+        'expires_at': now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+    }
+    lookup = {'user': user, 'scope': scope, 'key': key}
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(**lookup, **claim), True
+    except IntegrityError:
+        record = IdempotencyKey.objects.filter(**lookup).first()
+    if record is None:
+        # Released by a failed request since our insert collided
+        return None, False
+
+    abandoned = (
+        record.status_code is None
+        and record.request_hash == request_hash
+        and (record.locked_until is None or record.locked_until <= now)
+    )
+    if record.expires_at <= now or abandoned:
+        # Compare-and-set on the values we read, so only one retry takes it over
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, locked_until=record.locked_until, expires_at=record.expires_at
+        ).update(**claim)
+        if not taken:
+            return None, False
+        for field, value in claim.items():
+            setattr(record, field, value)
+        return record, True
+    return record, False
+
+
+def _owned(record):
+    # A claim taken over by a retry belongs to that retry from then on
+    return IdempotencyKey.objects.filter(pk=record.pk, locked_until=record.locked_until)
+
+
+def idempotent(scope):
+    """
+    Make a BaseAPIView handler replay its stored response when a request is
+    retried with the same `Idempotency-Key` header.
+
+    `scope` may reference the URL kwargs, e.g. "payments:checkout:{order_id}".
+    Requests without the header are handled as usual.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.META.get(IDEMPOTENCY_HEADER)
+            if not key or not request.user.is_authenticated:
+                return handler(self, request, *args, **kwargs)
+
+            if len(key) > MAX_KEY_LENGTH:
+                return self.error_response(
+                    message="Invalid Idempotency-Key",
+                    data={"error": f"Key must be at most {MAX_KEY_LENGTH} characters"},
+                    status_code=status.HTTP_400_BAD_REQUEST
+                )
+
+            request_hash = hashlib.sha256(request.body).hexdigest()
+            # The claim commits on its own, so a concurrent retry sees the
+            # unfinished record and gets a 409 instead of waiting on the
+            # handler's transaction
+            with transaction.atomic():
+                record, created = _claim_key(request.user, scope.format(**kwargs), key, request_hash)
+
+            if not created:
+                if record is not None and record.request_hash != request_hash:
+                    return self.error_response(
+                        message="Idempotency-Key reused",
+                        data={"error": "This key was already used with a different request body"},
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                if record is None or record.status_code is None:
+                    return self.error_response(
+                        message="Request in progress",
+                        data={"error": "A request with this Idempotency-Key is still being processed"},
+                        status_code=status.HTTP_409_CONFLICT
+                    )
+                return Response(record.response_data, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+            try:
+                response = handler(self, request, *args, **kwargs)
+            except BaseException:
+                _owned(record).delete()
+                raise
+
+            # Server errors are not stored, so the client can retry them
+            if response.status_code >= 500:
+                _owned(record).delete()
+            else:
+                _owned(record).update(
+                    status_code=response.status_code,
+                    response_data=json.loads(json.dumps(response.data, cls=JSONEncoder)),
+                    locked_until=None,
+                )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # One counter per bucket plus +Inf, then the sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def clear(self):
+        with self._lock:
+            self._series = {}
+
+    def collect(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, values in sorted(series.items()):
+            label_text = ','.join(
+                f'{name}="{escape_label(value)}"' for name, value in zip(self.labelnames, labels)
+            )
+            prefix = f"{label_text}," if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            count = cumulative + values[-2]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {values[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', "Request latency by route.", ('method', 'route', 'status')
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', "Database queries per request by route.", ('method', 'route'), QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_DURATION = Histogram(
+    'http_request_db_duration_seconds', "Time spent in database queries per request by route.", ('method', 'route')
+)
+COMPONENT_DURATION = Histogram(
+    'component_duration_seconds', "Time spent in serializers, renderers and Stripe calls.", ('component', 'route')
+)
+METRICS = (REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_DURATION, COMPONENT_DURATION)
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    for metric in METRICS:
+        metric.clear()
+
+
+class RequestMetrics:
+    def __init__(self, capture_sql=False):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.components = {}
+        self.capture_sql = capture_sql
+        self.statements = []
+
+    def add(self, component, seconds):
+        self.components[component] = self.components.get(component, 0.0) + seconds
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection; the context variable carries the
+    # request's metrics across sync_to_async into the ORM's thread
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.queries += 1
+        metrics.db_seconds += elapsed
+        if metrics.capture_sql:
+            metrics.statements.append((elapsed, sql))
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    # connection_created receiver; the wrapper list outlives reconnects
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class timed(ContextDecorator):
+    """
+    Time a block (or function) as a named component, e.g. 'stripe'.
+
+    Inside a request the time is attributed to its route; elsewhere, such as
+    the outbox worker, it is recorded with an empty route.
+    """
+
+    def __init__(self, component):
+        self.component = component
+
+    def _recreate_cm(self):
+        # A fresh instance per decorated call, so concurrent calls don't share start
+        return type(self)(self.component)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add(self.component, elapsed)
+        else:
+            COMPONENT_DURATION.observe((self.component, ''), elapsed)
+        return False
+
+
+def get_route(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Record latency, query count and time, and component timings per route.
+
+    Queries are counted by record_query, which CoreConfig installs on every
+    database connection. Requests slower than SLOW_REQUEST_MS are logged
+    with their slowest SQL statements. Works under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = settings.SLOW_REQUEST_MS
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics(capture_sql=bool(self.slow_ms))
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - start, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics(capture_sql=bool(self.slow_ms))
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - start, metrics)
+        return response
+
+    def record(self, request, response, elapsed, metrics):
+        route = get_route(request)
+        REQUEST_DURATION.observe((request.method, route, str(response.status_code)), elapsed)
+        REQUEST_QUERIES.observe((request.method, route), metrics.queries)
+        REQUEST_DB_DURATION.observe((request.method, route), metrics.db_seconds)
+        for component, seconds in metrics.components.items():
+            COMPONENT_DURATION.observe((component, route), seconds)
+
+        if self.slow_ms and elapsed * 1000 >= self.slow_ms:
+            self.log_slow_request(request, response, elapsed, metrics)
+
+    def log_slow_request(self, request, response, elapsed, metrics):
+        slowest = sorted(metrics.statements, key=lambda statement: statement[0], reverse=True)
+        slowest = slowest[:settings.SLOW_REQUEST_SQL_LIMIT]
+        components = ', '.join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in metrics.components.items())
+        logger.warning(
+            "Slow request %s %s -> %s: %.1f ms, %d queries in %.1f ms%s%s",
+            request.method, request.get_full_path(), response.status_code, elapsed * 1000,
+            metrics.queries, metrics.db_seconds * 1000,
+            f" ({components})" if components else '',
+            ''.join(f"\n  {seconds * 1000:8.2f} ms  {sql}" for seconds, sql in slowest),
+        )
@@ -0,0 +1,114 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPagination:
+    """
+    Cursor pagination over (-created_at, -id).
+
+    Pages are fetched with a range condition on the ordering columns instead
+    of an OFFSET, so fetching page 1000 costs the same as fetching page 1.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.GET.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, position, reverse=False):
+        created_at, pk = position
+        payload = json.dumps({'c': created_at.isoformat(), 'i': pk, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, value):
+        if not value:
+            return None
+        try:
+            padded = value + '=' * (-len(value) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            created_at = parse_datetime(payload['c'])
+            pk = int(payload['i'])
+            reverse = bool(payload.get('r', 0))
+        except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError):
+            raise InvalidCursor("Invalid cursor")
+        if created_at is None:
+            raise InvalidCursor("Invalid cursor")
+        return created_at, pk, reverse
+
+    def get_position(self, row):
+        if isinstance(row, dict):
+            return row['created_at'], row['id']
+        return row.created_at, row.id
+
+    def paginate_queryset(self, queryset, request):
+        queryset, page_size, cursor = self.get_page_queryset(queryset, request)
+        return self.build_page(list(queryset), page_size, cursor)
+
+    async def apaginate_queryset(self, queryset, request):
+        queryset, page_size, cursor = self.get_page_queryset(queryset, request)
+        return self.build_page([row async for row in queryset], page_size, cursor)
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request.GET.get(self.cursor_query_param))
+        reverse = bool(cursor and cursor[2])
+
+        if cursor is None:
+            queryset = queryset.order_by('-created_at', '-id')
+        elif not reverse:
+            created_at, pk, _ = cursor
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            ).order_by('-created_at', '-id')
+        else:
+            created_at, pk, _ = cursor
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ).order_by('created_at', 'id')
+        # One extra row tells whether there is a next page
+        return queryset[:page_size + 1], page_size, cursor
+
+    def build_page(self, rows, page_size, cursor):
+        reverse = bool(cursor and cursor[2])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_cursor = None
+        self.previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                self.next_cursor = self.encode_cursor(self.get_position(rows[-1]))
+            if cursor is not None and (has_more or not reverse):
+                self.previous_cursor = self.encode_cursor(self.get_position(rows[0]), reverse=True)
+        return rows
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_data(self, results):
+        return {
+            "next": self.get_link(self.next_cursor),
+            "previous": self.get_link(self.previous_cursor),
+            "results": results,
+        }
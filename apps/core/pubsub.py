@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionOverflow(Exception):
+    """The subscriber fell behind and messages after the queued ones were lost."""
+
+
+class Subscription:
+    def __init__(self, broker, channel, queue, loop):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue
+        self.loop = loop
+        self.overflowed = False
+
+    async def get(self, timeout=None):
+        # Whatever was queued before the overflow is still delivered
+        if self.overflowed and self.queue.empty():
+            raise SubscriptionOverflow(self.channel)
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """
+    In-process pub/sub. Subscribers are asyncio queues on the ASGI event
+    loop; publish() may be called from any thread, including sync views.
+
+    A subscriber whose queue fills up is unsubscribed rather than sent a
+    partial stream; its get() raises SubscriptionOverflow once the queued
+    messages are read.
+
+    Only subscribers in the same process see a message. Deployments with
+    several worker processes need a broker with the same interface backed
+    by shared infrastructure.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, asyncio.Queue(self.max_queue_size), asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(self._deliver, subscription, message)
+            except RuntimeError:
+                # The subscriber's loop is gone, drop it
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+    def _deliver(self, subscription, message):
+        if subscription.overflowed:
+            return
+        try:
+            subscription.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Skipping just this message would leave a silent gap; cut the
+            # subscriber off instead so it can catch up from the source
+            subscription.overflowed = True
+            self.unsubscribe(subscription)
+            logger.warning("Closing slow subscriber on %s, its queue is full", subscription.channel)
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._subscribers.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.EVENTS_BROKER)()
+    return _broker
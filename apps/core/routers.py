@@ -0,0 +1,86 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+# Apps whose rows must always be read fresh: payments and checkout state,
+# idempotency keys
+PRIMARY_ONLY_APPS = {'payments', 'core'}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+class ReplicaRouter:
+    """
+    Send reads to REPLICA_DATABASES, but only inside replica_reads().
+
+    Everything else - writes, management commands, the outbox worker, the
+    Stripe webhook and any request outside BaseAPIView - stays on the
+    primary, so replica lag can only affect the read-only API endpoints.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_DATABASES
+        if (not replicas or not _replica_reads.get()
+                or model._meta.app_label in PRIMARY_ONLY_APPS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+def reading_replicas():
+    """True inside a request whose reads may come from a lagging replica."""
+    return _replica_reads.get()
+
+
+def pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def is_pinned(user):
+    return bool(caches[settings.REPLICA_PIN_CACHE].get(pin_key(user.pk)))
+
+
+def pin_to_primary(user):
+    caches[settings.REPLICA_PIN_CACHE].set(pin_key(user.pk), True, settings.REPLICA_PIN_SECONDS)
+
+
+def start_request(request):
+    """
+    Enable replica reads for a safe request, unless the user wrote within
+    the last REPLICA_PIN_SECONDS and should see their own changes.
+
+    Returns a token for finish_request, or None.
+    """
+    if not settings.REPLICA_DATABASES or request.method not in SAFE_METHODS:
+        return None
+    user = request.user
+    if user.is_authenticated and is_pinned(user):
+        return None
+    return _replica_reads.set(True)
+
+
+def finish_request(request, response, token):
+    if token is not None:
+        _replica_reads.reset(token)
+    elif (settings.REPLICA_DATABASES and request.method not in SAFE_METHODS
+            and response.status_code < 400 and request.user.is_authenticated):
+        pin_to_primary(request.user)
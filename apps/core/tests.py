@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from apps.accounts.models import User
+from apps.accounts.serializers import UserSerializer
+from apps.orders.models import Order
+from apps.orders.serializers import OrderSerializer
+from apps.payments.models import Payment
+from .base import BaseAPIView
+from .idempotency import idempotent
+from .metrics import render_metrics, reset_metrics
+from .models import IdempotencyKey
+from .pubsub import LocalBroker, SubscriptionOverflow
+from .routers import ReplicaRouter, _replica_reads, is_pinned, pin_key
+
+
+class RecordingView(BaseAPIView):
+    # Reports where an Order read would be routed from inside the view
+    def get(self, request):
+        return self.success_response(data={"db": ReplicaRouter().db_for_read(Order)})
+
+    def post(self, request):
+        return self.success_response(data={"db": ReplicaRouter().db_for_read(Order)})
+
+
+@override_settings(REPLICA_DATABASES=['replica_0', 'replica_1'])
+class ReplicaRouterTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_use_primary_outside_replica_context(self):
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_reads_use_replicas_inside_replica_context(self):
+        token = _replica_reads.set(True)
+        try:
+            self.assertIn(self.router.db_for_read(Order), {'replica_0', 'replica_1'})
+            self.assertEqual(self.router.db_for_read(Payment), 'default')
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(Order), 'default')
+        finally:
+            _replica_reads.reset(token)
+
+    def test_writes_and_migrations_use_primary(self):
+        token = _replica_reads.set(True)
+        try:
+            self.assertEqual(self.router.db_for_write(Order), 'default')
+        finally:
+            _replica_reads.reset(token)
+        self.assertFalse(self.router.allow_migrate('replica_0', 'orders'))
+        self.assertIsNone(self.router.allow_migrate('default', 'orders'))
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_no_replicas_configured(self):
+        token = _replica_reads.set(True)
+        try:
+            self.assertEqual(self.router.db_for_read(Order), 'default')
+        finally:
+            _replica_reads.reset(token)
+
+
+@override_settings(REPLICA_DATABASES=['replica_0'], REPLICA_PIN_SECONDS=60)
+class ReadYourWritesTests(TransactionTestCase):
+    # Not TestCase: reads inside its wrapping transaction always use the primary
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='customer', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.factory = APIRequestFactory()
+        self.view = RecordingView.as_view()
+
+    def tearDown(self):
+        caches[settings.REPLICA_PIN_CACHE].delete_many([pin_key(self.user.pk), pin_key(self.other.pk)])
+
+    def call(self, method, user):
+        request = getattr(self.factory, method)('/recording/')
+        force_authenticate(request, user=user)
+        return self.view(request).data['data']['db']
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.call('get', self.user), 'replica_0')
+        self.assertFalse(_replica_reads.get())
+
+    def test_write_pins_the_user_to_primary(self):
+        self.assertEqual(self.call('post', self.user), 'default')
+        self.assertTrue(is_pinned(self.user))
+        self.assertEqual(self.call('get', self.user), 'default')
+        self.assertEqual(self.call('get', self.other), 'replica_0')
+
+
+class IdempotentView(BaseAPIView):
+    calls = []
+
+    @idempotent('test')
+    def post(self, request):
+        # Records whether the handler ran inside the key claim's transaction
+        self.calls.append(connection.in_atomic_block)
+        if request.data.get('retry'):
+            # The client retries before the first request has answered
+            return self.success_response(data={"retry": IdempotencyTests.post(request.data).status_code})
+        if request.data.get('fail'):
+            raise RuntimeError("boom")
+        return self.success_response(data={"call": len(self.calls)}, status_code=201)
+
+
+class IdempotencyTests(TransactionTestCase):
+    # Not TestCase: its wrapping transaction would hide the claim's own commit
+
+    def setUp(self):
+        IdempotentView.calls = []
+        self.user = User.objects.create_user(username='customer', password='pass')
+        type(self).user = self.user
+
+    @classmethod
+    def post(cls, data, key='key-1'):
+        request = APIRequestFactory().post('/idempotent/', data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, user=cls.user)
+        return IdempotentView.as_view()(request)
+
+    def test_handler_runs_after_the_claim_commits(self):
+        first = self.post({})
+        second = self.post({})
+        self.assertEqual(IdempotentView.calls, [False])
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+
+    def test_retry_while_in_progress_is_a_conflict(self):
+        response = self.post({'retry': True})
+        self.assertEqual(response.data['data'], {"retry": 409})
+        self.assertEqual(IdempotentView.calls, [False])
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 200)
+
+    def test_failed_handler_releases_the_key(self):
+        with self.assertRaises(RuntimeError):
+            self.post({'fail': True})
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def claim(self, locked_for):
+        # What a worker that died mid-request leaves behind
+        now = timezone.now()
+        return IdempotencyKey.objects.create(
+            user=self.user, scope='test', key='key-1', request_hash=hashlib.sha256(b'{}').hexdigest(),
+            locked_until=now + timedelta(seconds=locked_for), expires_at=now + timedelta(days=1),
+        )
+
+    def test_abandoned_claim_is_taken_over_after_the_lock(self):
+        self.claim(locked_for=30)
+        self.assertEqual(self.post({}).status_code, 409)
+        self.assertEqual(IdempotentView.calls, [])
+
+        IdempotencyKey.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.post({}).status_code, 201)
+        record = IdempotencyKey.objects.get()
+        self.assertEqual((record.status_code, record.locked_until), (201, None))
+        self.assertEqual(self.post({})['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(IdempotentView.calls), 1)
+
+    def test_losing_a_takeover_race_is_a_conflict(self):
+        self.claim(locked_for=-1)
+        first = QuerySet.first
+
+        def taken_over_meanwhile(queryset):
+            # Another retry takes the claim over between our read and update
+            record = first(queryset)
+            IdempotencyKey.objects.update(locked_until=timezone.now() + timedelta(seconds=60))
+            return record
+
+        with mock.patch.object(QuerySet, 'first', taken_over_meanwhile):
+            self.assertEqual(self.post({}).status_code, 409)
+        self.assertEqual(IdempotentView.calls, [])
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.order = Order.objects.create(
+            user=cls.customer, pickup_address="House 1", delivery_address="House 3", recipient_name="Recipient",
+            recipient_phone="01700000000", package_description="Documents", package_weight='1.50', delivery_cost='120.00',
+        )
+
+    def setUp(self):
+        reset_metrics()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_requests_are_recorded_by_route(self):
+        self.assertEqual(self.client.get(f'/api/v1/orders/{self.order.pk}/').status_code, 200)
+        self.client.get('/api/v1/orders/999999/')
+        output = render_metrics()
+
+        route = 'route="api/v1/orders/<int:pk>/"'
+        self.assertIn(f'http_request_duration_seconds_count{{method="GET",{route},status="200"}} 1', output)
+        self.assertIn(f'http_request_duration_seconds_count{{method="GET",{route},status="404"}} 1', output)
+        self.assertIn(f'http_request_db_queries_count{{method="GET",{route}}} 2', output)
+        # OrderSerializer is a plain DRF serializer, timed at its .data
+        self.assertIn(f'component_duration_seconds_count{{component="serializer",{route}}} 1', output)
+        self.assertIn(f'component_duration_seconds_count{{component="render",{route}}} 2', output)
+
+    def test_a_serialized_list_is_one_sample(self):
+        for _ in range(2):
+            Order.objects.create(
+                user=self.customer, pickup_address="House 1", delivery_address="House 3", recipient_name="Recipient",
+                recipient_phone="01700000000", package_description="Documents", package_weight='1.50', delivery_cost='120.00',
+            )
+        # Outside a request every sample is observed with an empty route
+        data = OrderSerializer(Order.objects.all(), many=True).data
+        self.assertEqual(len(data), 3)
+        self.assertEqual(UserSerializer(self.customer).data['username'], 'customer')
+        output = render_metrics()
+        self.assertIn('component_duration_seconds_count{component="serializer",route=""} 2', output)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_requires_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', response.content.decode())
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_endpoint_is_closed_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+
+class LocalBrokerTests(SimpleTestCase):
+    async def test_full_queue_closes_the_subscription(self):
+        broker = LocalBroker(max_queue_size=2)
+        subscription = broker.subscribe('channel')
+        for message in range(4):
+            broker.publish('channel', message)
+        # Deliveries are scheduled on the loop with call_soon_threadsafe
+        await asyncio.sleep(0)
+
+        self.assertEqual(broker.subscriber_count('channel'), 0)
+        self.assertEqual([await subscription.get(timeout=1) for _ in range(2)], [0, 1])
+        with self.assertRaises(SubscriptionOverflow):
+            await subscription.get(timeout=1)
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework import status
+from .base import json_error_response
+from .metrics import render_metrics
+
+
+def metrics(request):
+    # Scrapers authenticate with METRICS_TOKEN; without one it is only open in DEBUG
+    token = settings.METRICS_TOKEN
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            return json_error_response(
+                message="Authentication required",
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+    elif not settings.DEBUG:
+        return json_error_response(
+            message="Permission denied",
+            data={"error": "Set METRICS_TOKEN to enable the metrics endpoint"},
+            status_code=status.HTTP_403_FORBIDDEN
+        )
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Order, TrackingHistory
+from django.utils.html import format_html_join
+from .archive import unpack_events
+from .models import CourierOrderStats, DailyOrderStats, Order, StatusOrderStats, TrackingArchive, TrackingHistory
 
 class TrackingHistoryInline(admin.TabularInline):
     model = TrackingHistory
@@ -7,10 +9,28 @@ class TrackingHistoryInline(admin.TabularInline):
     readonly_fields = ('created_at',)
     can_delete = False
 
+class TrackingArchiveInline(admin.StackedInline):
+    # History moved out of TrackingHistory by `manage.py archive_tracking`
+    model = TrackingArchive
+    fields = ('event_count', 'first_at', 'last_at', 'last_status', 'archived_at', 'history')
+    readonly_fields = fields
+    can_delete = False
+
+    @admin.display(description='History')
+    def history(self, obj):
+        return format_html_join(
+            '\n', '<div>{} &middot; {} &middot; {} &middot; {}</div>',
+            ((event['created_at'], event['status'], event['location'] or '-', event['notes'] or '') for event in unpack_events(obj))
+        )
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'delivery_man', 'status', 'delivery_cost', 'is_paid', 'created_at')
     list_filter = ('status', 'is_paid', 'created_at', 'user', 'delivery_man')
     search_fields = ('id', 'user__username', 'delivery_man__username', 'recipient_name', 'recipient_phone')
+    list_select_related = ('user', 'delivery_man')
     readonly_fields = ('created_at', 'updated_at')
     ordering = ('-created_at',)
     
@@ -31,7 +51,7 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
     
-    inlines = [TrackingHistoryInline]
+    inlines = [TrackingHistoryInline, TrackingArchiveInline]
     
     def get_queryset(self, request):
         # Admin can see all orders
@@ -42,22 +62,24 @@ class OrderAdmin(admin.ModelAdmin):
         if obj.delivery_man and obj.status == 'pending':
             obj.status = 'assigned'
         
+        # Read the stored status before saving, afterwards it matches obj
+        original_status = self.model.objects.filter(pk=obj.pk).values_list('status', flat=True).first() if change else None
+        
         super().save_model(request, obj, form, change)
         
         # Create tracking history if status changed
-        if change:
-            original_obj = self.model.objects.get(pk=obj.pk)
-            if original_obj.status != obj.status:
-                TrackingHistory.objects.create(
-                    order=obj,
-                    status=obj.status,
-                    notes=f"Status changed from {original_obj.status} to {obj.status} via admin panel"
-                )
+        if change and original_status != obj.status:
+            TrackingHistory.objects.create(
+                order=obj,
+                status=obj.status,
+                notes=f"Status changed from {original_status} to {obj.status} via admin panel"
+            )
 
 class TrackingHistoryAdmin(admin.ModelAdmin):
     list_display = ('order', 'status', 'location', 'created_at')
     list_filter = ('status', 'created_at')
     search_fields = ('order__id', 'notes', 'location')
+    list_select_related = ('order__user',)
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
     
@@ -65,5 +87,37 @@ class TrackingHistoryAdmin(admin.ModelAdmin):
         # Admin can see all tracking history
         return super().get_queryset(request)
 
+class OrderStatsAdmin(admin.ModelAdmin):
+    # Summary rows are maintained by apps.orders.stats, never edited by hand
+    readonly_fields = ('orders', 'paid_orders', 'revenue', 'paid_ratio', 'updated_at')
+
+    @admin.display(description='Paid ratio')
+    def paid_ratio(self, obj):
+        return f"{obj.paid_ratio:.1%}"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class DailyOrderStatsAdmin(OrderStatsAdmin):
+    list_display = ('day', 'orders', 'paid_orders', 'revenue', 'paid_ratio')
+    date_hierarchy = 'day'
+
+class StatusOrderStatsAdmin(OrderStatsAdmin):
+    list_display = ('status', 'orders', 'paid_orders', 'revenue', 'paid_ratio')
+
+class CourierOrderStatsAdmin(OrderStatsAdmin):
+    list_display = ('delivery_man', 'orders', 'paid_orders', 'revenue', 'paid_ratio')
+    list_select_related = ('delivery_man',)
+    search_fields = ('delivery_man__username',)
+
 admin.site.register(Order, OrderAdmin)
-admin.site.register(TrackingHistory, TrackingHistoryAdmin)
\ No newline at end of file
+admin.site.register(TrackingHistory, TrackingHistoryAdmin)
+admin.site.register(DailyOrderStats, DailyOrderStatsAdmin)
+admin.site.register(StatusOrderStats, StatusOrderStatsAdmin)
+admin.site.register(CourierOrderStats, CourierOrderStatsAdmin)
@@ -0,0 +1,149 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Order, TrackingArchive, TrackingHistory
+
+ARCHIVE_STATUSES = ('delivered', 'cancelled')
+EVENT_FIELDS = ('id', 'status', 'location', 'notes', 'created_at')
+# Ids per DELETE, well under SQLite's bound parameter limit
+DELETE_BATCH_SIZE = 500
+
+
+def pack_events(events):
+    """Compress events (oldest first) as zlib'd JSON, keeping full timestamp precision."""
+    data = [dict(event, created_at=event['created_at'].isoformat()) for event in events]
+    return zlib.compress(json.dumps(data, separators=(',', ':')).encode(), 9)
+
+
+def unpack_events(archive):
+    events = json.loads(zlib.decompress(archive.events))
+    for event in events:
+        event['created_at'] = datetime.fromisoformat(event['created_at'])
+    return events
+
+
+def get_archive(order):
+    # None if the order was never archived; callers select_related it
+    return getattr(order, 'tracking_archive', None)
+
+
+def merge_summary(summary, archive):
+    """Add archived events to a live {'last_modified', 'count'} aggregate."""
+    if archive is None:
+        return summary
+    last_modified = summary['last_modified']
+    return {
+        'last_modified': max(last_modified, archive.last_at) if last_modified else archive.last_at,
+        'count': summary['count'] + archive.event_count,
+    }
+
+
+def merge_rows(rows, archive):
+    """
+    Live TrackingHistoryReadSerializer rows plus the archived ones, newest
+    first like the model ordering.
+    """
+    if archive is None:
+        return rows
+    archived = [dict(event, order=archive.order_id) for event in unpack_events(archive)]
+    return sorted(archived + list(rows), key=lambda row: (row['created_at'], row['id']), reverse=True)
+
+
+def archived_entries(archive, after_id=None):
+    """Archived events as unsaved TrackingHistory instances, oldest first."""
+    if archive is None:
+        return []
+    return [
+        TrackingHistory(order_id=archive.order_id, **event)
+        for event in unpack_events(archive)
+        if after_id is None or event['id'] > after_id
+    ]
+
+
+def archivable_orders(cutoff):
+    return (Order.objects
+            .filter(status__in=ARCHIVE_STATUSES, updated_at__lt=cutoff)
+            .filter(Exists(TrackingHistory.objects.filter(order=OuterRef('pk'))))
+            .order_by('pk'))
+
+
+def _archive_chunk(order_ids):
+    with transaction.atomic():
+        rows = list(
+            TrackingHistory.objects.filter(order_id__in=order_ids)
+            .order_by('order_id', 'created_at', 'id')
+            .values('order_id', *EVENT_FIELDS)
+        )
+        archives = {archive.order_id: archive for archive in
+                    TrackingArchive.objects.select_for_update().filter(order_id__in=order_ids)}
+        created, updated = [], []
+        for order_id, group in groupby(rows, key=itemgetter('order_id')):
+            events = [{field: row[field] for field in EVENT_FIELDS} for row in group]
+            archive = archives.get(order_id)
+            if archive is not None:
+                # Rows added after an earlier run, e.g. an admin status change
+                events = sorted(unpack_events(archive) + events, key=lambda event: (event['created_at'], event['id']))
+                updated.append(archive)
+            else:
+                archive = TrackingArchive(order_id=order_id)
+                created.append(archive)
+            last = events[-1]
+            archive.events = pack_events(events)
+            archive.event_count = len(events)
+            archive.first_at = events[0]['created_at']
+            archive.last_at = last['created_at']
+            archive.last_status = last['status']
+            archive.last_location = last['location']
+            archive.last_notes = last['notes']
+            archive.archived_at = timezone.now()
+
+        TrackingArchive.objects.bulk_create(created)
+        TrackingArchive.objects.bulk_update(updated, [
+            'events', 'event_count', 'first_at', 'last_at', 'last_status', 'last_location', 'last_notes', 'archived_at'
+        ])
+        # Plain DELETE by id, without loading the rows to send post_delete:
+        # readers see the same history, so there is nothing to invalidate
+        _delete_history([row['id'] for row in rows])
+    return len(rows)
+
+
+def _delete_history(ids):
+    table = connection.ops.quote_name(TrackingHistory._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            batch = ids[start:start + DELETE_BATCH_SIZE]
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(batch))})", batch)
+
+
+def archive_tracking(days=None, batch_size=500, dry_run=False):
+    """
+    Move the tracking history of orders delivered or cancelled more than
+    `days` days ago into TrackingArchive, one transaction per `batch_size`
+    orders. Returns the number of orders and events archived (or, with
+    dry_run, that would be).
+    """
+    days = settings.TRACKING_ARCHIVE_AFTER_DAYS if days is None else days
+    orders = archivable_orders(timezone.now() - timedelta(days=days))
+    if dry_run:
+        return {
+            'orders': orders.count(),
+            'events': TrackingHistory.objects.filter(order__in=orders.values('pk')).count(),
+        }
+
+    report = {'orders': 0, 'events': 0}
+    last_pk = 0
+    while True:
+        order_ids = list(orders.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+        if not order_ids:
+            return report
+        report['events'] += _archive_chunk(order_ids)
+        report['orders'] += len(order_ids)
+        last_pk = order_ids[-1]
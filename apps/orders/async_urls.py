@@ -0,0 +1,8 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path('', async_views.order_list, name='async-order-list'),
+    path('<int:pk>/', async_views.order_detail, name='async-order-detail'),
+    path('<int:pk>/tracking/', async_views.order_tracking, name='async-order-tracking'),
+]
@@ -0,0 +1,139 @@
+from django.db.models import Count, Max
+from django.views.decorators.http import require_GET
+from rest_framework import status
+
+from apps.accounts.authentication import aauthenticate_token
+from apps.core.base import json_error_response, json_success_response
+from apps.core.conditional import not_modified, set_validators
+from apps.core.pagination import KeysetPagination, InvalidCursor
+from .archive import get_archive, merge_rows, merge_summary
+from .cache import get_order_list_cache
+from .models import Order
+from .serializers import OrderSerializer, OrderReadSerializer, TrackingHistoryReadSerializer
+from .streams import can_view_order
+from .views import filter_order_list, order_etag, tracking_etag
+
+# ASGI-native twins of the read endpoints in views.py, served under
+# /api/v1/async/orders/. They use the async ORM, so a worker never parks a
+# thread on a request.
+
+
+async def authenticate(request):
+    user = await aauthenticate_token(request)
+    if user is not None:
+        request.user = user
+    return user
+
+
+@require_GET
+async def order_list(request):
+    user = await authenticate(request)
+    if user is None:
+        return json_error_response(
+            message="Authentication required",
+            status_code=status.HTTP_401_UNAUTHORIZED
+        )
+
+    cache = get_order_list_cache()
+    cache_key = cache.make_key(request)
+    data = cache.get(cache_key)
+    if data is not None:
+        return json_success_response(message="Orders retrieved successfully", data=data)
+
+    orders, fields, errors = filter_order_list(user, request.GET)
+    if errors:
+        return json_error_response(
+            message="Invalid filters",
+            data=errors,
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+
+    paginator = KeysetPagination()
+    try:
+        rows = OrderReadSerializer.values(orders, fields, extra=('id', 'created_at'))
+        page = await paginator.apaginate_queryset(rows, request)
+    except InvalidCursor as e:
+        return json_error_response(
+            message="Invalid cursor",
+            data={"error": str(e)},
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+
+    data = paginator.get_paginated_data(OrderReadSerializer(page, fields).data)
+    cache.set(cache_key, data)
+    return json_success_response(message="Orders retrieved successfully", data=data)
+
+
+@require_GET
+async def order_detail(request, pk):
+    user = await authenticate(request)
+    if user is None:
+        return json_error_response(
+            message="Authentication required",
+            status_code=status.HTTP_401_UNAUTHORIZED
+        )
+
+    order = await Order.objects.select_related('user', 'delivery_man').filter(pk=pk).afirst()
+    if order is None:
+        return json_error_response(
+            message="Order not found",
+            status_code=status.HTTP_404_NOT_FOUND
+        )
+    if not can_view_order(user, order):
+        return json_error_response(
+            message="Permission denied",
+            data={"error": "You don't have permission to view this order"},
+            status_code=status.HTTP_403_FORBIDDEN
+        )
+
+    etag = order_etag(order)
+    response = not_modified(request, etag=etag, last_modified=order.updated_at)
+    if response is not None:
+        return response
+
+    response = json_success_response(
+        message="Order retrieved successfully",
+        data=OrderSerializer(order).data
+    )
+    return set_validators(response, etag=etag, last_modified=order.updated_at)
+
+
+@require_GET
+async def order_tracking(request, pk):
+    user = await authenticate(request)
+    if user is None:
+        return json_error_response(
+            message="Authentication required",
+            status_code=status.HTTP_401_UNAUTHORIZED
+        )
+
+    order = await Order.objects.select_related('tracking_archive').filter(pk=pk).afirst()
+    if order is None:
+        return json_error_response(
+            message="Order not found",
+            status_code=status.HTTP_404_NOT_FOUND
+        )
+    if not can_view_order(user, order):
+        return json_error_response(
+            message="Permission denied",
+            data={"error": "You don't have permission to view tracking information for this order"},
+            status_code=status.HTTP_403_FORBIDDEN
+        )
+
+    archive = get_archive(order)
+    summary = merge_summary(
+        await order.tracking_history.aaggregate(last_modified=Max('created_at'), count=Count('id')), archive
+    )
+    last_modified = summary['last_modified']
+    etag = tracking_etag(order, summary)
+    response = not_modified(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    history = TrackingHistoryReadSerializer.values(order.tracking_history.all())
+    rows = [row async for row in history]
+    response = json_success_response(
+        message="Tracking history retrieved successfully",
+        data=TrackingHistoryReadSerializer(merge_rows(rows, archive)).data
+    )
+    return set_validators(response, etag=etag, last_modified=last_modified)
@@ -0,0 +1,145 @@
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from apps.core.routers import reading_replicas
+
+ADMIN_SCOPE = 'admin'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def courier_scope(courier_id):
+    return f'courier:{courier_id}'
+
+
+class OrderListCache:
+    """
+    Caches rendered order list pages per user, role and query string.
+
+    Every list belongs to a scope (the customer, the delivery man, or all
+    admins) whose version token is part of the cache key. Invalidating a
+    scope swaps its token, so stale pages are never read again and simply
+    age out of the backend. Tokens are random, so a token that was evicted
+    comes back as a new one rather than as an old one.
+
+    Without a backend nothing is cached: make_key() returns None and get(),
+    set() and invalidate() do nothing. Pages read from a replica are served
+    but not stored.
+    """
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.enabled = backend is not None
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _version_key(self, scope):
+        return f'orders:list:version:{scope}'
+
+    def _version(self, scope):
+        version = self.backend.get(self._version_key(scope))
+        if version is None:
+            version = uuid.uuid4().hex
+            self.backend.set(self._version_key(scope), version, ttl=0)
+        return version
+
+    def scope_for(self, user):
+        if user.role == 'admin':
+            return ADMIN_SCOPE
+        if user.role == 'delivery_man':
+            return courier_scope(user.id)
+        return user_scope(user.id)
+
+    def make_key(self, request):
+        if not self.enabled:
+            return None
+        user = request.user
+        query = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        version = self._version(self.scope_for(user))
+        return f'orders:list:{user.id}:{user.role}:{version}:{request.get_host()}:{query}'
+
+    def get(self, key):
+        if key is None:
+            return None
+        data = self.backend.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, key, data):
+        # A replica may not have the write that produced the current version
+        # token yet; its page would be served as fresh for the whole TTL
+        if key is not None and not reading_replicas():
+            self.backend.set(key, data, ttl=self.ttl)
+
+    def invalidate(self, scopes):
+        if not self.enabled:
+            return
+        for scope in scopes:
+            self.backend.set(self._version_key(scope), uuid.uuid4().hex, ttl=0)
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+_cache = None
+
+
+def get_order_list_cache():
+    global _cache
+    if _cache is None:
+        config = settings.ORDER_LIST_CACHE
+        backend = None
+        if config.get('BACKEND'):
+            backend = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+        _cache = OrderListCache(backend, ttl=config.get('TTL', 300))
+    return _cache
+
+
+@receiver(setting_changed)
+def reset_order_list_cache(setting, **kwargs):
+    global _cache
+    if setting == 'ORDER_LIST_CACHE':
+        _cache = None
+
+
+def invalidate_order_lists(user_ids=(), courier_ids=()):
+    """
+    Drop cached lists for the given customers and delivery men, and for
+    admins.
+
+    Done right away and again on commit: a concurrent request may cache the
+    pre-commit rows in between, and the second swap discards them.
+    """
+    cache = get_order_list_cache()
+    if not cache.enabled:
+        return
+    scopes = {ADMIN_SCOPE}
+    scopes.update(user_scope(user_id) for user_id in user_ids if user_id)
+    scopes.update(courier_scope(courier_id) for courier_id in courier_ids if courier_id)
+    cache.invalidate(scopes)
+    transaction.on_commit(lambda: cache.invalidate(scopes))
@@ -0,0 +1,95 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from apps.accounts.models import User
+from .models import Order
+from .services import apply_assignments
+
+DISPATCH_NOTES = "Order dispatched to delivery man: {username}"
+
+
+def plan_assignments(order_ids, couriers):
+    """
+    Greedily give each order, oldest first, to the least loaded courier
+    that still has capacity.
+
+    `couriers` is an iterable of (courier_id, current_load, capacity). A
+    min-heap keyed on load makes this O(orders * log(couriers)); ties go to
+    the lower courier id so plans are deterministic.
+    """
+    heap = [(load, courier_id, capacity) for courier_id, load, capacity in couriers if load < capacity]
+    heapq.heapify(heap)
+    plan = []
+    for order_id in order_ids:
+        if not heap:
+            break
+        load, courier_id, capacity = heap[0]
+        plan.append((order_id, courier_id))
+        if load + 1 < capacity:
+            heapq.heapreplace(heap, (load + 1, courier_id, capacity))
+        else:
+            heapq.heappop(heap)
+    return plan
+
+
+def courier_workload():
+    """(courier_id, open orders, capacity) for every active delivery man."""
+    loads = dict(
+        Order.objects.filter(status='assigned', delivery_man__isnull=False)
+        .values_list('delivery_man')
+        .annotate(load=Count('id'))
+        .order_by()
+    )
+    default_capacity = settings.DISPATCH_DEFAULT_CAPACITY
+    couriers = User.objects.filter(role='delivery_man', is_active=True).values_list('id', 'delivery_capacity')
+    return [
+        (courier_id, loads.get(courier_id, 0), default_capacity if capacity is None else capacity)
+        for courier_id, capacity in couriers
+    ]
+
+
+def dispatchable_orders(limit=None):
+    orders = (
+        Order.objects.filter(status='pending', is_paid=True, delivery_man__isnull=True)
+        .order_by('created_at', 'id')
+        .values_list('id', flat=True)
+    )
+    return orders[:limit] if limit else orders
+
+
+def dispatch_orders(limit=None, batch_size=None, dry_run=False):
+    """
+    Assign pending paid orders to delivery men and return the number of
+    orders assigned.
+
+    Orders that were assigned or changed by someone else after planning
+    are skipped when the batch is written.
+    """
+    batch_size = batch_size or settings.DISPATCH_BATCH_SIZE
+    plan = plan_assignments(list(dispatchable_orders(limit)), courier_workload())
+    if dry_run or not plan:
+        return len(plan) if dry_run else 0
+
+    couriers = User.objects.only('id', 'username').in_bulk({courier_id for _, courier_id in plan})
+    # Batches grouped by courier turn into a few UPDATEs each instead of one per order
+    plan.sort(key=lambda assignment: assignment[1])
+    assigned = 0
+    plan = iter(plan)
+    while True:
+        chunk = dict(islice(plan, batch_size))
+        if not chunk:
+            break
+        with transaction.atomic():
+            orders = (
+                Order.objects.select_for_update()
+                .filter(id__in=chunk.keys(), status='pending', delivery_man__isnull=True)
+                .only('id', 'user', 'status', 'delivery_man', 'updated_at', 'created_at', 'is_paid', 'delivery_cost')
+            )
+            assignments = [(order, couriers[chunk[order.id]]) for order in orders]
+            apply_assignments(assignments, notes=DISPATCH_NOTES)
+        assigned += len(assignments)
+    return assigned
@@ -0,0 +1,41 @@
+from django.db import transaction
+
+from apps.core.pubsub import get_broker
+from .serializers import TrackingHistoryReadSerializer
+
+
+def tracking_channel(order_id):
+    return f"orders:{order_id}:tracking"
+
+
+def _row(entry):
+    # The values() row TrackingHistoryReadSerializer expects
+    return {
+        'id': entry.id,
+        'status': entry.status,
+        'location': entry.location,
+        'notes': entry.notes,
+        'created_at': entry.created_at,
+        'order': entry.order_id,
+    }
+
+
+def publish_tracking_events(history):
+    """
+    Push new TrackingHistory rows to live subscribers once they are committed.
+
+    Rows are only serialized, in one pass, for orders somebody is watching;
+    batch writes touching thousands of unwatched orders cost next to nothing.
+    """
+    history = list(history)
+
+    def publish():
+        broker = get_broker()
+        watched = [entry for entry in history if broker.subscriber_count(tracking_channel(entry.order_id))]
+        if not watched:
+            return
+        messages = TrackingHistoryReadSerializer([_row(entry) for entry in watched]).data
+        for entry, data in zip(watched, messages):
+            broker.publish(tracking_channel(entry.order_id), data)
+
+    transaction.on_commit(publish)
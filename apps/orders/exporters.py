@@ -0,0 +1,104 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Case, Exists, F, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce
+
+from apps.payments.models import Payment
+from .filters import filter_orders
+from .models import Order, TrackingHistory
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+EXPORT_COLUMNS = (
+    'id', 'username', 'delivery_man_username', 'status', 'is_paid',
+    'pickup_address', 'delivery_address', 'recipient_name', 'recipient_phone',
+    'package_description', 'package_weight', 'delivery_cost', 'created_at', 'updated_at',
+    'payment_status', 'payment_amount', 'payment_currency', 'payment_session_id', 'payment_created_at',
+    'tracking_status', 'tracking_location', 'tracking_notes', 'tracking_created_at',
+)
+
+# Flush the CSV/JSONL output in pieces of roughly this many bytes
+OUTPUT_BUFFER_SIZE = 64 * 1024
+
+
+def export_queryset(params):
+    """
+    Orders matching the list filters, joined with their latest Payment and
+    latest TrackingHistory row, as flat dicts.
+    """
+    orders, errors = filter_orders(Order.objects.all(), params)
+    payments = Payment.objects.filter(order=OuterRef('pk')).order_by('-created_at', '-id')
+    tracking = TrackingHistory.objects.filter(order=OuterRef('pk')).order_by('-created_at', '-id')
+    orders = orders.annotate(
+        username=F('user__username'),
+        delivery_man_username=F('delivery_man__username'),
+        payment_status=Subquery(payments.values('payment_status')[:1]),
+        payment_amount=Subquery(payments.values('amount')[:1]),
+        payment_currency=Subquery(payments.values('currency')[:1]),
+        payment_session_id=Subquery(payments.values('stripe_session_id')[:1]),
+        payment_created_at=Subquery(payments.values('created_at')[:1]),
+        # Archived orders usually have no live rows left; fall back to the
+        # archive summary (location and notes may legitimately be NULL)
+        tracking_status=Coalesce(Subquery(tracking.values('status')[:1]), F('tracking_archive__last_status')),
+        tracking_location=Case(
+            When(Exists(tracking), then=Subquery(tracking.values('location')[:1])),
+            default=F('tracking_archive__last_location'),
+        ),
+        tracking_notes=Case(
+            When(Exists(tracking), then=Subquery(tracking.values('notes')[:1])),
+            default=F('tracking_archive__last_notes'),
+        ),
+        tracking_created_at=Coalesce(Subquery(tracking.values('created_at')[:1]), F('tracking_archive__last_at')),
+    ).order_by('created_at', 'id').values(*EXPORT_COLUMNS)
+    return orders, errors
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def _buffered(pieces):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= OUTPUT_BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+# Spreadsheets run text cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    # Only text is user input; numbers such as a negative amount stay numbers
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([_csv_cell(row[column]) for column in EXPORT_COLUMNS])
+
+
+def _jsonl_lines(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def iter_export(queryset, file_format, chunk_size=2000):
+    """Yield the export as text chunks, fetching rows with a server-side cursor."""
+    rows = queryset.iterator(chunk_size=chunk_size)
+    lines = _csv_lines(rows) if file_format == 'csv' else _jsonl_lines(rows)
+    return _buffered(lines)
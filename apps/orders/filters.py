@@ -0,0 +1,99 @@
+from datetime import datetime, time
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Order
+
+BOOLEAN_VALUES = {
+    'true': True, '1': True, 'yes': True,
+    'false': False, '0': False, 'no': False,
+}
+
+
+# Largest value a BigAutoField holds
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_id(value):
+    # Not isdigit(): it accepts characters like '²' that int() rejects
+    if not value.isdecimal() or int(value) > MAX_ID:
+        return None
+    return int(value)
+
+
+def parse_datetime_param(value, end_of_day=False):
+    try:
+        # Dates first: parse_datetime reads a bare date as midnight, which
+        # would make created_before=<date> skip that whole day
+        day = parse_date(value)
+        if day is not None:
+            parsed = datetime.combine(day, time.max if end_of_day else time.min)
+        else:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                return None
+    except ValueError:
+        # Well formed but impossible, e.g. 2024-02-30
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_orders(queryset, params):
+    """
+    Apply the list filters from the query string.
+
+    Returns the filtered queryset and a dict of errors keyed by parameter.
+    """
+    errors = {}
+    valid_statuses = {value for value, _ in Order.STATUS_CHOICES}
+
+    status_param = params.get('status')
+    if status_param:
+        statuses = [value.strip() for value in status_param.split(',') if value.strip()]
+        invalid = [value for value in statuses if value not in valid_statuses]
+        if invalid:
+            errors['status'] = f"Invalid status: {', '.join(invalid)}"
+        else:
+            queryset = queryset.filter(status__in=statuses)
+
+    is_paid = params.get('is_paid')
+    if is_paid:
+        if is_paid.lower() not in BOOLEAN_VALUES:
+            errors['is_paid'] = "Must be true or false"
+        else:
+            queryset = queryset.filter(is_paid=BOOLEAN_VALUES[is_paid.lower()])
+
+    delivery_man = params.get('delivery_man')
+    if delivery_man:
+        if delivery_man.lower() == 'none':
+            queryset = queryset.filter(delivery_man__isnull=True)
+        elif parse_id(delivery_man) is not None:
+            queryset = queryset.filter(delivery_man_id=parse_id(delivery_man))
+        else:
+            errors['delivery_man'] = "Must be a user id or 'none'"
+
+    user = params.get('user')
+    if user:
+        if parse_id(user) is not None:
+            queryset = queryset.filter(user_id=parse_id(user))
+        else:
+            errors['user'] = "Must be a user id"
+
+    created_after = params.get('created_after')
+    if created_after:
+        value = parse_datetime_param(created_after)
+        if value is None:
+            errors['created_after'] = "Must be an ISO 8601 date or datetime"
+        else:
+            queryset = queryset.filter(created_at__gte=value)
+
+    created_before = params.get('created_before')
+    if created_before:
+        value = parse_datetime_param(created_before, end_of_day=True)
+        if value is None:
+            errors['created_before'] = "Must be an ISO 8601 date or datetime"
+        else:
+            queryset = queryset.filter(created_at__lte=value)
+
+    return queryset, errors
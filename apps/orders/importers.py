@@ -0,0 +1,103 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .cache import invalidate_order_lists
+from .stats import record_changes, snapshot
+from .models import Order
+from .serializers import OrderCreateSerializer
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+def detect_format(name='', content_type=''):
+    name = (name or '').lower()
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if name.endswith('.csv') or content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')) or content_type in ('application/jsonl', 'application/x-ndjson', 'application/x-jsonlines'):
+        return 'jsonl'
+    return None
+
+
+def iter_records(stream, file_format):
+    """
+    Yield (row_number, record, error) for every record in a binary stream,
+    reading it line by line so the whole file is never held in memory.
+
+    A file that stops decoding as UTF-8 or CSV part way through ends with
+    one error row; the records before it are still imported.
+    """
+    row_number = 0
+    try:
+        for row_number, record, error in _iter_records(stream, file_format):
+            yield row_number, record, error
+    except (UnicodeDecodeError, csv.Error) as e:
+        yield row_number + 1, None, {"non_field_errors": [f"Unreadable file: {e}"]}
+
+
+def _iter_records(stream, file_format):
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            # line_num is the file line the record ends on, the header is line 1
+            yield reader.line_num, record, None
+        return
+
+    for row_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, {"non_field_errors": [f"Invalid JSON: {e}"]}
+            continue
+        if not isinstance(record, dict):
+            yield row_number, None, {"non_field_errors": ["Each line must be a JSON object"]}
+            continue
+        yield row_number, record, None
+
+
+def import_orders(records, user, batch_size=1000, max_errors=1000):
+    """
+    Validate records in chunks and bulk insert the valid ones for `user`.
+
+    Every chunk is committed on its own, so a bad row only costs itself.
+    Only the first `max_errors` row errors are kept in the report.
+    """
+    # A single serializer validates every row, like ListSerializer does
+    validator = OrderCreateSerializer()
+    report = {"created": 0, "failed": 0, "errors": []}
+    records = iter(records)
+
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+
+        orders = []
+        for row_number, record, error in chunk:
+            if error is None:
+                try:
+                    orders.append(Order(user=user, **validator.run_validation(record)))
+                    continue
+                except serializers.ValidationError as e:
+                    error = serializers.as_serializer_error(e)
+            report["failed"] += 1
+            if len(report["errors"]) < max_errors:
+                report["errors"].append({"row": row_number, "errors": error})
+
+        with transaction.atomic():
+            Order.objects.bulk_create(orders, batch_size=batch_size)
+            # bulk_create does not send post_save
+            record_changes(after=[snapshot(order) for order in orders])
+            invalidate_order_lists([user.id])
+        report["created"] += len(orders)
+
+    return report
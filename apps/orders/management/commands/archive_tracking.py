@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.orders.archive import archive_tracking
+
+
+class Command(BaseCommand):
+    help = "Compress the tracking history of long delivered or cancelled orders into TrackingArchive."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Archive orders finished more than N days ago (default: TRACKING_ARCHIVE_AFTER_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Orders archived per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how much would be archived")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        report = archive_tracking(days=options['days'], batch_size=options['batch_size'], dry_run=options['dry_run'])
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        self.stdout.write(
+            f"{verb} {report['events']} tracking events of {report['orders']} orders "
+            f"in {time.monotonic() - started:.2f}s"
+        )
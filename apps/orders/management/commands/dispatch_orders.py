@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.orders.dispatch import dispatch_orders
+
+
+class Command(BaseCommand):
+    help = "Assign pending paid orders to the least loaded delivery men."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help="Max orders to dispatch per run")
+        parser.add_argument('--batch-size', type=int, help="Orders written per transaction")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds between runs")
+        parser.add_argument('--once', action='store_true', help="Dispatch once and exit")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many orders would be assigned")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            assigned = dispatch_orders(
+                limit=options['limit'], batch_size=options['batch_size'], dry_run=options['dry_run']
+            )
+            verb = "Would assign" if options['dry_run'] else "Assigned"
+            self.stdout.write(f"{verb} {assigned} orders in {time.monotonic() - started:.2f}s")
+            if options['once'] or options['dry_run']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.orders.exporters import EXPORT_FORMATS, export_queryset, iter_export
+
+
+class Command(BaseCommand):
+    help = "Stream orders with their latest payment and tracking event as CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help="File to write, '-' for stdout")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--status', help="Comma separated order statuses")
+        parser.add_argument('--is-paid', choices=('true', 'false'))
+        parser.add_argument('--created-after', help="ISO 8601 date or datetime")
+        parser.add_argument('--created-before', help="ISO 8601 date or datetime")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        params = {
+            'status': options['status'],
+            'is_paid': options['is_paid'],
+            'created_after': options['created_after'],
+            'created_before': options['created_before'],
+        }
+        orders, errors = export_queryset({key: value for key, value in params.items() if value})
+        if errors:
+            raise CommandError('; '.join(f"{key}: {value}" for key, value in errors.items()))
+
+        chunks = iter_export(orders, options['format'], chunk_size=options['chunk_size'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+        else:
+            with open(options['output'], 'w', newline='') as output:
+                for chunk in chunks:
+                    output.write(chunk)
@@ -0,0 +1,44 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.models import User
+from apps.orders.importers import IMPORT_FORMATS, detect_format, import_orders, iter_records
+
+
+class Command(BaseCommand):
+    help = "Bulk import orders for a user from a CSV or JSONL file ('-' reads stdin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help="Username that will own the orders")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-errors', type=int, default=1000, help="Row errors to include in the report")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+
+        file_format = options['format'] or detect_format(options['path'])
+        if file_format is None:
+            raise CommandError("Cannot detect the file format, pass --format")
+
+        if options['path'] == '-':
+            report = self.run(sys.stdin.buffer, file_format, user, options)
+        else:
+            with open(options['path'], 'rb') as stream:
+                report = self.run(stream, file_format, user, options)
+
+        for error in report['errors']:
+            self.stderr.write(json.dumps(error))
+        self.stdout.write(f"Created {report['created']} orders, {report['failed']} rows failed")
+
+    def run(self, stream, file_format, user, options):
+        return import_orders(
+            iter_records(stream, file_format), user,
+            batch_size=options['batch_size'], max_errors=options['max_errors']
+        )
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:21
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_stats(apps, schema_editor):
+    # Same aggregation as apps.orders.stats.rebuild_stats, on the historical models
+    Order = apps.get_model('orders', 'Order')
+    totals = {
+        'orders': Count('id'),
+        'paid_orders': Count('id', filter=Q(is_paid=True)),
+        'revenue': Coalesce(Sum('delivery_cost', filter=Q(is_paid=True)), Value(Decimal(0))),
+    }
+    orders = Order.objects.order_by()
+    groups = [
+        ('DailyOrderStats', orders.annotate(day=TruncDate('created_at')).values('day')),
+        ('StatusOrderStats', orders.values('status')),
+        ('CourierOrderStats', orders.filter(delivery_man__isnull=False).values('delivery_man_id')),
+    ]
+    for model_name, rows in groups:
+        model = apps.get_model('orders', model_name)
+        model.objects.bulk_create([model(**row) for row in rows.annotate(**totals)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.IntegerField(default=0)),
+                ('paid_orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('day', models.DateField(unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily order stats',
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatusOrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.IntegerField(default=0)),
+                ('paid_orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('assigned', 'Assigned'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Status order stats',
+                'ordering': ['status'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CourierOrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.IntegerField(default=0)),
+                ('paid_orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('delivery_man', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='order_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Courier order stats',
+                'ordering': ['-orders'],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
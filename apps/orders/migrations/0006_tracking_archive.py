@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackingArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('events', models.BinaryField()),
+                ('event_count', models.PositiveIntegerField()),
+                ('first_at', models.DateTimeField()),
+                ('last_at', models.DateTimeField()),
+                ('last_status', models.CharField(choices=[('pending', 'Pending'), ('assigned', 'Assigned'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('last_location', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_notes', models.TextField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tracking_archive', to='orders.order')),
+            ],
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.core.validators import MinValueValidator
 from apps.accounts.models import User
 
@@ -10,14 +11,16 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
     )
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
+    # FK columns are covered by the composite indexes in Meta.indexes
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders', db_index=False)
     delivery_man = models.ForeignKey(
         User, 
         on_delete=models.SET_NULL, 
         null=True, 
         blank=True, 
         related_name='assigned_orders',
-        limit_choices_to={'role': 'delivery_man'}
+        limit_choices_to={'role': 'delivery_man'},
+        db_index=False
     )
     pickup_address = models.TextField()
     delivery_address = models.TextField()
@@ -33,13 +36,37 @@ class Order(models.Model):
     
     def __str__(self):
         return f"Order #{self.id} - {self.user.username} - {self.status}"
+
+    # The signals in orders.signals lock and read the stored row before the
+    # write; the lock must last until the stats change they queue commits
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Role-scoped order lists, keyset paginated on (-created_at, -id)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['delivery_man', '-created_at', '-id'], name='order_courier_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+            # Payment follow-ups only ever look at unpaid orders
+            models.Index(fields=['created_at'], condition=Q(is_paid=False), name='order_unpaid_idx'),
+            # Courier workload only counts orders that are still open
+            models.Index(
+                fields=['delivery_man', 'status'],
+                condition=Q(status__in=['pending', 'assigned']),
+                name='order_courier_open_idx'
+            ),
+        ]
 
 
 class TrackingHistory(models.Model):
-    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='tracking_history')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='tracking_history', db_index=False)
     status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
     location = models.CharField(max_length=255, blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
@@ -50,4 +77,71 @@ class TrackingHistory(models.Model):
     
     class Meta:
         ordering = ['-created_at']
-        verbose_name_plural = 'Tracking Histories'
\ No newline at end of file
+        verbose_name_plural = 'Tracking Histories'
+        indexes = [
+            models.Index(fields=['order', '-created_at'], name='tracking_order_created_idx'),
+        ]
+
+
+class TrackingArchive(models.Model):
+    # History of long finished orders, moved out of TrackingHistory by
+    # `manage.py archive_tracking`; see apps.orders.archive
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='tracking_archive')
+    events = models.BinaryField()
+    event_count = models.PositiveIntegerField()
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    last_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    last_location = models.CharField(max_length=255, blank=True, null=True)
+    last_notes = models.TextField(blank=True, null=True)
+    archived_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Order #{self.order_id} - {self.event_count} archived events"
+
+class OrderStats(models.Model):
+    # Kept current by apps.orders.stats; rebuild with `manage.py rebuild_order_stats`
+    orders = models.IntegerField(default=0)
+    paid_orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def paid_ratio(self):
+        return round(self.paid_orders / self.orders, 4) if self.orders else 0
+
+    class Meta:
+        abstract = True
+
+
+class DailyOrderStats(OrderStats):
+    day = models.DateField(unique=True)
+
+    def __str__(self):
+        return f"{self.day} - {self.orders} orders"
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name_plural = 'Daily order stats'
+
+
+class StatusOrderStats(OrderStats):
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, unique=True)
+
+    def __str__(self):
+        return f"{self.status} - {self.orders} orders"
+
+    class Meta:
+        ordering = ['status']
+        verbose_name_plural = 'Status order stats'
+
+
+class CourierOrderStats(OrderStats):
+    delivery_man = models.OneToOneField(User, on_delete=models.CASCADE, related_name='order_stats')
+
+    def __str__(self):
+        return f"{self.delivery_man} - {self.orders} orders"
+
+    class Meta:
+        ordering = ['-orders']
+        verbose_name_plural = 'Courier order stats'
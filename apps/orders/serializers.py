@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Order, TrackingHistory
 from apps.accounts.models import User
+from apps.core.serializers import ValuesSerializer
 
 class OrderSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
@@ -40,4 +41,57 @@ class TrackingHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = TrackingHistory
         fields = '__all__'
-        read_only_fields = ('created_at',)
\ No newline at end of file
+        read_only_fields = ('created_at',)
+
+
+class OrderReadSerializer(ValuesSerializer):
+    # Read-only twin of OrderSerializer for list endpoints
+    model = Order
+    fields = (
+        'id', 'user', 'delivery_man', 'pickup_address', 'delivery_address',
+        'recipient_name', 'recipient_phone', 'package_description',
+        'package_weight', 'delivery_cost', 'status', 'is_paid',
+        'created_at', 'updated_at',
+    )
+    related_values = {
+        'user': ('user__username', 'user__role'),
+        'delivery_man': ('delivery_man__username', 'delivery_man__role'),
+    }
+    views = {
+        'compact': ('id', 'recipient_name', 'delivery_cost', 'status', 'is_paid', 'created_at'),
+    }
+
+    def to_representation(self, row, converters):
+        data = super().to_representation(row, converters)
+        # Matches User.__str__
+        if 'user' in data:
+            data['user'] = f"{row['user__username']} - {row['user__role']}"
+        if data.get('delivery_man') is not None:
+            data['delivery_man'] = f"{row['delivery_man__username']} - {row['delivery_man__role']}"
+        return data
+
+
+class TrackingHistoryReadSerializer(ValuesSerializer):
+    model = TrackingHistory
+    fields = ('id', 'status', 'location', 'notes', 'created_at', 'order')
+
+
+class BatchStatusItemSerializer(serializers.Serializer):
+    order_id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+
+class BatchAssignItemSerializer(serializers.Serializer):
+    order_id = serializers.IntegerField()
+    delivery_man_id = serializers.IntegerField()
+
+
+BATCH_MAX_ITEMS = 1000
+
+
+class BatchStatusUpdateSerializer(serializers.Serializer):
+    items = BatchStatusItemSerializer(many=True, allow_empty=False, max_length=BATCH_MAX_ITEMS)
+
+
+class BatchAssignSerializer(serializers.Serializer):
+    items = BatchAssignItemSerializer(many=True, allow_empty=False, max_length=BATCH_MAX_ITEMS)
@@ -0,0 +1,139 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.accounts.models import User
+from .cache import invalidate_order_lists
+from .events import publish_tracking_events
+from .models import Order, TrackingHistory
+from .stats import record_changes, snapshot
+
+BULK_BATCH_SIZE = 500
+
+
+def _result(order_id, error=None, **data):
+    if error:
+        return {"order_id": order_id, "success": False, "error": error}
+    return {"order_id": order_id, "success": True, **data}
+
+
+def _update_grouped(orders, fields, now):
+    """
+    Write `fields` for already modified orders with one UPDATE per distinct
+    combination of values. Far cheaper than bulk_update's per-row CASE
+    expressions when many rows get the same values, as they do here.
+    """
+    groups = defaultdict(list)
+    for order in orders:
+        groups[tuple(getattr(order, field) for field in fields)].append(order.id)
+    for values, ids in groups.items():
+        for start in range(0, len(ids), BULK_BATCH_SIZE):
+            Order.objects.filter(id__in=ids[start:start + BULK_BATCH_SIZE]).update(
+                updated_at=now, **dict(zip(fields, values))
+            )
+
+
+def can_update_status(user, order):
+    return user.role == 'admin' or (user.role == 'delivery_man' and order.delivery_man_id == user.id)
+
+
+def update_statuses(user, items):
+    """
+    Apply a list of {"order_id", "status"} changes for `user` in one
+    transaction, with grouped UPDATEs and one bulk INSERT of tracking rows.
+    Returns a result per item, in the order they were given.
+    """
+    results = []
+    with transaction.atomic():
+        orders = Order.objects.select_for_update().in_bulk({item['order_id'] for item in items})
+        now = timezone.now()
+        changed = {}
+        before = {}
+        history = []
+        for item in items:
+            order = orders.get(item['order_id'])
+            if order is None:
+                results.append(_result(item['order_id'], "Order not found"))
+                continue
+            if not can_update_status(user, order):
+                results.append(_result(order.id, "You don't have permission to update the status of this order"))
+                continue
+
+            old_status = order.status
+            before.setdefault(order.id, snapshot(order))
+            order.status = item['status']
+            order.updated_at = now
+            changed[order.id] = order
+            history.append(TrackingHistory(
+                order=order,
+                status=order.status,
+                notes=f"Status changed from {old_status} to {order.status}"
+            ))
+            results.append(_result(order.id, status=order.status))
+
+        _update_grouped(changed.values(), ['status'], now)
+        TrackingHistory.objects.bulk_create(history, batch_size=BULK_BATCH_SIZE)
+        # Neither update() nor bulk_create() send model signals
+        record_changes(before.values(), [snapshot(order) for order in changed.values()])
+        publish_tracking_events(history)
+        invalidate_order_lists(
+            {order.user_id for order in changed.values()},
+            {order.delivery_man_id for order in changed.values()}
+        )
+    return results
+
+
+def apply_assignments(assignments, notes="Order assigned to delivery man: {username}"):
+    """
+    Assign (order, delivery_man) pairs with grouped UPDATEs and one bulk
+    INSERT of tracking rows. Must run inside a transaction.
+    """
+    now = timezone.now()
+    changed = {}
+    before = {}
+    history = []
+    courier_ids = set()
+    for order, delivery_man in assignments:
+        courier_ids.update((order.delivery_man_id, delivery_man.id))
+        before.setdefault(order.id, snapshot(order))
+        order.delivery_man = delivery_man
+        if order.status == 'pending':
+            order.status = 'assigned'
+        order.updated_at = now
+        changed[order.id] = order
+        history.append(TrackingHistory(
+            order=order,
+            status='assigned',
+            notes=notes.format(username=delivery_man.username)
+        ))
+
+    _update_grouped(changed.values(), ['delivery_man_id', 'status'], now)
+    TrackingHistory.objects.bulk_create(history, batch_size=BULK_BATCH_SIZE)
+    # Neither update() nor bulk_create() send model signals
+    record_changes(before.values(), [snapshot(order) for order in changed.values()])
+    publish_tracking_events(history)
+    invalidate_order_lists({order.user_id for order in changed.values()}, courier_ids)
+    return list(changed.values())
+
+
+def assign_delivery_men(items):
+    """Apply a list of {"order_id", "delivery_man_id"} assignments."""
+    results = []
+    with transaction.atomic():
+        orders = Order.objects.select_for_update().in_bulk({item['order_id'] for item in items})
+        delivery_men = User.objects.filter(role='delivery_man').in_bulk({item['delivery_man_id'] for item in items})
+        assignments = []
+        for item in items:
+            order = orders.get(item['order_id'])
+            delivery_man = delivery_men.get(item['delivery_man_id'])
+            if order is None:
+                results.append(_result(item['order_id'], "Order not found"))
+            elif delivery_man is None:
+                results.append(_result(order.id, f"Delivery man {item['delivery_man_id']} not found"))
+            else:
+                assignments.append((order, delivery_man))
+                results.append(_result(order.id, delivery_man_id=delivery_man.id))
+
+        apply_assignments(assignments)
+    return results
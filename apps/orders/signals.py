@@ -0,0 +1,60 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate_order_lists
+from .events import publish_tracking_events
+from .models import Order, TrackingHistory
+from .stats import STATS_FIELDS, record_changes, snapshot
+
+
+def invalidate_lists_for_orders(order_ids):
+    owners = Order.objects.filter(pk__in=order_ids).values_list('user_id', 'delivery_man_id')
+    user_ids = {user_id for user_id, _ in owners}
+    courier_ids = {courier_id for _, courier_id in owners}
+    invalidate_order_lists(user_ids, courier_ids)
+
+
+@receiver(post_save, sender=TrackingHistory)
+def publish_tracking_history(sender, instance, created, **kwargs):
+    if created:
+        publish_tracking_events([instance])
+
+
+@receiver([pre_save, pre_delete], sender=Order)
+def remember_previous_order(sender, instance, **kwargs):
+    # A reassigned order also leaves the previous delivery man's list, and
+    # the stats need the old values to move the order between rows. Locked
+    # until Order.save()/delete() commits, so a concurrent write (say the
+    # webhook marking it paid) can't be counted twice
+    if instance.pk:
+        instance._previous = (Order.objects.select_for_update().filter(pk=instance.pk)
+                              .values('user_id', *STATS_FIELDS).first())
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_lists_for_order(sender, instance, **kwargs):
+    user_ids = {instance.user_id}
+    courier_ids = {instance.delivery_man_id}
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        user_ids.add(previous['user_id'])
+        courier_ids.add(previous['delivery_man_id'])
+    invalidate_order_lists(user_ids, courier_ids)
+
+
+@receiver(post_save, sender=Order)
+def update_stats_for_saved_order(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    record_changes([previous] if previous else [], [snapshot(instance)])
+
+
+@receiver(post_delete, sender=Order)
+def update_stats_for_deleted_order(sender, instance, **kwargs):
+    # None if another process deleted the row first
+    if instance._previous is not None:
+        record_changes([instance._previous], [])
+
+
+@receiver([post_save, post_delete], sender=TrackingHistory)
+def invalidate_order_lists_for_tracking(sender, instance, **kwargs):
+    invalidate_lists_for_orders([instance.order_id])
@@ -0,0 +1,141 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from apps.core.serializers import format_decimal
+from .models import CourierOrderStats, DailyOrderStats, Order, StatusOrderStats
+
+# Everything an order contributes to the summary tables depends on these
+STATS_FIELDS = ('created_at', 'status', 'delivery_man_id', 'is_paid', 'delivery_cost')
+
+
+def snapshot(order):
+    return {field: getattr(order, field) for field in STATS_FIELDS}
+
+
+def _contributions(row):
+    paid = bool(row['is_paid'])
+    counts = (1, int(paid), Decimal(row['delivery_cost']) if paid else Decimal(0))
+    yield (DailyOrderStats, 'day', timezone.localdate(row['created_at'])), counts
+    yield (StatusOrderStats, 'status', row['status']), counts
+    if row['delivery_man_id']:
+        yield (CourierOrderStats, 'delivery_man_id', row['delivery_man_id']), counts
+
+
+def _apply(deltas):
+    # One short transaction, taking the rows in a fixed order so that two
+    # of these never wait on each other crosswise
+    with transaction.atomic():
+        for (model, field, value), (orders, paid_orders, revenue) in sorted(
+            deltas.items(), key=lambda item: (item[0][0]._meta.label, item[0][2])
+        ):
+            rows = model.objects.filter(**{field: value})
+            changes = {
+                'orders': F('orders') + orders,
+                'paid_orders': F('paid_orders') + paid_orders,
+                'revenue': F('revenue') + revenue,
+                'updated_at': timezone.now(),
+            }
+            if not rows.update(**changes):
+                model.objects.bulk_create([model(**{field: value})], ignore_conflicts=True)
+                rows.update(**changes)
+
+
+def record_changes(before=(), after=()):
+    """
+    Move the summary tables from the `before` to the `after` snapshots of a
+    set of orders; an empty side means created or deleted orders. The
+    deltas are summed per key and applied once the caller's transaction
+    commits: one UPDATE per changed key (two more the first time a key is
+    seen), nothing at all if it rolls back.
+
+    Every order write bumps the same day and status rows. Applying the
+    deltas after the commit keeps those rows locked for a few UPDATEs
+    instead of for the whole of each order transaction. A crash between
+    the commit and the UPDATEs loses the deltas; `manage.py
+    rebuild_order_stats` recomputes the tables.
+
+    The update() and bulk_create() paths must call this themselves, the
+    Order signals cover save() and delete().
+    """
+    deltas = defaultdict(lambda: [0, 0, Decimal(0)])
+    for sign, rows in ((-1, before), (1, after)):
+        for row in rows:
+            for key, counts in _contributions(row):
+                delta = deltas[key]
+                for index, value in enumerate(counts):
+                    delta[index] += sign * value
+
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if deltas:
+        # Robust: the orders are already committed, a failure here only
+        # leaves the stats behind until the next rebuild
+        transaction.on_commit(lambda: _apply(deltas), robust=True)
+
+
+def _aggregate(groups):
+    return [
+        dict(row)
+        for row in groups.annotate(
+            orders=Count('id'),
+            paid_orders=Count('id', filter=Q(is_paid=True)),
+            revenue=Coalesce(Sum('delivery_cost', filter=Q(is_paid=True)), Value(Decimal(0))),
+        )
+    ]
+
+
+def rebuild_stats():
+    """Recompute every summary table from the orders. Returns row counts."""
+    orders = Order.objects.order_by()
+    with transaction.atomic():
+        days = _aggregate(orders.annotate(day=TruncDate('created_at')).values('day'))
+        statuses = _aggregate(orders.values('status'))
+        couriers = _aggregate(orders.filter(delivery_man__isnull=False).values('delivery_man_id'))
+        for model in (DailyOrderStats, StatusOrderStats, CourierOrderStats):
+            model.objects.all().delete()
+        DailyOrderStats.objects.bulk_create([DailyOrderStats(**row) for row in days])
+        StatusOrderStats.objects.bulk_create([StatusOrderStats(**row) for row in statuses])
+        CourierOrderStats.objects.bulk_create([CourierOrderStats(**row) for row in couriers])
+    return {'days': len(days), 'statuses': len(statuses), 'couriers': len(couriers)}
+
+
+def _stats_data(row, **extra):
+    return {
+        **extra,
+        'orders': row.orders,
+        'paid_orders': row.paid_orders,
+        'revenue': format_decimal(row.revenue),
+        'paid_ratio': row.paid_ratio,
+    }
+
+
+def stats_summary(days=30, couriers=20):
+    """
+    Dashboard figures read from the summary tables only: three small
+    queries whose cost depends on `days` and `couriers`, not on the number
+    of orders.
+    """
+    statuses = list(StatusOrderStats.objects.filter(orders__gt=0))
+    since = timezone.localdate() - timedelta(days=days - 1)
+    totals = StatusOrderStats(
+        orders=sum(row.orders for row in statuses),
+        paid_orders=sum(row.paid_orders for row in statuses),
+        revenue=sum((row.revenue for row in statuses), Decimal(0)),
+    )
+    return {
+        'totals': _stats_data(totals),
+        'by_status': [_stats_data(row, status=row.status) for row in statuses],
+        'by_day': [
+            _stats_data(row, day=row.day)
+            for row in DailyOrderStats.objects.filter(day__gte=since, orders__gt=0).order_by('day')
+        ],
+        'by_courier': [
+            _stats_data(row, delivery_man_id=row.delivery_man_id, username=row.delivery_man.username)
+            for row in CourierOrderStats.objects.filter(orders__gt=0).select_related('delivery_man').order_by('-orders', 'delivery_man_id')[:couriers]
+        ],
+    }
@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import status
+
+from apps.accounts.authentication import authenticate_token
+from apps.accounts.models import User
+from apps.core.base import json_error_response
+from apps.core.pubsub import SubscriptionOverflow, get_broker
+from .archive import archived_entries, get_archive
+from .events import tracking_channel
+from .filters import parse_id
+from .models import Order
+from .serializers import TrackingHistorySerializer
+
+FINAL_STATUSES = ('delivered', 'cancelled')
+TICKET_SALT = 'orders.tracking-stream'
+
+
+def format_event(data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder)
+    return f"id: {data['id']}\nevent: tracking\ndata: {payload}\n\n"
+
+
+def can_view_order(user, order):
+    return (user.role == 'admin' or
+            (user.role == 'delivery_man' and order.delivery_man_id == user.id) or
+            (user.role == 'user' and order.user_id == user.id))
+
+
+def issue_stream_ticket(user, order):
+    # EventSource can't send headers, so this goes in the stream URL and
+    # with it into access logs: short-lived and good for one order only,
+    # unlike the user's JWT
+    return signing.dumps({'user': user.pk, 'order': order.pk}, salt=TICKET_SALT)
+
+
+def read_stream_ticket(ticket, pk):
+    """Return the user a ticket for order `pk` was issued to, or None."""
+    try:
+        claims = signing.loads(ticket, salt=TICKET_SALT, max_age=settings.TRACKING_STREAM_TICKET_TTL)
+    except signing.BadSignature:
+        return None
+    if claims.get('order') != pk:
+        return None
+    return User.objects.filter(pk=claims.get('user'), is_active=True).first()
+
+
+def _load_request(request, pk):
+    user = authenticate_token(request)
+    if user is None and request.GET.get('ticket'):
+        user = read_stream_ticket(request.GET['ticket'], pk)
+    order = Order.objects.select_related('tracking_archive').filter(pk=pk).first() if user else None
+    return user, order
+
+
+def _history_after(order, last_event_id):
+    history = order.tracking_history.order_by('created_at', 'id')
+    if last_event_id is not None:
+        history = history.filter(id__gt=last_event_id)
+    # Archived events are older than any live row
+    entries = archived_entries(get_archive(order), last_event_id) + list(history)
+    return TrackingHistorySerializer(entries, many=True).data
+
+
+async def _event_stream(backlog, subscription, last_event_id):
+    heartbeat = settings.TRACKING_STREAM_HEARTBEAT
+    try:
+        sent = last_event_id or 0
+        for data in backlog:
+            sent = max(sent, data['id'])
+            yield format_event(data)
+            if data['status'] in FINAL_STATUSES:
+                return
+        if subscription is None:
+            # A finished order gets no new events
+            return
+
+        while True:
+            try:
+                data = await subscription.get(timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            except SubscriptionOverflow:
+                # Events were dropped; ending the stream makes EventSource
+                # reconnect with Last-Event-ID, and the backlog fills the gap
+                return
+            if data['id'] <= sent:
+                continue
+            sent = data['id']
+            yield format_event(data)
+            if data['status'] in FINAL_STATUSES:
+                return
+    finally:
+        if subscription is not None:
+            subscription.close()
+
+
+@require_GET
+async def order_tracking_stream(request, pk):
+    """
+    Server-sent events for an order's tracking history. Sends the history
+    first (or what came after Last-Event-ID on reconnect), then every new
+    event as it is committed, and closes once the order is delivered or
+    cancelled, or when the client falls too far behind to keep up. A
+    reconnect with nothing left to send for a finished order gets 204 No
+    Content. Clients that can't send an Authorization header pass a
+    `ticket` from OrderTrackingStreamTicketView instead. Needs an ASGI
+    server.
+    """
+    user, order = await sync_to_async(_load_request)(request, pk)
+    if user is None:
+        return json_error_response(
+            message="Authentication required",
+            status_code=status.HTTP_401_UNAUTHORIZED
+        )
+    if order is None:
+        return json_error_response(
+            message="Order not found",
+            status_code=status.HTTP_404_NOT_FOUND
+        )
+    if not can_view_order(user, order):
+        return json_error_response(
+            message="Permission denied",
+            data={"error": "You don't have permission to view tracking information for this order"},
+            status_code=status.HTTP_403_FORBIDDEN
+        )
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    last_event_id = parse_id(last_event_id) if last_event_id else None
+
+    finished = order.status in FINAL_STATUSES
+    # Subscribed before reading the backlog, so nothing falls in between
+    subscription = None if finished else get_broker().subscribe(tracking_channel(order.pk))
+    try:
+        backlog = await sync_to_async(_history_after)(order, last_event_id)
+    except BaseException:
+        if subscription is not None:
+            subscription.close()
+        raise
+    if finished and not backlog:
+        # EventSource reconnects whenever a stream ends, except after a 204
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+    response = StreamingHttpResponse(
+        _event_stream(backlog, subscription, last_event_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
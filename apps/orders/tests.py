@@ -1,3 +1,955 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.accounts.models import User
+from apps.core.pubsub import get_broker
+from apps.core.renderers import FastJSONRenderer
+from apps.core.routers import pin_to_primary
+from apps.payments.models import Payment
+from .models import CourierOrderStats, DailyOrderStats, Order, StatusOrderStats, TrackingArchive, TrackingHistory
+from .serializers import (
+    OrderSerializer, OrderReadSerializer, TrackingHistorySerializer, TrackingHistoryReadSerializer
+)
+from .archive import archive_tracking
+from .cache import get_order_list_cache
+from .dispatch import dispatch_orders, plan_assignments
+from .exporters import EXPORT_COLUMNS
+from .events import publish_tracking_events, tracking_channel
+from .stats import rebuild_stats, stats_summary
+
+
+def create_order(user, **kwargs):
+    data = {
+        'user': user,
+        'pickup_address': "House 1, Road 2, Dhaka",
+        'delivery_address': "House 3, Road 4, Chattogram",
+        'recipient_name': "Recipient",
+        'recipient_phone': "01700000000",
+        'package_description': "Documents",
+        'package_weight': '1.50',
+        'delivery_cost': '120.00',
+    }
+    data.update(kwargs)
+    return Order.objects.create(**data)
+
+
+class OrderQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.delivery_man = User.objects.create_user(username='courier', password='pass', role='delivery_man')
+        for _ in range(10):
+            create_order(cls.customer, delivery_man=cls.delivery_man, status='assigned')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_list_query_count_does_not_grow_with_orders(self):
+        self.client.force_authenticate(self.admin)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']['results']), 10)
+
+        for _ in range(10):
+            create_order(self.customer, delivery_man=self.delivery_man, status='assigned')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/orders/?page_size=100')
+        self.assertEqual(len(response.json()['data']['results']), 20)
+
+    def test_role_scoped_list_query_count(self):
+        for user in (self.customer, self.delivery_man):
+            self.client.force_authenticate(user)
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/v1/orders/')
+            self.assertEqual(len(response.json()['data']['results']), 10)
+
+    def test_detail_query_count(self):
+        order = Order.objects.first()
+        self.client.force_authenticate(self.delivery_man)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/v1/orders/{order.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['delivery_man'], str(self.delivery_man))
+
+
+class OrderListFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.other = User.objects.create_user(username='other', password='pass')
+        cls.delivery_man = User.objects.create_user(username='courier', password='pass', role='delivery_man')
+        cls.pending = create_order(cls.customer)
+        cls.assigned = create_order(cls.customer, delivery_man=cls.delivery_man, status='assigned', is_paid=True)
+        cls.delivered = create_order(cls.other, delivery_man=cls.delivery_man, status='delivered', is_paid=True)
+        Order.objects.filter(pk=cls.pending.pk).update(created_at=timezone.make_aware(timezone.datetime(2024, 1, 10, 12)))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def ids(self, query):
+        response = self.client.get(f'/api/v1/orders/?{query}')
+        self.assertEqual(response.status_code, 200, response.json())
+        return {row['id'] for row in response.json()['data']['results']}
+
+    def test_filters(self):
+        self.assertEqual(self.ids('status=assigned,delivered'), {self.assigned.pk, self.delivered.pk})
+        self.assertEqual(self.ids('is_paid=false'), {self.pending.pk})
+        self.assertEqual(self.ids(f'delivery_man={self.delivery_man.pk}'), {self.assigned.pk, self.delivered.pk})
+        self.assertEqual(self.ids('delivery_man=none'), {self.pending.pk})
+        self.assertEqual(self.ids(f'user={self.other.pk}'), {self.delivered.pk})
+        self.assertEqual(self.ids('created_before=2024-01-10'), {self.pending.pk})
+        self.assertEqual(self.ids('created_after=2024-01-10T13:00:00'), {self.assigned.pk, self.delivered.pk})
+
+    def test_invalid_filters_are_rejected(self):
+        for query, param in (
+            ('status=lost', 'status'),
+            ('is_paid=maybe', 'is_paid'),
+            ('delivery_man=\u00b2', 'delivery_man'),
+            ('user=12a', 'user'),
+            (f'user={2 ** 64}', 'user'),
+            ('created_after=yesterday', 'created_after'),
+            ('created_after=2024-13-01', 'created_after'),
+            ('created_before=2024-02-30T10:00:00', 'created_before'),
+        ):
+            response = self.client.get('/api/v1/orders/', {query.split('=')[0]: query.split('=')[1]})
+            self.assertEqual(response.status_code, 400, query)
+            self.assertEqual(list(response.json()['data']), [param])
+
+    def test_cursor_pagination(self):
+        for _ in range(4):
+            create_order(self.customer)
+        # Ties on created_at are broken by id
+        Order.objects.exclude(pk=self.pending.pk).update(created_at=timezone.now())
+        expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        seen, url = [], '/api/v1/orders/?page_size=3'
+        while url:
+            data = self.client.get(url).json()['data']
+            seen.extend(row['id'] for row in data['results'])
+            url, previous = data['next'], data['previous']
+        self.assertEqual(seen, expected)
+
+        data = self.client.get(previous).json()['data']
+        self.assertEqual([row['id'] for row in data['results']], expected[3:6])
+        self.assertEqual(self.client.get('/api/v1/orders/?cursor=bm9wZQ').status_code, 400)
+
+
+class BatchUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.delivery_man = User.objects.create_user(username='courier', password='pass', role='delivery_man')
+        cls.other_courier = User.objects.create_user(username='other', password='pass', role='delivery_man')
+        cls.mine = create_order(cls.customer, delivery_man=cls.delivery_man, status='assigned')
+        cls.theirs = create_order(cls.customer, delivery_man=cls.other_courier, status='assigned')
+        cls.pending = create_order(cls.customer)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def put(self, user, url, items):
+        self.client.force_authenticate(user)
+        return self.client.put(url, {'items': items}, format='json')
+
+    def test_status_results_per_item(self):
+        response = self.put(self.delivery_man, '/api/v1/orders/batch/status/', [
+            {'order_id': self.mine.pk, 'status': 'delivered'},
+            {'order_id': self.theirs.pk, 'status': 'delivered'},
+            {'order_id': 999999, 'status': 'delivered'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual((data['updated'], data['failed']), (1, 2))
+        self.assertEqual([result['success'] for result in data['results']], [True, False, False])
+        self.assertIn("permission", data['results'][1]['error'])
+        self.assertEqual(data['results'][2]['error'], "Order not found")
+
+        self.assertEqual(Order.objects.get(pk=self.mine.pk).status, 'delivered')
+        self.assertEqual(Order.objects.get(pk=self.theirs.pk).status, 'assigned')
+        self.assertEqual(TrackingHistory.objects.filter(order=self.mine).count(), 1)
+        self.assertFalse(TrackingHistory.objects.filter(order=self.theirs).exists())
+
+    def test_status_permissions(self):
+        items = [{'order_id': self.theirs.pk, 'status': 'delivered'}]
+        self.assertEqual(self.put(self.customer, '/api/v1/orders/batch/status/', items).status_code, 403)
+        response = self.put(self.admin, '/api/v1/orders/batch/status/', items)
+        self.assertEqual(response.json()['data']['updated'], 1)
+        self.assertEqual(self.put(self.admin, '/api/v1/orders/batch/status/', []).status_code, 400)
+
+    def test_assign_results_per_item(self):
+        response = self.put(self.admin, '/api/v1/orders/batch/assign/', [
+            {'order_id': self.pending.pk, 'delivery_man_id': self.delivery_man.pk},
+            {'order_id': self.mine.pk, 'delivery_man_id': self.customer.pk},
+            {'order_id': 999999, 'delivery_man_id': self.delivery_man.pk},
+        ])
+        data = response.json()['data']
+        self.assertEqual((data['assigned'], data['failed']), (1, 2))
+        self.assertEqual(data['results'][1]['error'], f"Delivery man {self.customer.pk} not found")
+        self.assertEqual(data['results'][2]['error'], "Order not found")
+
+        pending = Order.objects.get(pk=self.pending.pk)
+        self.assertEqual((pending.delivery_man_id, pending.status), (self.delivery_man.pk, 'assigned'))
+        self.assertEqual(Order.objects.get(pk=self.mine.pk).delivery_man_id, self.delivery_man.pk)
+
+    def test_only_admins_assign(self):
+        items = [{'order_id': self.pending.pk, 'delivery_man_id': self.delivery_man.pk}]
+        for user in (self.customer, self.delivery_man):
+            self.assertEqual(self.put(user, '/api/v1/orders/batch/assign/', items).status_code, 403)
+
+            self.client.force_authenticate(user)
+            response = self.client.put(
+                f'/api/v1/orders/{self.pending.pk}/assign/', {'delivery_man_id': self.delivery_man.pk}, format='json'
+            )
+            self.assertEqual(response.status_code, 403)
+        self.assertIsNone(Order.objects.get(pk=self.pending.pk).delivery_man_id)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.put(
+            f'/api/v1/orders/{self.pending.pk}/assign/', {'delivery_man_id': self.delivery_man.pk}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.get(pk=self.pending.pk).status, 'assigned')
+
+
+class ReadSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = User.objects.create_user(username='customer', password='pass')
+        delivery_man = User.objects.create_user(username='courier', password='pass', role='delivery_man')
+        create_order(customer)
+        order = create_order(customer, delivery_man=delivery_man, status='assigned', package_weight='0.05')
+        TrackingHistory.objects.create(order=order, status='pending')
+        TrackingHistory.objects.create(order=order, status='assigned', location="Dhaka", notes="Picked up")
+
+    def test_order_read_serializer_matches_model_serializer(self):
+        orders = Order.objects.all()
+        expected = OrderSerializer(orders, many=True).data
+        self.assertEqual(OrderReadSerializer(OrderReadSerializer.values(orders)).data, expected)
+
+    def test_tracking_read_serializer_matches_model_serializer(self):
+        history = TrackingHistory.objects.all()
+        expected = TrackingHistorySerializer(history, many=True).data
+        self.assertEqual(TrackingHistoryReadSerializer(TrackingHistoryReadSerializer.values(history)).data, expected)
+
+    def test_fast_renderer_matches_json_renderer(self):
+        orders = Order.objects.all()
+        data = {
+            "orders": OrderSerializer(orders, many=True).data,
+            "raw": list(orders.values()),
+            "text": "Dhaka \u2028 \u09a2\u09be\u0995\u09be",
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(json.loads(FastJSONRenderer().render(data, 'application/json; indent=2')), json.loads(JSONRenderer().render(data)))
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        for _ in range(3):
+            create_order(cls.customer)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_compact_view(self):
+        with self.assertNumQueries(1) as queries:
+            response = self.client.get('/api/v1/orders/?view=compact')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['data']['results']
+        self.assertEqual(len(results), 3)
+        self.assertEqual(list(results[0]), list(OrderReadSerializer.views['compact']))
+        self.assertNotIn('package_description', queries.captured_queries[0]['sql'])
+
+    def test_fields_param_keeps_pagination_working(self):
+        response = self.client.get('/api/v1/orders/?fields=status,user&page_size=2')
+        data = response.json()['data']
+        self.assertEqual(data['results'][0], {'user': str(self.customer), 'status': 'pending'})
+
+        response = self.client.get(data['next'])
+        self.assertEqual(len(response.json()['data']['results']), 1)
+
+    def test_invalid_fields(self):
+        response = self.client.get('/api/v1/orders/?fields=status,password&view=tiny')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['data']), {'fields', 'view'})
+
+
+IMPORT_HEADER = b"pickup_address,delivery_address,recipient_name,recipient_phone,package_description,package_weight,delivery_cost\n"
+IMPORT_ROW = b"House 1,House 3,Recipient,01700000000,Documents,1.50,120.00\n"
+
+
+class OrderImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def upload(self, body, content_type='text/csv'):
+        return self.client.generic('POST', '/api/v1/orders/import/', body, content_type=content_type)
+
+    def test_valid_and_invalid_rows(self):
+        response = self.upload(IMPORT_HEADER + IMPORT_ROW + b"House 1,House 3,Recipient,01700000000,Documents,heavy,120.00\n" + IMPORT_ROW)
+        self.assertEqual(response.status_code, 201)
+        report = response.json()['data']
+        self.assertEqual((report['created'], report['failed']), (2, 1))
+        self.assertEqual(report['errors'][0]['row'], 3)
+        self.assertIn('package_weight', report['errors'][0]['errors'])
+        self.assertEqual(Order.objects.filter(user=self.customer).count(), 2)
+
+    def test_jsonl(self):
+        record = json.dumps({
+            'pickup_address': "House 1", 'delivery_address': "House 3", 'recipient_name': "Recipient",
+            'recipient_phone': "01700000000", 'package_description': "Documents",
+            'package_weight': '1.50', 'delivery_cost': '120.00',
+        }).encode()
+        response = self.upload(record + b"\n[]\n{oops\n", content_type='application/x-ndjson')
+        report = response.json()['data']
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3])
+
+    def test_bad_encoding(self):
+        response = self.upload(b"\xff\xfe" + IMPORT_HEADER)
+        self.assertEqual(response.status_code, 400)
+        report = response.json()['data']
+        self.assertEqual((report['created'], report['failed']), (0, 1))
+        self.assertIn("Unreadable file", report['errors'][0]['errors']['non_field_errors'][0])
+
+    def test_rows_before_bad_bytes_are_kept(self):
+        response = self.upload(IMPORT_HEADER + IMPORT_ROW + b"House \xff,House 3\n")
+        self.assertEqual(response.status_code, 201)
+        report = response.json()['data']
+        self.assertEqual((report['created'], report['failed']), (1, 1))
+        self.assertEqual(report['errors'][0]['row'], 3)
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.paid = create_order(cls.customer, status='assigned', is_paid=True)
+        cls.unpaid = create_order(cls.customer)
+        Payment.objects.create(
+            order=cls.paid, stripe_session_id='cs_test_1', amount='120.00', payment_status='paid'
+        )
+        TrackingHistory.objects.create(order=cls.paid, status='assigned', location="Dhaka")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/v1/orders/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_with_latest_payment_and_tracking(self):
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual([int(row['id']) for row in rows], [self.paid.pk, self.unpaid.pk])
+        self.assertEqual(
+            (rows[0]['payment_status'], rows[0]['payment_session_id'], rows[0]['tracking_location']),
+            ('paid', 'cs_test_1', 'Dhaka')
+        )
+        self.assertEqual(rows[1]['payment_status'], '')
+
+    def test_csv_neutralizes_formulas(self):
+        Order.objects.filter(pk=self.unpaid.pk).update(
+            recipient_name='=HYPERLINK("http://evil.example","x")', recipient_phone='+8801700000000',
+            package_description='@SUM(A1:A2)', delivery_address='-1+1',
+        )
+        row = list(csv.DictReader(io.StringIO(self.export())))[1]
+        self.assertEqual(row['recipient_name'], '\'=HYPERLINK("http://evil.example","x")')
+        self.assertEqual(row['recipient_phone'], "'+8801700000000")
+        self.assertEqual(row['package_description'], "'@SUM(A1:A2)")
+        self.assertEqual(row['delivery_address'], "'-1+1")
+        self.assertEqual(row['delivery_cost'], '120.00')
+
+        # JSON Lines is not opened by spreadsheets and stays as stored
+        line = json.loads(self.export('?file_format=jsonl&is_paid=false'))
+        self.assertEqual(line['recipient_phone'], '+8801700000000')
+
+    def test_jsonl_with_filters(self):
+        lines = self.export('?file_format=jsonl&is_paid=false').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.unpaid.pk])
+        self.assertEqual(self.export('?status=delivered'), ','.join(EXPORT_COLUMNS) + '\r\n')
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/v1/orders/export/?file_format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/orders/export/?created_after=2024-02-30').status_code, 400)
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/v1/orders/export/').status_code, 403)
+
+    def test_command_writes_to_stdout(self):
+        stdout = io.StringIO()
+        call_command('export_orders', '--format', 'jsonl', '--is-paid', 'true', stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.paid.pk])
+
+
+class TrackingStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.order = create_order(cls.customer, status='assigned')
+        cls.history = [TrackingHistory.objects.create(order=cls.order, status=step) for step in ('pending', 'assigned')]
+
+    def setUp(self):
+        self.token = str(AccessToken.for_user(self.customer))
+
+    async def stream(self, last_event_id=None):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        if last_event_id is not None:
+            headers['Last-Event-ID'] = str(last_event_id)
+        return await self.async_client.get(f'/api/v1/orders/{self.order.pk}/tracking/stream/', headers=headers)
+
+    def add_event(self, status):
+        # Published on commit, like a status change through the API
+        with self.captureOnCommitCallbacks(execute=True):
+            return TrackingHistory.objects.create(order=self.order, status=status)
+
+    async def read(self, content, count):
+        chunks = [(await anext(content)).decode() for _ in range(count)]
+        return [int(chunk.split('\n')[0].removeprefix('id: ')) for chunk in chunks]
+
+    async def test_backlog_then_live_events_until_delivered(self):
+        response = await self.stream()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        self.assertEqual(await self.read(content, 2), [entry.pk for entry in self.history])
+        self.assertEqual(get_broker().subscriber_count(tracking_channel(self.order.pk)), 1)
+
+        delivered = await sync_to_async(self.add_event)('delivered')
+        self.assertEqual(await self.read(content, 1), [delivered.pk])
+        with self.assertRaises(StopAsyncIteration):
+            await anext(content)
+        self.assertEqual(get_broker().subscriber_count(tracking_channel(self.order.pk)), 0)
+
+    async def test_reconnect_resumes_after_last_event_id(self):
+        delivered = await sync_to_async(self.add_event)('delivered')
+        response = await self.stream(last_event_id=self.history[0].pk)
+        content = aiter(response.streaming_content)
+        self.assertEqual(await self.read(content, 2), [self.history[1].pk, delivered.pk])
+        with self.assertRaises(StopAsyncIteration):
+            await anext(content)
+
+    async def test_slow_client_is_closed_and_resumes_from_the_backlog(self):
+        with mock.patch.object(get_broker(), 'max_queue_size', 1):
+            response = await self.stream()
+        content = aiter(response.streaming_content)
+        self.assertEqual(await self.read(content, 2), [entry.pk for entry in self.history])
+
+        # The second event finds the queue full and cuts the subscriber off
+        first = await sync_to_async(self.add_event)('assigned')
+        second = await sync_to_async(self.add_event)('assigned')
+        self.assertEqual(await self.read(content, 1), [first.pk])
+        with self.assertRaises(StopAsyncIteration):
+            await anext(content)
+        self.assertEqual(get_broker().subscriber_count(tracking_channel(self.order.pk)), 0)
+
+        response = await self.stream(last_event_id=first.pk)
+        content = aiter(response.streaming_content)
+        self.assertEqual(await self.read(content, 1), [second.pk])
+        await response.streaming_content.aclose()
+
+    async def ticket(self, order=None):
+        order = order or self.order
+        return await self.async_client.post(
+            f'/api/v1/orders/{order.pk}/tracking/stream/ticket/', headers={'Authorization': f'Bearer {self.token}'}
+        )
+
+    async def test_ticket_opens_the_stream_instead_of_the_jwt(self):
+        response = await self.ticket()
+        self.assertEqual(response.status_code, 200)
+        ticket = response.json()['data']['ticket']
+        url = f'/api/v1/orders/{self.order.pk}/tracking/stream/'
+
+        response = await self.async_client.get(url, {'ticket': ticket, 'last_event_id': self.history[-1].pk})
+        self.assertEqual(response.status_code, 200)
+        await response.streaming_content.aclose()
+
+        # The long-lived JWT is no longer accepted in the URL
+        response = await self.async_client.get(url, {'token': self.token})
+        self.assertEqual(response.status_code, 401)
+
+        other = await sync_to_async(create_order)(self.customer, status='assigned')
+        response = await self.async_client.get(f'/api/v1/orders/{other.pk}/tracking/stream/', {'ticket': ticket})
+        self.assertEqual(response.status_code, 401)
+
+        with override_settings(TRACKING_STREAM_TICKET_TTL=60), mock.patch('time.time', return_value=time.time() + 61):
+            response = await self.async_client.get(url, {'ticket': ticket})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_ticket_needs_permission_on_the_order(self):
+        stranger = await sync_to_async(User.objects.create_user)(username='stranger', password='pass')
+        other = await sync_to_async(create_order)(stranger)
+        self.assertEqual((await self.ticket(other)).status_code, 403)
+        response = await self.async_client.post(f'/api/v1/orders/{self.order.pk}/tracking/stream/ticket/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_only_watched_orders_are_serialized(self):
+        other = await sync_to_async(create_order)(self.customer, status='assigned')
+        subscription = get_broker().subscribe(tracking_channel(self.order.pk))
+        try:
+            with mock.patch('apps.orders.events.TrackingHistoryReadSerializer', wraps=TrackingHistoryReadSerializer) as serializer:
+                await sync_to_async(self.publish_batch)([other])
+                serializer.assert_not_called()
+                entries = await sync_to_async(self.publish_batch)([self.order, other])
+            serializer.assert_called_once()
+            data = await subscription.get(timeout=1)
+            self.assertEqual(data, await sync_to_async(lambda: TrackingHistorySerializer(entries[0]).data)())
+            self.assertTrue(subscription.queue.empty())
+        finally:
+            subscription.close()
+
+    def publish_batch(self, orders):
+        # Like update_statuses: bulk_create, then one publish for the batch
+        with self.captureOnCommitCallbacks(execute=True):
+            entries = TrackingHistory.objects.bulk_create(
+                [TrackingHistory(order=order, status='delivered') for order in orders]
+            )
+            publish_tracking_events(entries)
+        return entries
+
+    async def test_finished_order_closes_and_stops_reconnects(self):
+        await Order.objects.filter(pk=self.order.pk).aupdate(status='cancelled')
+        response = await self.stream()
+        content = aiter(response.streaming_content)
+        self.assertEqual(await self.read(content, 2), [entry.pk for entry in self.history])
+        with self.assertRaises(StopAsyncIteration):
+            await anext(content)
+
+        response = await self.stream(last_event_id=self.history[-1].pk)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(get_broker().subscriber_count(), 0)
+
+
+class AsyncOrderViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.other = User.objects.create_user(username='other', password='pass')
+        cls.order = create_order(cls.customer, status='assigned')
+        create_order(cls.other)
+        TrackingHistory.objects.create(order=cls.order, status='assigned')
+
+    def setUp(self):
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.customer)}'}
+
+    async def test_list_is_scoped_and_filtered(self):
+        response = await self.async_client.get('/api/v1/async/orders/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['data']['results']], [self.order.pk])
+
+        response = await self.async_client.get('/api/v1/async/orders/?status=lost', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get('/api/v1/async/orders/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_detail_permission(self):
+        other_order = await Order.objects.exclude(pk=self.order.pk).aget()
+        response = await self.async_client.get(f'/api/v1/async/orders/{other_order.pk}/', headers=self.headers)
+        self.assertEqual(response.status_code, 403)
+
+    async def test_tracking_not_modified(self):
+        url = f'/api/v1/async/orders/{self.order.pk}/tracking/'
+        first = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(first.status_code, 200)
+        # Same validator as the sync view
+        sync = await sync_to_async(self.sync_tracking)()
+        self.assertEqual(first['ETag'], sync['ETag'])
+
+        second = await self.async_client.get(url, headers={**self.headers, 'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+        await sync_to_async(TrackingHistory.objects.create)(order=self.order, status='delivered')
+        third = await self.async_client.get(url, headers={**self.headers, 'If-None-Match': first['ETag']})
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(len(third.json()['data']), 2)
+
+    def sync_tracking(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        return client.get(f'/api/v1/orders/{self.order.pk}/tracking/')
+
+
+@override_settings(ORDER_LIST_CACHE={
+    'BACKEND': 'apps.core.cache.DjangoCacheBackend', 'OPTIONS': {'alias': 'default'}, 'TTL': 300,
+})
+class OrderListCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.other = User.objects.create_user(username='other', password='pass')
+        cls.delivery_man = User.objects.create_user(username='courier', password='pass', role='delivery_man')
+        cls.order = create_order(cls.customer, delivery_man=cls.delivery_man, status='assigned')
+        create_order(cls.other)
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+
+    def list(self, user, query=''):
+        self.client.force_authenticate(user)
+        return self.client.get(f'/api/v1/orders/{query}').json()['data']['results']
+
+    def test_repeated_list_is_served_from_cache(self):
+        hits = get_order_list_cache().hits
+        with self.assertNumQueries(1):
+            first = self.list(self.customer)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.list(self.customer), first)
+        with self.assertNumQueries(1):
+            self.list(self.customer, '?status=delivered')
+        with self.assertNumQueries(1):
+            self.list(self.other)
+        self.assertEqual(get_order_list_cache().hits, hits + 1)
+
+    def test_writes_outside_the_request_invalidate_lists(self):
+        from apps.payments.webhooks import mark_orders_paid
+
+        self.assertFalse(self.list(self.customer)[0]['is_paid'])
+        self.list(self.other)
+        self.list(self.delivery_man)
+        # What the webhook worker does, in whichever process runs it
+        mark_orders_paid([{
+            'id': 'cs_1', 'amount_total': 12000, 'currency': 'usd',
+            'metadata': {'order_id': str(self.order.id)},
+        }])
+        self.assertTrue(self.list(self.customer)[0]['is_paid'])
+        self.assertTrue(self.list(self.delivery_man)[0]['is_paid'])
+        with self.assertNumQueries(0):
+            self.list(self.other)
+
+        self.client.force_authenticate(self.delivery_man)
+        self.client.put(f'/api/v1/orders/{self.order.pk}/status/', {'status': 'delivered'}, format='json')
+        self.assertEqual(self.list(self.customer)[0]['status'], 'delivered')
+
+    @override_settings(REPLICA_DATABASES=['replica_0'])
+    def test_pages_read_from_a_replica_are_not_stored(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.list(self.customer)
+        # Pinned to the primary after a write of their own
+        pin_to_primary(self.customer)
+        self.list(self.customer)
+        with self.assertNumQueries(0):
+            self.list(self.customer)
+
+    @override_settings(ORDER_LIST_CACHE={'BACKEND': None, 'OPTIONS': {}, 'TTL': 300})
+    def test_off_without_a_backend(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.list(self.customer)
+        self.assertEqual(get_order_list_cache().stats()['enabled'], False)
+
+
+class OrderStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.delivery_man = User.objects.create_user(username='courier', password='pass', role='delivery_man')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_incremental_stats_match_a_rebuild(self):
+        from apps.payments.webhooks import mark_orders_paid
+
+        # TestCase never commits; the stats deltas wait for the commit
+        with self.captureOnCommitCallbacks(execute=True):
+            orders = [create_order(self.customer, delivery_cost=cost) for cost in ('100.00', '50.00', '25.00', '10.00')]
+            self.client.put('/api/v1/orders/batch/assign/', {'items': [
+                {'order_id': order.id, 'delivery_man_id': self.delivery_man.id} for order in orders[:3]
+            ]}, format='json')
+            self.client.put('/api/v1/orders/batch/status/', {'items': [
+                {'order_id': orders[0].id, 'status': 'delivered'},
+            ]}, format='json')
+            self.client.put(f'/api/v1/orders/{orders[1].id}/status/', {'status': 'cancelled'}, format='json')
+            mark_orders_paid([{
+                'id': f'cs_{order.id}', 'amount_total': 100, 'currency': 'usd',
+                'metadata': {'order_id': str(order.id)},
+            } for order in orders[:2]])
+            orders[2].is_paid = True
+            orders[2].save()
+            self.client.delete(f'/api/v1/orders/{orders[2].id}/')
+
+        incremental = stats_summary()
+        self.assertEqual(incremental['totals'], {'orders': 3, 'paid_orders': 2, 'revenue': '150.00', 'paid_ratio': 0.6667})
+        self.assertEqual(incremental['by_courier'][0]['orders'], 2)
+        rebuild_stats()
+        self.assertEqual(stats_summary(), incremental)
+
+    def test_stale_instances_count_the_stored_row(self):
+        from apps.payments.webhooks import mark_orders_paid
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = create_order(self.customer)
+            stale = Order.objects.get(pk=order.pk)
+            mark_orders_paid([{
+                'id': 'cs_1', 'amount_total': 12000, 'currency': 'usd', 'metadata': {'order_id': str(order.id)},
+            }])
+            stale.delete()
+        totals = stats_summary()['totals']
+        self.assertEqual((totals['orders'], totals['paid_orders']), (0, 0))
+
+    def test_stats_api_reads_summary_tables_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(20):
+                create_order(self.customer, delivery_man=self.delivery_man, status='assigned')
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/v1/orders/stats/', {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(data['by_status'], [
+            {'status': 'assigned', 'orders': 20, 'paid_orders': 0, 'revenue': '0.00', 'paid_ratio': 0}
+        ])
+        self.assertEqual(len(data['by_day']), 1)
+        self.assertEqual(data['by_courier'][0]['username'], 'courier')
+
+        self.assertEqual(self.client.get('/api/v1/orders/stats/', {'days': 0}).status_code, 400)
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/v1/orders/stats/').status_code, 403)
+
+
+class OrderWriteTransactionTests(TransactionTestCase):
+    # Not TestCase: its wrapping transaction would hide whether save() opens one
+
+    def test_stats_signals_run_in_the_write_transaction(self):
+        customer = User.objects.create_user(username='customer', password='pass')
+        order = create_order(customer)
+        seen = []
+
+        def check(sender, **kwargs):
+            seen.append(connection.in_atomic_block)
+
+        signals = (pre_save, post_save, pre_delete, post_delete)
+        for signal in signals:
+            signal.connect(check, sender=Order)
+        try:
+            order.status = 'assigned'
+            order.save()
+            order.delete()
+        finally:
+            for signal in signals:
+                signal.disconnect(check, sender=Order)
+        self.assertEqual(seen, [True] * 4)
+        self.assertEqual(stats_summary()['totals']['orders'], 0)
+
+    def test_stats_rows_are_written_after_the_commit(self):
+        customer = User.objects.create_user(username='customer', password='pass')
+        stats_tables = {model._meta.db_table for model in (DailyOrderStats, StatusOrderStats, CourierOrderStats)}
+
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            create_order(customer)
+            order = create_order(customer)
+            order.status = 'cancelled'
+            order.save()
+            in_transaction = [query['sql'] for query in queries.captured_queries]
+        self.assertFalse([sql for sql in in_transaction if any(table in sql for table in stats_tables)])
+        self.assertEqual(stats_summary()['totals']['orders'], 2)
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            create_order(customer)
+            raise RuntimeError("rolled back")
+        self.assertEqual(stats_summary()['totals']['orders'], 2)
+
+    # SQLite's in-memory test database takes one writer at a time
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_writers_keep_the_stats_exact(self):
+        customer = User.objects.create_user(username='customer', password='pass')
+        courier = User.objects.create_user(username='courier', password='pass', role='delivery_man')
+
+        def write_orders():
+            try:
+                for _ in range(5):
+                    order = create_order(customer)
+                    order.status = 'assigned'
+                    order.delivery_man = courier
+                    order.save()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write_orders) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        incremental = stats_summary()
+        self.assertEqual(incremental['totals']['orders'], 20)
+        rebuild_stats()
+        self.assertEqual(stats_summary(), incremental)
+
+
+class OrderDetailConditionalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.order = create_order(cls.customer)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.url = f'/api/v1/orders/{self.order.pk}/'
+
+    def test_if_none_match(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        with mock.patch('apps.orders.views.OrderSerializer') as serializer:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+        serializer.assert_not_called()
+
+        # Any change to the order makes the old ETag stale
+        order = Order.objects.get(pk=self.order.pk)
+        order.recipient_name = "Someone else"
+        order.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_if_modified_since(self):
+        first = self.client.get(self.url)
+        with mock.patch('apps.orders.views.OrderSerializer') as serializer:
+            response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        serializer.assert_not_called()
+
+        earlier = http_date((self.order.updated_at - timedelta(minutes=1)).timestamp())
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=earlier).status_code, 200)
+
+
+class PlanAssignmentsTests(SimpleTestCase):
+    def test_least_loaded_courier_with_capacity(self):
+        # Courier 3 is full; ties go to the lower id
+        couriers = [(2, 1, 3), (1, 0, 2), (3, 5, 5)]
+        self.assertEqual(
+            plan_assignments([10, 11, 12, 13, 14], couriers),
+            [(10, 1), (11, 1), (12, 2), (13, 2)]
+        )
+
+    def test_balances_load(self):
+        plan = plan_assignments(range(9), [(1, 0, 10), (2, 3, 10), (3, 0, 10)])
+        loads = {1: 0, 2: 3, 3: 0}
+        for _, courier_id in plan:
+            loads[courier_id] += 1
+        self.assertEqual(loads, {1: 4, 2: 4, 3: 4})
+
+    def test_no_capacity(self):
+        self.assertEqual(plan_assignments([1, 2], [(1, 2, 2)]), [])
+        self.assertEqual(plan_assignments([1, 2], []), [])
+
+
+@override_settings(DISPATCH_DEFAULT_CAPACITY=2, DISPATCH_BATCH_SIZE=2)
+class DispatchOrdersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.busy = User.objects.create_user(username='busy', password='pass', role='delivery_man', delivery_capacity=1)
+        cls.free = User.objects.create_user(username='free', password='pass', role='delivery_man')
+        create_order(cls.customer, delivery_man=cls.busy, status='assigned')
+        cls.unpaid = create_order(cls.customer)
+        cls.paid = [create_order(cls.customer, is_paid=True) for _ in range(3)]
+
+    def test_dry_run_changes_nothing(self):
+        self.assertEqual(dispatch_orders(dry_run=True), 2)
+        self.assertFalse(Order.objects.filter(pk__in=[order.pk for order in self.paid], delivery_man__isnull=False).exists())
+
+    def test_assigns_oldest_paid_orders_within_capacity(self):
+        self.assertEqual(dispatch_orders(), 2)
+        assigned = dict(Order.objects.filter(delivery_man=self.free).values_list('id', 'status'))
+        self.assertEqual(assigned, {self.paid[0].pk: 'assigned', self.paid[1].pk: 'assigned'})
+        self.assertIsNone(Order.objects.get(pk=self.unpaid.pk).delivery_man_id)
+        self.assertEqual(TrackingHistory.objects.filter(order_id__in=assigned).count(), 2)
+        # Everyone is full now
+        self.assertEqual(dispatch_orders(), 0)
+
+
+class TrackingArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        long_ago = timezone.now() - timedelta(days=120)
+        cls.old = create_order(cls.customer, status='delivered')
+        cls.recent = create_order(cls.customer, status='delivered')
+        for order in (cls.old, cls.recent):
+            for index, step in enumerate(('pending', 'assigned', 'delivered')):
+                TrackingHistory.objects.create(order=order, status=step, location=f"Hub {index}", notes=None)
+        for minutes, entry in enumerate(TrackingHistory.objects.filter(order=cls.old).order_by('id')):
+            TrackingHistory.objects.filter(pk=entry.pk).update(created_at=long_ago + timedelta(minutes=minutes))
+        Order.objects.filter(pk=cls.old.pk).update(updated_at=long_ago)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def tracking(self, order, **headers):
+        return self.client.get(f'/api/v1/orders/{order.pk}/tracking/', **headers)
+
+    def test_archived_history_reads_the_same(self):
+        before = self.tracking(self.old)
+
+        self.assertEqual(archive_tracking(days=90), {'orders': 1, 'events': 3})
+        self.assertFalse(TrackingHistory.objects.filter(order=self.old).exists())
+        self.assertEqual(TrackingHistory.objects.filter(order=self.recent).count(), 3)
+        archive = TrackingArchive.objects.get(order=self.old)
+        self.assertEqual((archive.event_count, archive.last_status, archive.last_location), (3, 'delivered', 'Hub 2'))
+
+        after = self.tracking(self.old)
+        self.assertEqual(after.json(), before.json())
+        self.assertEqual(after['ETag'], before['ETag'])
+        self.assertEqual(self.tracking(self.old, HTTP_IF_NONE_MATCH=before['ETag']).status_code, 304)
+
+    def test_rows_added_after_archiving_are_merged(self):
+        archive_tracking(days=90)
+        TrackingHistory.objects.create(order=self.old, status='delivered', notes="Corrected via admin panel")
+        data = self.tracking(self.old).json()['data']
+        self.assertEqual([row['notes'] for row in data][:1], ["Corrected via admin panel"])
+        self.assertEqual(len(data), 4)
+
+        Order.objects.filter(pk=self.old.pk).update(updated_at=timezone.now() - timedelta(days=120))
+        self.assertEqual(archive_tracking(days=90), {'orders': 1, 'events': 1})
+        self.assertEqual(TrackingArchive.objects.get(order=self.old).event_count, 4)
+        self.assertEqual(self.tracking(self.old).json()['data'], data)
+
+    def test_history_is_deleted_in_batches_without_signals(self):
+        deleted = []
+        receiver = lambda instance, **kwargs: deleted.append(instance.pk)
+        post_delete.connect(receiver, sender=TrackingHistory)
+        try:
+            with mock.patch('apps.orders.archive.DELETE_BATCH_SIZE', 2):
+                self.assertEqual(archive_tracking(days=90), {'orders': 1, 'events': 3})
+        finally:
+            post_delete.disconnect(receiver, sender=TrackingHistory)
+        self.assertEqual(deleted, [])
+        self.assertFalse(TrackingHistory.objects.filter(order=self.old).exists())
@@ -1,14 +1,24 @@
 from django.urls import path
 from .views import (
     OrderListCreateView, OrderDetailView, OrderStatusUpdateView,
-    AssignDeliveryManView, OrderTrackingView
+    AssignDeliveryManView, OrderTrackingView, OrderTrackingStreamTicketView, OrderImportView, OrderExportView,
+    BatchStatusUpdateView, BatchAssignDeliveryManView, OrderListCacheStatsView, OrderStatsView
 )
+from .streams import order_tracking_stream
 
 urlpatterns = [
     path('', OrderListCreateView.as_view(), name='order-list-create'),
+    path('import/', OrderImportView.as_view(), name='order-import'),
+    path('export/', OrderExportView.as_view(), name='order-export'),
+    path('batch/status/', BatchStatusUpdateView.as_view(), name='order-batch-status'),
+    path('batch/assign/', BatchAssignDeliveryManView.as_view(), name='order-batch-assign'),
+    path('cache/stats/', OrderListCacheStatsView.as_view(), name='order-list-cache-stats'),
+    path('stats/', OrderStatsView.as_view(), name='order-stats'),
     path('<int:pk>/', OrderDetailView.as_view(), name='order-detail'),
     path('<int:pk>/status/', OrderStatusUpdateView.as_view(), name='order-status-update'),
     path('<int:pk>/assign/', AssignDeliveryManView.as_view(), name='assign-delivery-man'),
     path('<int:pk>/tracking/', OrderTrackingView.as_view(), name='order-tracking'),
+    path('<int:pk>/tracking/stream/', order_tracking_stream, name='order-tracking-stream'),
+    path('<int:pk>/tracking/stream/ticket/', OrderTrackingStreamTicketView.as_view(), name='order-tracking-stream-ticket'),
     
 ]
\ No newline at end of file
@@ -1,12 +1,60 @@
 from rest_framework import status
 from apps.core.base import BaseAPIView
+from apps.core.conditional import make_etag, not_modified, set_validators
+from apps.core.idempotency import idempotent
+from apps.core.pagination import KeysetPagination, InvalidCursor
+from .archive import get_archive, merge_rows, merge_summary
+from .cache import get_order_list_cache
+from .exporters import EXPORT_FORMATS, export_queryset, iter_export
+from .filters import filter_orders
+from .importers import IMPORT_FORMATS, detect_format, import_orders, iter_records
 from .models import Order, TrackingHistory
 from .serializers import (
     OrderSerializer, OrderCreateSerializer, OrderStatusUpdateSerializer,
-    AssignDeliveryManSerializer, TrackingHistorySerializer
+    AssignDeliveryManSerializer,
+    BatchStatusUpdateSerializer, BatchAssignSerializer,
+    OrderReadSerializer, TrackingHistoryReadSerializer
 )
-import stripe
-from django.contrib.sites.shortcuts import get_current_site
+from .services import assign_delivery_men, update_statuses
+from .stats import stats_summary
+from .streams import can_view_order, issue_stream_ticket
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.urls import reverse
+from apps.payments.gateway import build_checkout_urls
+from apps.payments.outbox import enqueue_checkout_session
+
+
+# Shared with the async views in async_views.py
+
+def scope_orders(orders, user):
+    if user.role == 'delivery_man':
+        return orders.filter(delivery_man=user)
+    if user.role != 'admin':  # user
+        return orders.filter(user=user)
+    return orders
+
+
+def filter_order_list(user, params):
+    """Return the user's orders filtered by `params`, the requested fields and any errors."""
+    orders, errors = filter_orders(scope_orders(Order.objects.all(), user), params)
+    fields, field_errors = OrderReadSerializer.parse_fields(params)
+    errors.update(field_errors)
+    return orders, fields, errors
+
+
+def order_etag(order):
+    return make_etag('order', order.pk, order.updated_at.isoformat(), order.user_id, order.delivery_man_id)
+
+
+def tracking_etag(order, summary):
+    # Tracking rows are append-only, so the newest timestamp and the row
+    # count change whenever the history does
+    last_modified = summary['last_modified']
+    return make_etag('tracking', order.pk, last_modified.isoformat() if last_modified else '', summary['count'])
 
 
 class OrderListCreateView(BaseAPIView):
@@ -19,19 +67,44 @@ class OrderListCreateView(BaseAPIView):
             
         user = request.user
         
-        if user.role == 'admin':
-            orders = Order.objects.all()
-        elif user.role == 'delivery_man':
-            orders = Order.objects.filter(delivery_man=user)
-        else:  # user
-            orders = Order.objects.filter(user=user)
+        cache = get_order_list_cache()
+        cache_key = cache.make_key(request)
+        data = cache.get(cache_key)
+        if data is not None:
+            return self.success_response(
+                message="Orders retrieved successfully", 
+                data=data
+            )
+        
+        orders, fields, errors = filter_order_list(user, request.query_params)
+        if errors:
+            return self.error_response(
+                message="Invalid filters", 
+                data=errors, 
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
         
-        serializer = OrderSerializer(orders, many=True)
+        paginator = KeysetPagination()
+        try:
+            # Cursor positions need id and created_at even when not returned
+            rows = OrderReadSerializer.values(orders, fields, extra=('id', 'created_at'))
+            page = paginator.paginate_queryset(rows, request)
+        except InvalidCursor as e:
+            return self.error_response(
+                message="Invalid cursor", 
+                data={"error": str(e)}, 
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        
+        serializer = OrderReadSerializer(page, fields)
+        data = paginator.get_paginated_data(serializer.data)
+        cache.set(cache_key, data)
         return self.success_response(
             message="Orders retrieved successfully", 
-            data=serializer.data
+            data=data
         )
     
+    @idempotent('orders:create')
     def post(self, request):
         if not request.user.is_authenticated:
             return self.error_response(
@@ -48,49 +121,28 @@ class OrderListCreateView(BaseAPIView):
 
         serializer = OrderCreateSerializer(data=request.data)
         if serializer.is_valid():
-            order = serializer.save(user=request.user)
-            response_serializer = OrderSerializer(order)
-
             customer_email = (
                 request.data.get("email")
                 or getattr(request.user, "email", None)
                 or "test@example.com"
             )
-            try:
-                current_site = get_current_site(request)
-                protocol = 'https' if request.is_secure() else 'http'
-            
-                checkout_session = stripe.checkout.Session.create(
-                    payment_method_types=['card'],
-                    line_items=[{
-                        'price_data': {
-                            'currency': 'usd',
-                            'product_data': {
-                                'name': f"Order #{order.id}",
-                            },
-                            'unit_amount': int(order.delivery_cost * 100),  # cents
-                        },
-                        'quantity': 1,
-                    }],
-                    mode='payment',
-                    success_url = f"{protocol}://{current_site.domain}/api/v1/payments/payment-success?session_id={{CHECKOUT_SESSION_ID}}&order_id={order.id}",
-                    cancel_url = f"{protocol}://{current_site.domain}/api/v1/payments/payment-cancel?order_id={order.id}",
-                    customer_email=customer_email,
-                    metadata={
-                        'order_id': order.id,
-                        'user_id': request.user.id
-                    }
-                )
-                checkout_url = checkout_session.url
-            except Exception as e:
-                checkout_url = None  
+
+            # The checkout session is created by the outbox worker, so the
+            # client never waits on Stripe here
+            with transaction.atomic():
+                order = serializer.save(user=request.user)
+                success_url, cancel_url = build_checkout_urls(request, order)
+                checkout = enqueue_checkout_session(order, customer_email, success_url, cancel_url)
+            response_serializer = OrderSerializer(order)
 
             return self.success_response(
                 message="Order created successfully",
                 data={
                     "order": response_serializer.data,
-                     "checkout_url": checkout_session.url,
-                    "session_id": checkout_session.id,
+                    "checkout_status": checkout.status,
+                    "checkout_status_url": request.build_absolute_uri(
+                        reverse('checkout-status', args=[order.id])
+                    ),
                     "email": customer_email
                 },
                 status_code=status.HTTP_201_CREATED
@@ -106,7 +158,7 @@ class OrderListCreateView(BaseAPIView):
 class OrderDetailView(BaseAPIView):
     def get_object(self, pk):
         try:
-            return Order.objects.get(pk=pk)
+            return Order.objects.select_related('user', 'delivery_man').get(pk=pk)
         except Order.DoesNotExist:
             return None
     
@@ -125,20 +177,24 @@ class OrderDetailView(BaseAPIView):
             )
         
         # Check permissions
-        if not (request.user.role == 'admin' or 
-                (request.user.role == 'delivery_man' and order.delivery_man == request.user) or
-                (request.user.role == 'user' and order.user == request.user)):
+        if not can_view_order(request.user, order):
             return self.error_response(
                 message="Permission denied", 
                 data={"error": "You don't have permission to view this order"}, 
                 status_code=status.HTTP_403_FORBIDDEN
             )
         
+        etag = order_etag(order)
+        response = not_modified(request, etag=etag, last_modified=order.updated_at)
+        if response is not None:
+            return response
+        
         serializer = OrderSerializer(order)
-        return self.success_response(
+        response = self.success_response(
             message="Order retrieved successfully", 
             data=serializer.data
         )
+        return set_validators(response, etag=etag, last_modified=order.updated_at)
     
     def put(self, request, pk):
         if not request.user.is_authenticated:
@@ -207,7 +263,7 @@ class OrderDetailView(BaseAPIView):
 class OrderStatusUpdateView(BaseAPIView):
     def get_object(self, pk):
         try:
-            return Order.objects.get(pk=pk)
+            return Order.objects.select_related('user', 'delivery_man').get(pk=pk)
         except Order.DoesNotExist:
             return None
     
@@ -261,7 +317,7 @@ class OrderStatusUpdateView(BaseAPIView):
 class AssignDeliveryManView(BaseAPIView):
     def get_object(self, pk):
         try:
-            return Order.objects.get(pk=pk)
+            return Order.objects.select_related('user', 'delivery_man').get(pk=pk)
         except Order.DoesNotExist:
             return None
     
@@ -280,7 +336,7 @@ class AssignDeliveryManView(BaseAPIView):
             )
         
         # Only admin can assign delivery men
-        if not request.user.role != 'admin':
+        if request.user.role != 'admin':
             return self.error_response(
                 message="Permission denied", 
                 data={"error": "Only administrators can assign delivery personnel"}, 
@@ -324,7 +380,7 @@ class OrderTrackingView(BaseAPIView):
             )
             
         try:
-            order = Order.objects.get(pk=pk)
+            order = Order.objects.select_related('user', 'delivery_man', 'tracking_archive').get(pk=pk)
         except Order.DoesNotExist:
             return self.error_response(
                 message="Order not found", 
@@ -332,18 +388,279 @@ class OrderTrackingView(BaseAPIView):
             )
         
         # Check permissions
-        if not (request.user.role == 'admin' or 
-                (request.user.role == 'delivery_man' and order.delivery_man == request.user) or
-                (request.user.role == 'user' and order.user == request.user)):
+        if not can_view_order(request.user, order):
             return self.error_response(
                 message="Permission denied", 
                 data={"error": "You don't have permission to view tracking information for this order"}, 
                 status_code=status.HTTP_403_FORBIDDEN
             )
         
-        tracking_history = order.tracking_history.all()
-        serializer = TrackingHistorySerializer(tracking_history, many=True)
-        return self.success_response(
+        # Archived history counts too, so archiving keeps the ETag stable
+        archive = get_archive(order)
+        summary = merge_summary(
+            order.tracking_history.aggregate(last_modified=Max('created_at'), count=Count('id')), archive
+        )
+        last_modified = summary['last_modified']
+        etag = tracking_etag(order, summary)
+        response = not_modified(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+        
+        tracking_history = TrackingHistoryReadSerializer.values(order.tracking_history.all())
+        serializer = TrackingHistoryReadSerializer(merge_rows(tracking_history, archive))
+        response = self.success_response(
             message="Tracking history retrieved successfully", 
             data=serializer.data
-        )
\ No newline at end of file
+        )
+        return set_validators(response, etag=etag, last_modified=last_modified)
+
+
+class OrderTrackingStreamTicketView(BaseAPIView):
+    def post(self, request, pk):
+        if not request.user.is_authenticated:
+            return self.error_response(
+                message="Authentication required",
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+
+        try:
+            order = Order.objects.get(pk=pk)
+        except Order.DoesNotExist:
+            return self.error_response(
+                message="Order not found",
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+
+        if not can_view_order(request.user, order):
+            return self.error_response(
+                message="Permission denied",
+                data={"error": "You don't have permission to view tracking information for this order"},
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+
+        return self.success_response(
+            message="Stream ticket issued",
+            data={
+                "ticket": issue_stream_ticket(request.user, order),
+                "expires_in": settings.TRACKING_STREAM_TICKET_TTL,
+            }
+        )
+
+
+class OrderImportView(BaseAPIView):
+    def post(self, request):
+        if not request.user.is_authenticated:
+            return self.error_response(
+                message="Authentication required", 
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+
+        if request.user.role == 'delivery_man':
+            return self.error_response(
+                message="Order import failed", 
+                data={"error": "Only regular users can create orders."},
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+
+        # Either a multipart upload in "file" or the raw file as the body
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return self.error_response(
+                    message="Order import failed", 
+                    data={"error": "Upload the file in the 'file' field"},
+                    status_code=status.HTTP_400_BAD_REQUEST
+                )
+            stream = upload
+            file_format = detect_format(upload.name, upload.content_type)
+        else:
+            stream = request.stream
+            file_format = detect_format(content_type=request.content_type)
+        file_format = request.query_params.get('file_format', file_format)
+
+        if file_format not in IMPORT_FORMATS or stream is None:
+            return self.error_response(
+                message="Order import failed", 
+                data={"error": "Send a CSV or JSONL file (text/csv or application/x-ndjson)"},
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        report = import_orders(iter_records(stream, file_format), request.user)
+        if report["created"] == 0:
+            return self.error_response(
+                message="Order import failed", 
+                data=report,
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        return self.success_response(
+            message="Orders imported successfully", 
+            data=report,
+            status_code=status.HTTP_201_CREATED
+        )
+
+
+class OrderExportView(BaseAPIView):
+    CONTENT_TYPES = {
+        'csv': 'text/csv',
+        'jsonl': 'application/x-ndjson',
+    }
+
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return self.error_response(
+                message="Authentication required", 
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+
+        if request.user.role != 'admin':
+            return self.error_response(
+                message="Permission denied", 
+                data={"error": "Only administrators can export orders"}, 
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return self.error_response(
+                message="Invalid export format", 
+                data={"file_format": f"Must be one of: {', '.join(EXPORT_FORMATS)}"}, 
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        orders, errors = export_queryset(request.query_params)
+        if errors:
+            return self.error_response(
+                message="Invalid filters", 
+                data=errors, 
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        filename = f"orders-{timezone.now():%Y%m%d-%H%M%S}.{file_format}"
+        response = StreamingHttpResponse(iter_export(orders, file_format), content_type=self.CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class BatchStatusUpdateView(BaseAPIView):
+    def put(self, request):
+        if not request.user.is_authenticated:
+            return self.error_response(
+                message="Authentication required", 
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+
+        if request.user.role not in ('admin', 'delivery_man'):
+            return self.error_response(
+                message="Permission denied", 
+                data={"error": "Only administrators and delivery personnel can update order status"}, 
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+
+        serializer = BatchStatusUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return self.error_response(
+                message="Batch status update failed", 
+                data=serializer.errors, 
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = update_statuses(request.user, serializer.validated_data['items'])
+        updated = sum(1 for result in results if result['success'])
+        return self.success_response(
+            message=f"{updated} of {len(results)} orders updated", 
+            data={"updated": updated, "failed": len(results) - updated, "results": results}
+        )
+
+
+class BatchAssignDeliveryManView(BaseAPIView):
+    def put(self, request):
+        if not request.user.is_authenticated:
+            return self.error_response(
+                message="Authentication required", 
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+
+        if request.user.role != 'admin':
+            return self.error_response(
+                message="Permission denied", 
+                data={"error": "Only administrators can assign delivery personnel"}, 
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+
+        serializer = BatchAssignSerializer(data=request.data)
+        if not serializer.is_valid():
+            return self.error_response(
+                message="Batch assignment failed", 
+                data=serializer.errors, 
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = assign_delivery_men(serializer.validated_data['items'])
+        assigned = sum(1 for result in results if result['success'])
+        return self.success_response(
+            message=f"{assigned} of {len(results)} orders assigned", 
+            data={"assigned": assigned, "failed": len(results) - assigned, "results": results}
+        )
+
+
+class OrderListCacheStatsView(BaseAPIView):
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return self.error_response(
+                message="Authentication required", 
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+
+        if request.user.role != 'admin':
+            return self.error_response(
+                message="Permission denied", 
+                data={"error": "Only administrators can view cache statistics"}, 
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+
+        return self.success_response(
+            message="Cache statistics retrieved successfully", 
+            data=get_order_list_cache().stats()
+        )
+
+
+class OrderStatsView(BaseAPIView):
+    MAX_DAYS = 366
+    MAX_COURIERS = 100
+
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return self.error_response(
+                message="Authentication required",
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+
+        if request.user.role != 'admin':
+            return self.error_response(
+                message="Permission denied",
+                data={"error": "Only administrators can view order statistics"},
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+
+        errors = {}
+        limits = {}
+        for param, default, maximum in (('days', 30, self.MAX_DAYS), ('couriers', 20, self.MAX_COURIERS)):
+            value = request.query_params.get(param, default)
+            try:
+                limits[param] = int(value)
+                if not 1 <= limits[param] <= maximum:
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors[param] = f"Must be an integer between 1 and {maximum}"
+        if errors:
+            return self.error_response(
+                message="Invalid parameters",
+                data=errors,
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        return self.success_response(
+            message="Order statistics retrieved successfully",
+            data=stats_summary(**limits)
+        )
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path('create-checkout-session/<int:order_id>/', async_views.create_checkout_session, name='async-create-checkout-session'),
+    path('confirm-payment/<int:order_id>/', async_views.confirm_payment, name='async-confirm-payment'),
+    path('checkout-status/<int:order_id>/', async_views.checkout_status, name='async-checkout-status'),
+]
@@ -0,0 +1,188 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+
+from apps.core.base import json_error_response, json_success_response
+from apps.orders.async_views import authenticate
+from apps.orders.models import Order
+from .gateway import build_checkout_params, build_checkout_urls, get_gateway
+from .models import CheckoutSession
+from .outbox import aprocess_checkout_session
+from .views import (
+    checkout_data, checkout_fields, checkout_status_data, confirmation_error, should_open_pending, status_orders
+)
+from .webhooks import mark_orders_paid
+
+# ASGI-native twins of the payment views, served under /api/v1/async/payments/.
+# Stripe calls go through the gateway's async methods, so a worker keeps
+# serving other requests while Stripe responds.
+
+
+def read_json(request):
+    if not request.body:
+        return {}
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@csrf_exempt
+@require_POST
+async def create_checkout_session(request, order_id):
+    user = await authenticate(request)
+    if user is None:
+        return json_error_response(
+            message="Authentication required",
+            status_code=status.HTTP_401_UNAUTHORIZED
+        )
+
+    order = await Order.objects.filter(id=order_id, user=user).afirst()
+    if order is None:
+        return json_error_response(
+            message="Order not found",
+            status_code=status.HTTP_404_NOT_FOUND
+        )
+
+    if order.is_paid:
+        return json_error_response(
+            message="Order already paid",
+            status_code=status.HTTP_409_CONFLICT
+        )
+
+    data = read_json(request)
+    if data is None:
+        return json_error_response(
+            message="Invalid JSON body",
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+    customer_email = data.get("email") or user.email
+
+    checkout = await order.checkout_sessions.afirst()
+    if (
+        checkout is not None and checkout.status == 'pending'
+        and await sync_to_async(should_open_pending)(checkout, order, customer_email)
+    ):
+        checkout.order = order
+        checkout = await aprocess_checkout_session(checkout)
+        if checkout.status != 'open':
+            return json_error_response(
+                message="Failed to create checkout session",
+                data={"error": checkout.last_error},
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return json_success_response(
+            message="Checkout session created",
+            data=checkout_data(checkout)
+        )
+    if checkout is not None and checkout.is_reusable(customer_email, order.delivery_cost):
+        return json_success_response(
+            message="Checkout session retrieved",
+            data=checkout_data(checkout)
+        )
+
+    # Retries with the same Idempotency-Key get the same Stripe session back
+    key = request.headers.get('Idempotency-Key')
+    idempotency_key = f"checkout:{order.id}:{user.id}:{key}" if key else None
+
+    try:
+        success_url, cancel_url = build_checkout_urls(request, order)
+        checkout_session = await get_gateway().acreate_checkout_session(
+            idempotency_key=idempotency_key,
+            **build_checkout_params(order, customer_email, success_url, cancel_url)
+        )
+        # A retried key gets the same session back, so update its row
+        fields = checkout_fields(checkout_session, order, customer_email, success_url, cancel_url)
+        checkout, _ = await CheckoutSession.objects.aupdate_or_create(
+            stripe_session_id=fields.pop('stripe_session_id'),
+            defaults={'order': order, **fields}
+        )
+    except Exception as e:
+        return json_error_response(
+            message="Failed to create checkout session",
+            data={"error": str(e)},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    return json_success_response(
+        message="Checkout session created",
+        data=checkout_data(checkout)
+    )
+
+
+@csrf_exempt
+@require_POST
+async def confirm_payment(request, order_id):
+    user = await authenticate(request)
+    if user is None:
+        return json_error_response(
+            message="Authentication required",
+            status_code=status.HTTP_401_UNAUTHORIZED
+        )
+
+    order = await Order.objects.filter(id=order_id, user=user).afirst()
+    if order is None:
+        return json_error_response(
+            message="Order not found",
+            status_code=status.HTTP_404_NOT_FOUND
+        )
+
+    data = read_json(request)
+    session_id = data.get("session_id") if data else None
+    if not session_id:
+        return json_error_response(
+            message="Session ID required",
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        session = await get_gateway().aretrieve_checkout_session(session_id)
+        error = confirmation_error(order, session)
+        if error is not None:
+            message, data, status_code = error
+            return json_error_response(message=message, data=data, status_code=status_code)
+        await sync_to_async(mark_orders_paid)([session])
+    except Exception as e:
+        return json_error_response(
+            message="Payment confirmation failed",
+            data={"error": str(e)},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    return json_success_response(
+        message="Payment confirmed successfully",
+        data={"order_id": order.id, "paid": True}
+    )
+
+
+@require_GET
+async def checkout_status(request, order_id):
+    user = await authenticate(request)
+    if user is None:
+        return json_error_response(
+            message="Authentication required",
+            status_code=status.HTTP_401_UNAUTHORIZED
+        )
+
+    order = await status_orders(user).filter(id=order_id).afirst()
+    if order is None:
+        return json_error_response(
+            message="Order not found",
+            status_code=status.HTTP_404_NOT_FOUND
+        )
+
+    checkout = await order.checkout_sessions.afirst()
+    if checkout is None:
+        return json_error_response(
+            message="No checkout session for this order",
+            status_code=status.HTTP_404_NOT_FOUND
+        )
+
+    return json_success_response(
+        message="Checkout status retrieved successfully",
+        data=checkout_status_data(order, checkout)
+    )
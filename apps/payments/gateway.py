@@ -0,0 +1,224 @@
+import asyncio
+import itertools
+import threading
+import time
+from datetime import datetime, timezone
+
+import stripe
+from django.conf import settings
+from django.contrib.sites.shortcuts import get_current_site
+from django.utils.module_loading import import_string
+from apps.core.metrics import timed
+
+
+class StripeGateway:
+    """Thin wrapper around the Stripe SDK so the backend can be swapped out."""
+
+    def __init__(self):
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+
+    @timed('stripe')
+    def create_checkout_session(self, idempotency_key=None, **params):
+        return stripe.checkout.Session.create(idempotency_key=idempotency_key, **params)
+
+    @timed('stripe')
+    def retrieve_checkout_session(self, session_id):
+        return stripe.checkout.Session.retrieve(session_id)
+
+    @timed('stripe')
+    def list_checkout_sessions(self, created_gte, created_lt, starting_after=None, limit=100):
+        # One page, newest first; pass the last id back as starting_after
+        params = {'created': {'gte': created_gte, 'lt': created_lt}, 'limit': limit}
+        if starting_after:
+            params['starting_after'] = starting_after
+        return stripe.checkout.Session.list(**params)
+
+    # Async variants go through the SDK's async HTTP client (httpx), so an
+    # ASGI worker can wait on many Stripe calls at once
+    async def acreate_checkout_session(self, idempotency_key=None, **params):
+        with timed('stripe'):
+            return await stripe.checkout.Session.create_async(idempotency_key=idempotency_key, **params)
+
+    async def aretrieve_checkout_session(self, session_id):
+        with timed('stripe'):
+            return await stripe.checkout.Session.retrieve_async(session_id)
+
+
+class FakeStripeGateway:
+    """
+    In-memory Stripe stand-in for local development and tests.
+
+    Sessions live in a class level dict so every instance sees the same
+    state. `fail_next` makes the next calls raise, `latency` adds a delay
+    to every call.
+    """
+    sessions = {}
+    idempotency_keys = {}
+    failures = 0
+    latency = 0
+    _counter = itertools.count(1)
+    _lock = threading.Lock()
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.sessions = {}
+            cls.idempotency_keys = {}
+            cls.failures = 0
+            cls.latency = 0
+
+    @classmethod
+    def fail_next(cls, count=1):
+        cls.failures = count
+
+    @classmethod
+    def mark_paid(cls, session_id):
+        session = cls.sessions[session_id]
+        session['payment_status'] = 'paid'
+        session['status'] = 'complete'
+        return cls._construct(session)
+
+    @classmethod
+    def expire(cls, session_id):
+        cls.sessions[session_id]['status'] = 'expired'
+        return cls._construct(cls.sessions[session_id])
+
+    @staticmethod
+    def _construct(values):
+        return stripe.checkout.Session.construct_from(dict(values), 'sk_test_fake')
+
+    def _maybe_fail(self):
+        if self.latency:
+            time.sleep(self.latency)
+        self._check_failure()
+
+    async def _amaybe_fail(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._check_failure()
+
+    def _check_failure(self):
+        cls = type(self)
+        with cls._lock:
+            if cls.failures:
+                cls.failures -= 1
+                raise stripe.error.APIConnectionError("Simulated Stripe outage")
+
+    @timed('stripe')
+    def create_checkout_session(self, idempotency_key=None, **params):
+        self._maybe_fail()
+        return self._create(idempotency_key, params)
+
+    @timed('stripe')
+    def retrieve_checkout_session(self, session_id):
+        self._maybe_fail()
+        return self._retrieve(session_id)
+
+    @timed('stripe')
+    def list_checkout_sessions(self, created_gte, created_lt, starting_after=None, limit=100):
+        self._maybe_fail()
+        cls = type(self)
+        with cls._lock:
+            sessions = sorted(
+                (session for session in cls.sessions.values() if created_gte <= session['created'] < created_lt),
+                key=lambda session: (session['created'], session['id']),
+                reverse=True,
+            )
+        if starting_after:
+            ids = [session['id'] for session in sessions]
+            sessions = sessions[ids.index(starting_after) + 1:]
+        return stripe.ListObject.construct_from({
+            'object': 'list',
+            'url': '/v1/checkout/sessions',
+            'data': [dict(session) for session in sessions[:limit]],
+            'has_more': len(sessions) > limit,
+        }, 'sk_test_fake')
+
+    async def acreate_checkout_session(self, idempotency_key=None, **params):
+        with timed('stripe'):
+            await self._amaybe_fail()
+            return self._create(idempotency_key, params)
+
+    async def aretrieve_checkout_session(self, session_id):
+        with timed('stripe'):
+            await self._amaybe_fail()
+            return self._retrieve(session_id)
+
+    def _create(self, idempotency_key, params):
+        cls = type(self)
+        with cls._lock:
+            if idempotency_key and idempotency_key in cls.idempotency_keys:
+                return self._construct(cls.sessions[cls.idempotency_keys[idempotency_key]])
+
+            session_id = f"cs_test_fake_{next(cls._counter):08d}"
+            line_item = params['line_items'][0]
+            session = {
+                'id': session_id,
+                'object': 'checkout.session',
+                'url': f"https://checkout.stripe.test/c/pay/{session_id}",
+                'status': 'open',
+                'payment_status': 'unpaid',
+                'amount_total': line_item['price_data']['unit_amount'] * line_item['quantity'],
+                'currency': line_item['price_data']['currency'],
+                'customer_email': params.get('customer_email'),
+                'metadata': {key: str(value) for key, value in params.get('metadata', {}).items()},
+                'created': int(time.time()),
+                'expires_at': int(time.time()) + 24 * 60 * 60,
+            }
+            cls.sessions[session_id] = session
+            if idempotency_key:
+                cls.idempotency_keys[idempotency_key] = session_id
+        return self._construct(session)
+
+    def _retrieve(self, session_id):
+        try:
+            return self._construct(type(self).sessions[session_id])
+        except KeyError:
+            raise stripe.error.InvalidRequestError(f"No such checkout.session: '{session_id}'", 'id')
+
+_gateways = {}
+
+
+def get_gateway():
+    path = settings.STRIPE_GATEWAY
+    if path not in _gateways:
+        _gateways[path] = import_string(path)()
+    return _gateways[path]
+
+
+def build_checkout_params(order, customer_email, success_url, cancel_url):
+    return {
+        'payment_method_types': ['card'],
+        'line_items': [{
+            'price_data': {
+                'currency': 'usd',
+                'product_data': {
+                    'name': f"Order #{order.id}",
+                },
+                'unit_amount': int(order.delivery_cost * 100),  # cents
+            },
+            'quantity': 1,
+        }],
+        'mode': 'payment',
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+        'customer_email': customer_email,
+        'metadata': {
+            'order_id': order.id,
+            'user_id': order.user_id
+        }
+    }
+
+
+def session_expiry(session):
+    expires_at = session.get('expires_at')
+    return datetime.fromtimestamp(expires_at, tz=timezone.utc) if expires_at else None
+
+
+def build_checkout_urls(request, order):
+    # Stripe substitutes {CHECKOUT_SESSION_ID} itself
+    protocol = 'https' if request.is_secure() else 'http'
+    domain = get_current_site(request).domain
+    success_url = f"{protocol}://{domain}/api/v1/payments/payment-success?session_id={{CHECKOUT_SESSION_ID}}&order_id={order.id}"
+    cancel_url = f"{protocol}://{domain}/api/v1/payments/payment-cancel?order_id={order.id}"
+    return success_url, cancel_url
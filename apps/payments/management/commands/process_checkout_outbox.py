@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.payments.outbox import process_pending_sessions
+
+
+class Command(BaseCommand):
+    help = "Create pending Stripe checkout sessions from the outbox, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when the outbox is empty")
+        parser.add_argument('--once', action='store_true', help="Process one batch and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending_sessions(batch_size=options['batch_size'])
+            if processed:
+                opened = sum(1 for checkout in processed if checkout.status == 'open')
+                self.stdout.write(f"Processed {len(processed)} checkout sessions ({opened} opened)")
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
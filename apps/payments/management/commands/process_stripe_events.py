@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.payments.webhooks import process_pending_events
+
+
+class Command(BaseCommand):
+    help = "Apply queued Stripe webhook events in batches, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Process one batch and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending_events(batch_size=options['batch_size'])
+            if processed:
+                applied = sum(1 for event in processed if event.status == 'processed')
+                self.stdout.write(f"Processed {len(processed)} Stripe events ({applied} payments applied)")
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.payments.reconcile import MAX_WINDOW, Reconciler
+
+
+class Command(BaseCommand):
+    help = "Mark orders paid whose Stripe checkout completed but whose webhook never arrived."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=4, help="Concurrent Stripe calls")
+        parser.add_argument('--rate', type=float, help="Stripe calls per second (default: STRIPE_RECONCILE_RATE)")
+        parser.add_argument('--min-age', type=int, default=600, help="Skip sessions opened in the last N seconds")
+        parser.add_argument('--max-window', type=int, default=MAX_WINDOW,
+                            help="Retrieve sessions one by one instead of listing spans longer than N seconds")
+        parser.add_argument('--every', type=float, help="Run again every N seconds instead of once")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            stats = Reconciler(
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                rate=options['rate'],
+                min_age=options['min_age'],
+                max_window=options['max_window'],
+            ).run()
+            self.stdout.write(
+                f"Checked {stats['checked']} sessions, {stats['paid']} paid, {stats['expired']} expired, "
+                f"{stats['api_calls']} Stripe calls, {stats['errors']} failed chunks "
+                f"in {time.monotonic() - started:.2f}s"
+            )
+            if not options['every']:
+                break
+            time.sleep(options['every'])
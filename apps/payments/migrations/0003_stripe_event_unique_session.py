@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:13
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def dedupe_payments(apps, schema_editor):
+    # Redelivered webhooks used to record the same session more than once;
+    # keep the first row so the unique constraint can be added
+    Payment = apps.get_model('payments', 'Payment')
+    duplicates = (Payment.objects.values('stripe_session_id')
+                  .annotate(first_id=Min('id'), rows=Count('id'))
+                  .filter(rows__gt=1))
+    for duplicate in duplicates:
+        (Payment.objects.filter(stripe_session_id=duplicate['stripe_session_id'])
+         .exclude(id=duplicate['first_id']).delete())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_checkoutsession'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_payments, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='stripe_session_id',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('type', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('ignored', 'Ignored'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['next_attempt_at'], name='stripe_event_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_stripe_event_unique_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutsession',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
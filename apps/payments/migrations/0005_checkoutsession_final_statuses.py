@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_checkoutsession_expires_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='checkoutsession',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('open', 'Open'), ('failed', 'Failed'), ('complete', 'Complete'), ('expired', 'Expired')], default='pending', max_length=20),
+        ),
+    ]
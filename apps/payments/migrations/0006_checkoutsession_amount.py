@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_checkoutsession_final_statuses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutsession',
+            name='amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='checkoutsession',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('open', 'Open'), ('failed', 'Failed'), ('cancelled', 'Cancelled'), ('complete', 'Complete'), ('expired', 'Expired')], default='pending', max_length=20),
+        ),
+    ]
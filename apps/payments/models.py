@@ -1,7 +1,12 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from apps.accounts.models import User
 from apps.orders.models import Order
 
@@ -13,7 +18,8 @@ class Payment(models.Model):
     )
 
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payments')
-    stripe_session_id = models.CharField(max_length=255)
+    # One payment per checkout session, however often Stripe reports it
+    stripe_session_id = models.CharField(max_length=255, unique=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=10, default='usd')
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES)
@@ -25,4 +31,83 @@ class Payment(models.Model):
         return f"Payment #{self.id} - {self.payment_status} - Order #{self.order.id}"
 
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+class CheckoutSession(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('open', 'Open'),
+        ('failed', 'Failed'),
+        # Replaced by a newer session before the outbox opened it
+        ('cancelled', 'Cancelled'),
+        # Stripe's final states, recorded by `manage.py reconcile_payments`
+        ('complete', 'Complete'),
+        ('expired', 'Expired'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='checkout_sessions')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    customer_email = models.EmailField(null=True, blank=True)
+    success_url = models.TextField()
+    cancel_url = models.TextField()
+    # The order's delivery cost the session charges
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    stripe_session_id = models.CharField(max_length=255, null=True, blank=True)
+    checkout_url = models.TextField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Checkout #{self.id} - {self.status} - Order #{self.order_id}"
+
+    def matches(self, customer_email, amount):
+        return self.customer_email == customer_email and self.amount == amount
+
+    def is_reusable(self, customer_email, amount):
+        # Leave the customer time to pay before Stripe expires the session
+        return (
+            self.status == 'open'
+            and bool(self.checkout_url)
+            and self.matches(customer_email, amount)
+            and self.expires_at is not None
+            and self.expires_at > timezone.now() + timedelta(seconds=settings.CHECKOUT_REUSE_MARGIN)
+        )
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The outbox worker only polls sessions that still need a Stripe call
+            models.Index(fields=['next_attempt_at'], condition=Q(status='pending'), name='checkout_pending_idx'),
+        ]
+
+
+class StripeEvent(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    )
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.type} {self.event_id} - {self.status}"
+
+    class Meta:
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=Q(status='pending'), name='stripe_event_pending_idx'),
+        ]
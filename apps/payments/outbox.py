@@ -0,0 +1,106 @@
+import logging
+import random
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .gateway import build_checkout_params, get_gateway, session_expiry
+from .models import CheckoutSession
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_checkout_session(order, customer_email, success_url, cancel_url):
+    # Written in the caller's transaction, so the row exists iff the order does
+    return CheckoutSession.objects.create(
+        order=order,
+        customer_email=customer_email,
+        amount=order.delivery_cost,
+        success_url=success_url,
+        cancel_url=cancel_url,
+    )
+
+
+def retry_delay(attempts, base=None, max_delay=None):
+    # Checkout outbox backoff unless a caller passes its own
+    base = settings.CHECKOUT_RETRY_BASE_DELAY if base is None else base
+    max_delay = settings.CHECKOUT_RETRY_MAX_DELAY if max_delay is None else max_delay
+    delay = min(base * (2 ** (attempts - 1)), max_delay)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_due_sessions(batch_size):
+    """
+    Lease a batch of due rows by pushing next_attempt_at forward, so that
+    other workers skip them while the Stripe calls are in flight. A worker
+    that dies mid-batch leaves rows that become due again after the lease.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        sessions = list(
+            CheckoutSession.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .select_related('order')
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if sessions:
+            CheckoutSession.objects.filter(pk__in=[session.pk for session in sessions]).update(
+                next_attempt_at=now + timedelta(seconds=settings.CHECKOUT_LEASE_SECONDS)
+            )
+    return sessions
+
+
+def _session_params(checkout):
+    # Charge what the order costs now, and remember it for reuse checks
+    checkout.attempts += 1
+    checkout.amount = checkout.order.delivery_cost
+    params = build_checkout_params(checkout.order, checkout.customer_email, checkout.success_url, checkout.cancel_url)
+    # The idempotency key makes a retry after a lost response return the same session
+    return dict(params, idempotency_key=f"checkout-session-{checkout.pk}")
+
+
+def _record_attempt(checkout, session=None, error=None):
+    if error is not None:
+        checkout.last_error = str(error)
+        if checkout.attempts >= settings.CHECKOUT_MAX_ATTEMPTS:
+            checkout.status = 'failed'
+            logger.error("Giving up on checkout session for order %s: %s", checkout.order_id, error)
+        else:
+            checkout.next_attempt_at = timezone.now() + retry_delay(checkout.attempts)
+            logger.warning("Checkout session for order %s failed (attempt %s): %s", checkout.order_id, checkout.attempts, error)
+    else:
+        checkout.status = 'open'
+        checkout.stripe_session_id = session.id
+        checkout.checkout_url = session.url
+        checkout.expires_at = session_expiry(session)
+        checkout.last_error = None
+    checkout.save(update_fields=['status', 'amount', 'attempts', 'next_attempt_at', 'last_error', 'stripe_session_id', 'checkout_url', 'expires_at', 'updated_at'])
+    return checkout
+
+
+def process_checkout_session(checkout, gateway=None):
+    gateway = gateway or get_gateway()
+    try:
+        session = gateway.create_checkout_session(**_session_params(checkout))
+    except Exception as e:
+        return _record_attempt(checkout, error=e)
+    return _record_attempt(checkout, session=session)
+
+
+async def aprocess_checkout_session(checkout, gateway=None):
+    gateway = gateway or get_gateway()
+    try:
+        session = await gateway.acreate_checkout_session(**_session_params(checkout))
+    except Exception as e:
+        return await sync_to_async(_record_attempt)(checkout, error=e)
+    return await sync_to_async(_record_attempt)(checkout, session=session)
+
+
+def process_pending_sessions(batch_size=50, gateway=None):
+    processed = claim_due_sessions(batch_size)
+    for checkout in processed:
+        process_checkout_session(checkout, gateway=gateway)
+    return processed
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.utils import timezone
+
+from .gateway import get_gateway
+from .models import CheckoutSession
+from .webhooks import mark_orders_paid
+
+logger = logging.getLogger(__name__)
+
+# Our row and Stripe's session are created a moment apart, and clocks drift
+CREATED_SKEW = 300
+# Listing costs a call per 100 sessions created in the window, whoever they
+# belong to; rows spanning longer than this are retrieved on their own
+MAX_WINDOW = 6 * 60 * 60
+
+
+class RateLimiter:
+    """Space calls at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Reconciler:
+    """
+    Catch up on payments whose webhook never arrived.
+
+    Open checkout sessions of unpaid orders are read in chunks. For each
+    chunk the Stripe sessions created around the chunk's rows are listed
+    100 at a time, the windows split across a small thread pool, and
+    sessions the listing missed are retrieved one by one. Stripe calls share
+    one rate limit; database writes happen on the calling thread only.
+
+    Sessions Stripe reports as expired, or complete and paid, are recorded
+    on their rows, which takes them out of later runs.
+    """
+
+    def __init__(self, chunk_size=500, workers=4, rate=None, min_age=600, max_window=MAX_WINDOW, gateway=None):
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.min_age = timedelta(seconds=min_age)
+        self.max_window = max_window
+        self.limiter = RateLimiter(settings.STRIPE_RECONCILE_RATE if rate is None else rate)
+        self.gateway = gateway or get_gateway()
+        self.api_calls = 0
+        self._calls_lock = threading.Lock()
+        self.listed_until = None
+        self.seen = {}
+
+    def call(self, method, *args, **kwargs):
+        self.limiter.wait()
+        with self._calls_lock:
+            self.api_calls += 1
+        return getattr(self.gateway, method)(*args, **kwargs)
+
+    def candidates(self):
+        # Leave recent sessions to the webhook
+        return (CheckoutSession.objects
+                .filter(status='open', order__is_paid=False, stripe_session_id__isnull=False,
+                        updated_at__lte=timezone.now() - self.min_age)
+                .order_by('pk'))
+
+    def chunks(self):
+        last_pk = 0
+        while True:
+            chunk = list(self.candidates().filter(pk__gt=last_pk)
+                         .values('pk', 'stripe_session_id', 'created_at', 'updated_at')[:self.chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1]['pk']
+
+    def windows(self, chunk):
+        """
+        The time spans to list for a chunk: each row's own span, merged where
+        they overlap. Rows spanning more than max_window are left to
+        retrieve().
+        """
+        spans = sorted(
+            (int(row['created_at'].timestamp()) - CREATED_SKEW, int(row['updated_at'].timestamp()) + CREATED_SKEW)
+            for row in chunk
+        )
+        merged = []
+        for start, end in spans:
+            if end - start > self.max_window:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def list_window(self, created_gte, created_lt):
+        sessions = []
+        starting_after = None
+        while True:
+            page = self.call('list_checkout_sessions', created_gte, created_lt, starting_after=starting_after)
+            sessions.extend(page.data)
+            if not page.has_more or not page.data:
+                return sessions
+            starting_after = page.data[-1].id
+
+    def retrieve(self, session_id):
+        try:
+            return self.call('retrieve_checkout_session', session_id)
+        except stripe.error.InvalidRequestError:
+            logger.warning("Checkout session %s not found on Stripe", session_id)
+            return None
+
+    def fetch(self, pool, chunk):
+        """Return the Stripe sessions of the chunk's rows that Stripe still has."""
+        wanted = {row['stripe_session_id'] for row in chunk}
+        windows = self.windows(chunk)
+        if windows:
+            # Sessions listed for earlier chunks that no later chunk will ask for
+            self.seen = {
+                session_id: session for session_id, session in self.seen.items()
+                if session.created >= windows[0][0]
+            }
+            # Chunks go forward in time; don't list a stretch twice
+            if self.listed_until is not None:
+                windows = [(max(start, self.listed_until), end) for start, end in windows if end > self.listed_until]
+        if windows:
+            step = sum(end - start for start, end in windows) // self.workers + 1
+            slices = [(low, min(low + step, end)) for start, end in windows for low in range(start, end, step)]
+            for sessions in pool.map(lambda window: self.list_window(*window), slices):
+                for session in sessions:
+                    self.seen[session.id] = session
+            self.listed_until = max(self.listed_until or 0, windows[-1][1])
+
+        found = {session_id: self.seen[session_id] for session_id in wanted if session_id in self.seen}
+        for session in pool.map(self.retrieve, wanted - found.keys()):
+            if session is not None:
+                found[session.id] = session
+        return list(found.values())
+
+    def record_statuses(self, sessions):
+        # Paid sessions, and expired ones that never will be, leave the
+        # candidates; complete but unpaid ones wait for their payment
+        for status, session_ids in (
+            ('complete', [session.id for session in sessions if session.payment_status == 'paid']),
+            ('expired', [session.id for session in sessions if session.status == 'expired']),
+        ):
+            if session_ids:
+                CheckoutSession.objects.filter(stripe_session_id__in=session_ids, status='open').update(
+                    status=status, updated_at=timezone.now()
+                )
+
+    def run(self):
+        stats = {'checked': 0, 'paid': 0, 'expired': 0, 'errors': 0}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for chunk in self.chunks():
+                try:
+                    sessions = self.fetch(pool, chunk)
+                except stripe.error.StripeError:
+                    # Leave the chunk for the next run
+                    logger.exception("Failed to reconcile %s checkout sessions", len(chunk))
+                    stats['errors'] += 1
+                    continue
+                paid = [session for session in sessions if session.payment_status == 'paid']
+                mark_orders_paid(paid)
+                self.record_statuses(sessions)
+                stats['checked'] += len(chunk)
+                stats['paid'] += len(paid)
+                stats['expired'] += sum(1 for session in sessions if session.status == 'expired')
+                logger.info("Reconciled %s checkout sessions, %s paid", len(chunk), len(paid))
+        stats['api_calls'] = self.api_calls
+        return stats
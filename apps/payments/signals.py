@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.orders.signals import invalidate_lists_for_orders
+from .models import Payment
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def invalidate_order_lists_for_payment(sender, instance, **kwargs):
+    invalidate_lists_for_orders([instance.order_id])
@@ -1,3 +1,461 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.accounts.models import User
+from apps.orders.models import Order
+from .gateway import FakeStripeGateway, build_checkout_params
+from .models import CheckoutSession, Payment, StripeEvent
+from .outbox import claim_due_sessions, enqueue_checkout_session, process_checkout_session, process_pending_sessions
+from .reconcile import Reconciler
+from .webhooks import mark_orders_paid, process_pending_events
+
+ORDER_DATA = {
+    'pickup_address': "House 1, Road 2, Dhaka",
+    'delivery_address': "House 3, Road 4, Chattogram",
+    'recipient_name': "Recipient",
+    'recipient_phone': "01700000000",
+    'package_description': "Documents",
+    'package_weight': '1.50',
+    'delivery_cost': '120.00',
+}
+
+
+@override_settings(
+    STRIPE_GATEWAY='apps.payments.gateway.FakeStripeGateway',
+    CHECKOUT_MAX_ATTEMPTS=3,
+    CHECKOUT_RETRY_BASE_DELAY=0,
+)
+class CheckoutOutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass', email='customer@example.com')
+
+    def setUp(self):
+        FakeStripeGateway.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def create_order(self):
+        response = self.client.post('/api/v1/orders/', ORDER_DATA, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['data']
+
+    def test_order_creation_does_not_call_stripe(self):
+        FakeStripeGateway.fail_next(100)
+        data = self.create_order()
+        self.assertEqual(data['checkout_status'], 'pending')
+        self.assertEqual(FakeStripeGateway.sessions, {})
+        self.assertEqual(CheckoutSession.objects.filter(status='pending').count(), 1)
+
+    def test_worker_opens_session_and_status_is_pollable(self):
+        data = self.create_order()
+        order_id = data['order']['id']
+
+        process_pending_sessions()
+
+        response = self.client.get(f'/api/v1/payments/checkout-status/{order_id}/')
+        self.assertEqual(response.status_code, 200)
+        status_data = response.json()['data']
+        self.assertEqual(status_data['status'], 'open')
+        session = FakeStripeGateway.sessions[status_data['session_id']]
+        self.assertEqual(session['amount_total'], 12000)
+        self.assertEqual(session['metadata']['order_id'], str(order_id))
+
+    def test_failures_are_retried_then_given_up(self):
+        self.create_order()
+        checkout = CheckoutSession.objects.get()
+
+        FakeStripeGateway.fail_next(1)
+        process_pending_sessions()
+        checkout.refresh_from_db()
+        self.assertEqual((checkout.status, checkout.attempts), ('pending', 1))
+
+        process_pending_sessions()
+        checkout.refresh_from_db()
+        self.assertEqual((checkout.status, checkout.attempts), ('open', 2))
+
+        self.create_order()
+        FakeStripeGateway.fail_next(3)
+        for _ in range(3):
+            process_pending_sessions()
+        failed = CheckoutSession.objects.get(status='failed')
+        self.assertEqual(failed.attempts, 3)
+        self.assertIn("Simulated Stripe outage", failed.last_error)
+
+    def test_other_users_cannot_poll_status(self):
+        order_id = self.create_order()['order']['id']
+        other = User.objects.create_user(username='other', password='pass')
+        self.client.force_authenticate(other)
+        response = self.client.get(f'/api/v1/payments/checkout-status/{order_id}/')
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(Order.objects.filter(pk=order_id).exists())
+
+    def test_idempotency_key_replays_order_creation(self):
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'order-retry-1'}
+        first = self.client.post('/api/v1/orders/', ORDER_DATA, format='json', **headers)
+        second = self.client.post('/api/v1/orders/', ORDER_DATA, format='json', **headers)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(CheckoutSession.objects.count(), 1)
+
+        changed = dict(ORDER_DATA, delivery_cost='99.00')
+        response = self.client.post('/api/v1/orders/', changed, format='json', **headers)
+        self.assertEqual(response.status_code, 422)
+
+    def test_idempotency_key_replays_checkout_session(self):
+        order_id = self.create_order()['order']['id']
+        url = f'/api/v1/payments/create-checkout-session/{order_id}/'
+        first = self.client.post(url, {}, format='json', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        second = self.client.post(url, {}, format='json', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(first.json()['data']['session_id'], second.json()['data']['session_id'])
+        self.assertEqual(len(FakeStripeGateway.sessions), 1)
+
+
+
+@override_settings(STRIPE_GATEWAY='apps.payments.gateway.FakeStripeGateway')
+class CheckoutReuseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass', email='customer@example.com')
+
+    def setUp(self):
+        FakeStripeGateway.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/v1/orders/', ORDER_DATA, format='json')
+        self.order_id = response.json()['data']['order']['id']
+        self.url = f'/api/v1/payments/create-checkout-session/{self.order_id}/'
+
+    def checkout(self, **data):
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_open_session_is_reused(self):
+        # The outbox worker already opened one for the new order
+        process_pending_sessions()
+        opened = CheckoutSession.objects.get()
+        self.assertIsNotNone(opened.expires_at)
+
+        first = self.checkout()
+        second = self.checkout()
+        self.assertEqual(first['message'], "Checkout session retrieved")
+        self.assertEqual(first['data']['session_id'], opened.stripe_session_id)
+        self.assertEqual(second['data'], first['data'])
+        self.assertEqual(len(FakeStripeGateway.sessions), 1)
+
+    def test_new_session_near_expiry_or_for_another_email(self):
+        first = self.checkout()
+        self.assertEqual(first['message'], "Checkout session created")
+
+        other = self.checkout(email='someone@example.com')
+        self.assertNotEqual(other['data']['session_id'], first['data']['session_id'])
+
+        CheckoutSession.objects.filter(stripe_session_id=other['data']['session_id']).update(
+            expires_at=timezone.now() + timedelta(minutes=1)
+        )
+        renewed = self.checkout(email='someone@example.com')
+        self.assertNotEqual(renewed['data']['session_id'], other['data']['session_id'])
+        self.assertEqual(len(FakeStripeGateway.sessions), 3)
+
+    def test_pending_outbox_session_is_opened_not_duplicated(self):
+        # The worker has claimed the row and is still waiting on Stripe
+        claimed, = claim_due_sessions(10)
+        data = self.checkout()['data']
+        self.assertEqual(data['session_id'], CheckoutSession.objects.get().stripe_session_id)
+
+        process_checkout_session(claimed)
+        self.assertEqual(claimed.stripe_session_id, data['session_id'])
+        self.assertEqual(self.checkout()['message'], "Checkout session retrieved")
+        self.assertEqual(len(FakeStripeGateway.sessions), 1)
+
+    def test_replaced_pending_session_is_cancelled(self):
+        self.checkout(email='someone@example.com')
+        self.assertEqual(CheckoutSession.objects.filter(status='cancelled').count(), 1)
+        self.assertEqual(process_pending_sessions(), [])
+        self.assertEqual(len(FakeStripeGateway.sessions), 1)
+
+    def test_new_session_when_the_amount_changed(self):
+        first = self.checkout()
+        Order.objects.filter(pk=self.order_id).update(delivery_cost='150.00')
+        second = self.checkout()
+        self.assertEqual(second['message'], "Checkout session created")
+        self.assertNotEqual(second['data']['session_id'], first['data']['session_id'])
+        self.assertEqual(FakeStripeGateway.sessions[second['data']['session_id']]['amount_total'], 15000)
+
+
+@override_settings(STRIPE_GATEWAY='apps.payments.gateway.FakeStripeGateway')
+class AsyncCheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass', email='customer@example.com')
+        cls.order = Order.objects.create(user=cls.customer, **ORDER_DATA)
+
+    def setUp(self):
+        FakeStripeGateway.reset()
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.customer)}'}
+
+    async def checkout(self, **data):
+        response = await self.async_client.post(
+            f'/api/v1/async/payments/create-checkout-session/{self.order.pk}/',
+            data, content_type='application/json', headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    async def test_open_session_is_reused(self):
+        first = await self.checkout()
+        second = await self.checkout()
+        self.assertEqual(first['message'], "Checkout session created")
+        self.assertEqual(second['message'], "Checkout session retrieved")
+        self.assertEqual(second['data'], first['data'])
+        self.assertEqual(len(FakeStripeGateway.sessions), 1)
+
+        other = await self.checkout(email='someone@example.com')
+        self.assertNotEqual(other['data']['session_id'], first['data']['session_id'])
+
+    async def test_pending_outbox_session_is_opened(self):
+        pending = await sync_to_async(enqueue_checkout_session)(self.order, self.customer.email, 'https://x/ok', 'https://x/cancel')
+        first = await self.checkout()
+        await pending.arefresh_from_db()
+        self.assertEqual((pending.status, pending.stripe_session_id), ('open', first['data']['session_id']))
+        self.assertEqual((await self.checkout())['data'], first['data'])
+        self.assertEqual(len(FakeStripeGateway.sessions), 1)
+
+    async def test_confirm_and_status(self):
+        session_id = (await self.checkout())['data']['session_id']
+        url = f'/api/v1/async/payments/confirm-payment/{self.order.pk}/'
+        response = await self.async_client.post(url, {'session_id': session_id}, content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 402)
+
+        FakeStripeGateway.mark_paid(session_id)
+        response = await self.async_client.post(url, {'session_id': session_id}, content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = await self.async_client.get(f'/api/v1/async/payments/checkout-status/{self.order.pk}/', headers=self.headers)
+        self.assertEqual(response.json()['data']['is_paid'], True)
+        self.assertEqual(response.json()['data']['session_id'], session_id)
+
+
+@override_settings(STRIPE_GATEWAY='apps.payments.gateway.FakeStripeGateway')
+class ConfirmPaymentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass', email='customer@example.com')
+        with cls.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                Order.objects.create(user=cls.customer, **ORDER_DATA)
+        cls.orders = list(Order.objects.order_by('pk'))
+
+    def setUp(self):
+        FakeStripeGateway.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        gateway = FakeStripeGateway()
+        self.sessions = [
+            gateway.create_checkout_session(**build_checkout_params(order, None, 'https://x/ok', 'https://x/cancel')).id
+            for order in self.orders
+        ]
+
+    def confirm(self, order, session_id):
+        return self.client.post(f'/api/v1/payments/confirm-payment/{order.id}/', {'session_id': session_id}, format='json')
+
+    def test_confirm_and_webhook_count_the_payment_once(self):
+        from apps.orders.stats import stats_summary
+
+        session = FakeStripeGateway.mark_paid(self.sessions[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.confirm(self.orders[0], self.sessions[0]).status_code, 200)
+            mark_orders_paid([session])
+            self.assertEqual(self.confirm(self.orders[0], self.sessions[0]).status_code, 200)
+
+        self.assertEqual(Payment.objects.get().stripe_session_id, self.sessions[0])
+        totals = stats_summary()['totals']
+        self.assertEqual((totals['paid_orders'], totals['revenue']), (1, '120.00'))
+
+    def test_session_of_another_order_is_rejected(self):
+        FakeStripeGateway.mark_paid(self.sessions[1])
+        response = self.confirm(self.orders[0], self.sessions[1])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.filter(is_paid=True).exists())
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test', STRIPE_WEBHOOK_MAX_ATTEMPTS=2, STRIPE_WEBHOOK_RETRY_BASE_DELAY=0)
+class StripeWebhookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.order = Order.objects.create(user=cls.customer, **ORDER_DATA)
+
+    def event(self, event_id, order_id=None, session_id='cs_test_1', type='checkout.session.completed'):
+        return {
+            'id': event_id,
+            'object': 'event',
+            'type': type,
+            'data': {'object': {
+                'id': session_id,
+                'object': 'checkout.session',
+                'payment_status': 'paid',
+                'amount_total': 12000,
+                'currency': 'usd',
+                'customer_email': 'customer@example.com',
+                'metadata': {'order_id': str(order_id or self.order.id), 'user_id': str(self.customer.id)},
+            }},
+        }
+
+    def deliver(self, event, secret='whsec_test'):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+        return self.client.post('/api/v1/payments/webhook/', payload, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}")
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.deliver(self.event('evt_1'), secret='whsec_wrong')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_event_is_queued_not_applied(self):
+        response = self.deliver(self.event('evt_1'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StripeEvent.objects.get().status, 'pending')
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.is_paid)
+
+    def test_redeliveries_create_one_payment(self):
+        for _ in range(3):
+            self.assertEqual(self.deliver(self.event('evt_1')).status_code, 200)
+        # A different event for the same session, e.g. async_payment_succeeded
+        self.deliver(self.event('evt_2', type='checkout.session.async_payment_succeeded'))
+        self.deliver(self.event('evt_3', type='customer.created'))
+        self.assertEqual(StripeEvent.objects.count(), 3)
+
+        process_pending_events()
+
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.is_paid)
+        payment = Payment.objects.get()
+        self.assertEqual((payment.stripe_session_id, str(payment.amount)), ('cs_test_1', '120.00'))
+        statuses = dict(StripeEvent.objects.values_list('event_id', 'status'))
+        self.assertEqual(statuses, {'evt_1': 'processed', 'evt_2': 'processed', 'evt_3': 'ignored'})
+        self.assertEqual(process_pending_events(), [])
+
+    def test_bad_event_does_not_block_the_batch(self):
+        broken = self.event('evt_bad', session_id='cs_test_2')
+        del broken['data']['object']['metadata']
+        self.deliver(broken)
+        self.deliver(self.event('evt_1'))
+
+        process_pending_events()
+        self.assertTrue(Payment.objects.filter(stripe_session_id='cs_test_1').exists())
+        bad = StripeEvent.objects.get(event_id='evt_bad')
+        self.assertEqual((bad.status, bad.attempts), ('pending', 1))
+
+        process_pending_events()
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), ('failed', 2))
+
+    @override_settings(STRIPE_WEBHOOK_RETRY_BASE_DELAY=60, CHECKOUT_RETRY_BASE_DELAY=0)
+    def test_retries_use_the_webhook_backoff(self):
+        broken = self.event('evt_bad')
+        del broken['data']['object']['metadata']
+        self.deliver(broken)
+
+        process_pending_events()
+        bad = StripeEvent.objects.get(event_id='evt_bad')
+        self.assertGreater(bad.next_attempt_at, timezone.now() + timedelta(seconds=40))
+        self.assertEqual(process_pending_events(), [])
+
+
+@override_settings(STRIPE_GATEWAY='apps.payments.gateway.FakeStripeGateway')
+class ReconcileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        Order.objects.bulk_create([Order(user=cls.customer, **ORDER_DATA) for _ in range(150)])
+        cls.orders = list(Order.objects.order_by('pk'))
+
+    def setUp(self):
+        FakeStripeGateway.reset()
+        gateway = FakeStripeGateway()
+        sessions = [
+            gateway.create_checkout_session(**build_checkout_params(order, None, 'https://x/ok', 'https://x/cancel'))
+            for order in self.orders
+        ]
+        CheckoutSession.objects.bulk_create([
+            CheckoutSession(order=order, status='open', stripe_session_id=session.id, success_url='', cancel_url='')
+            for order, session in zip(self.orders, sessions)
+        ])
+        self.sessions = [session.id for session in sessions]
+
+    def reconcile(self, **kwargs):
+        return Reconciler(chunk_size=60, workers=2, rate=0, min_age=0, **kwargs).run()
+
+    def test_lost_webhooks_are_reconciled_in_bulk(self):
+        paid = [self.sessions[0], self.sessions[70], self.sessions[149]]
+        for session_id in paid:
+            FakeStripeGateway.mark_paid(session_id)
+        # Outside every listed window, so it has to be retrieved on its own
+        FakeStripeGateway.sessions[self.sessions[149]]['created'] -= 86400
+
+        stats = self.reconcile()
+
+        self.assertEqual((stats['checked'], stats['paid'], stats['errors']), (150, 3, 0))
+        self.assertLess(stats['api_calls'], 20)
+        self.assertEqual(set(Payment.objects.values_list('stripe_session_id', flat=True)), set(paid))
+        self.assertEqual(Order.objects.filter(is_paid=True).count(), 3)
+
+        stats = self.reconcile()
+        self.assertEqual((stats['checked'], stats['paid']), (147, 0))
+        self.assertEqual(Payment.objects.count(), 3)
+
+    def test_paid_and_expired_sessions_leave_the_candidates(self):
+        FakeStripeGateway.mark_paid(self.sessions[0])
+        for session_id in self.sessions[100:]:
+            FakeStripeGateway.expire(session_id)
+
+        stats = self.reconcile()
+
+        self.assertEqual((stats['checked'], stats['paid'], stats['expired']), (150, 1, 50))
+        statuses = dict(CheckoutSession.objects.values_list('status').annotate(count=Count('id')))
+        self.assertEqual(statuses, {'open': 99, 'complete': 1, 'expired': 50})
+        self.assertEqual(self.reconcile()['checked'], 99)
+
+    def test_listing_stays_near_the_candidates(self):
+        # A checkout abandoned a month ago, and plenty of other Stripe sessions since
+        month_ago = timezone.now() - timedelta(days=30)
+        CheckoutSession.objects.filter(stripe_session_id=self.sessions[0]).update(created_at=month_ago, updated_at=month_ago)
+        FakeStripeGateway.sessions[self.sessions[0]]['created'] = int(month_ago.timestamp())
+        for index in range(1000):
+            session_id = f'cs_test_other_{index}'
+            FakeStripeGateway.sessions[session_id] = {
+                'id': session_id, 'object': 'checkout.session', 'status': 'expired', 'payment_status': 'unpaid',
+                'created': int(month_ago.timestamp()) + 2500 * (index + 1),
+            }
+
+        reconciler = Reconciler(chunk_size=60, workers=2, rate=0, min_age=0)
+        stats = reconciler.run()
+
+        self.assertEqual((stats['checked'], stats['errors']), (150, 0))
+        self.assertLess(stats['api_calls'], 10)
+        self.assertLessEqual(len(reconciler.seen), 150)
+
+    def test_stripe_outage_leaves_chunk_for_next_run(self):
+        FakeStripeGateway.mark_paid(self.sessions[0])
+        FakeStripeGateway.fail_next(1)
+        stats = self.reconcile()
+        self.assertEqual(stats['errors'], 1)
+        self.assertFalse(Payment.objects.exists())
+
+        self.assertEqual(self.reconcile()['paid'], 1)
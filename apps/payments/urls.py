@@ -1,12 +1,15 @@
 from django.urls import path
-from .views import CreateCheckoutSessionView, ConfirmPaymentView, payment_cancel,payment_success
+from .views import CreateCheckoutSessionView, ConfirmPaymentView, CheckoutStatusView, payment_cancel,payment_success, stripe_webhook
 from . import views
 
 urlpatterns = [
     path('create-checkout-session/<int:order_id>/', CreateCheckoutSessionView.as_view(), name='create-checkout-session'),
     path('confirm-payment/<int:order_id>/', ConfirmPaymentView.as_view(), name='confirm-payment'),
+    path('checkout-status/<int:order_id>/', CheckoutStatusView.as_view(), name='checkout-status'),
     
      # success & cancel
     path('payment-success/', payment_success, name='payment-success'),
     path('payment-cancel/', payment_cancel, name='payment-cancel'),
+
+    path('webhook/', stripe_webhook, name='stripe-webhook'),
 ]
@@ -1,15 +1,21 @@
+import json
+
 import stripe
 from django.conf import settings
 from rest_framework import status
 from apps.core.base import BaseAPIView
+from apps.core.idempotency import idempotent
 from apps.orders.models import Order
+from .gateway import build_checkout_params, build_checkout_urls, get_gateway, session_expiry
+from .models import CheckoutSession
+from .outbox import process_checkout_session
+from .webhooks import mark_orders_paid, record_event
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 from django.http import JsonResponse
 from django.shortcuts import render
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.contrib.sites.shortcuts import get_current_site
 
 @require_GET
 def payment_success(request):
@@ -31,6 +37,7 @@ def payment_cancel(request):
 
 
 @csrf_exempt
+@require_POST
 def stripe_webhook(request):
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
@@ -43,31 +50,83 @@ def stripe_webhook(request):
     except stripe.error.SignatureVerificationError:
         return JsonResponse({'error': 'Invalid signature'}, status=400)
 
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        order_id = session['metadata']['order_id']
-        user_id = session['metadata']['user_id']
+    # Acknowledge right away; `manage.py process_stripe_events` applies it
+    record_event(json.loads(payload))
+    return JsonResponse({'status': 'success'})
 
-        try:
-            order = Order.objects.get(id=order_id)
-            order.is_paid = True
-            order.save()
-
-            Payment.objects.create(
-                order=order,
-                stripe_session_id=session['id'],
-                amount=session['amount_total']/100,  # cents → dollars
-                currency=session['currency'],
-                payment_status='paid',
-                customer_email=session.get('customer_email')
-            )
-        except Order.DoesNotExist:
-            pass
 
-    return JsonResponse({'status': 'success'})
+# Shared with the async views in async_views.py
+
+def checkout_data(checkout):
+    return {
+        "checkout_url": checkout.checkout_url,
+        "session_id": checkout.stripe_session_id,
+        "email": checkout.customer_email,
+        "expires_at": checkout.expires_at
+    }
+
+
+def checkout_fields(checkout_session, order, customer_email, success_url, cancel_url):
+    # A session the API opened itself, with its single Stripe call
+    return {
+        'status': 'open',
+        'customer_email': customer_email,
+        'amount': order.delivery_cost,
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+        'stripe_session_id': checkout_session.id,
+        'checkout_url': checkout_session.url,
+        'expires_at': session_expiry(checkout_session),
+        'attempts': 1,
+    }
+
+
+def should_open_pending(checkout, order, customer_email):
+    """
+    Decide what to do with a session the outbox has not opened yet. Return
+    True when it suits this request and should be opened now; otherwise it
+    is cancelled so the worker never opens a second session for the order.
+    """
+    if checkout.matches(customer_email, order.delivery_cost):
+        return True
+    CheckoutSession.objects.filter(pk=checkout.pk, status='pending').update(status='cancelled')
+    return False
+
+
+def status_orders(user):
+    # Admins may poll any order, customers only their own
+    orders = Order.objects.all()
+    if user.role != 'admin':
+        orders = orders.filter(user=user)
+    return orders
+
+
+def checkout_status_data(order, checkout):
+    return {
+        "order_id": order.id,
+        "is_paid": order.is_paid,
+        "status": checkout.status,
+        "checkout_url": checkout.checkout_url,
+        "session_id": checkout.stripe_session_id,
+        "attempts": checkout.attempts,
+        "error": checkout.last_error if checkout.status == 'failed' else None
+    }
+
+
+def confirmation_error(order, session):
+    """
+    Return (message, data, status_code) when the Stripe session cannot
+    confirm `order`, otherwise None.
+    """
+    if session.metadata.get("order_id") != str(order.id):
+        return "Payment confirmation failed", {"error": "Stripe session belongs to another order"}, status.HTTP_400_BAD_REQUEST
+    if session.payment_status != "paid":
+        return "Payment not completed", {"error": "Stripe session not paid"}, status.HTTP_402_PAYMENT_REQUIRED
+    return None
 
 
 class CreateCheckoutSessionView(BaseAPIView):
+    @idempotent('payments:checkout:{order_id}')
     def post(self, request, order_id):
         if not request.user.is_authenticated:
             return self.error_response(
@@ -94,40 +153,41 @@ class CreateCheckoutSessionView(BaseAPIView):
             or getattr(request.user, "email", None)
         )
 
+        # A refreshed payment page gets the session it already has
+        checkout = order.checkout_sessions.first()
+        if checkout is not None and checkout.status == 'pending' and should_open_pending(checkout, order, customer_email):
+            # Opened under the outbox's idempotency key, so a worker
+            # racing this request gets the same Stripe session
+            checkout.order = order
+            checkout = process_checkout_session(checkout)
+            if checkout.status != 'open':
+                return self.error_response(
+                    message="Failed to create checkout session",
+                    data={"error": checkout.last_error},
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            return self.success_response(
+                message="Checkout session created",
+                data=checkout_data(checkout)
+            )
+        if checkout is not None and checkout.is_reusable(customer_email, order.delivery_cost):
+            return self.success_response(
+                message="Checkout session retrieved",
+                data=checkout_data(checkout)
+            )
+
         try:
-            current_site = get_current_site(request)
-            protocol = 'https' if request.is_secure() else 'http'
-
-            checkout_session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[{
-                    'price_data': {
-                        'currency': 'usd',
-                        'product_data': {
-                            'name': f"Order #{order.id}",
-                        },
-                        'unit_amount': int(order.delivery_cost * 100),  # cents
-                    },
-                    'quantity': 1,
-                }],
-                mode='payment',
-                success_url = f"{protocol}://{current_site.domain}/api/v1/payments/payment-success?session_id={{CHECKOUT_SESSION_ID}}&order_id={order.id}",
-                cancel_url = f"{protocol}://{current_site.domain}/api/v1/payments/payment-cancel?order_id={order.id}",
-
-                customer_email=customer_email,  
-                metadata={
-                    'order_id': order.id,
-                    'user_id': request.user.id
-                }
+            success_url, cancel_url = build_checkout_urls(request, order)
+            checkout_session = get_gateway().create_checkout_session(
+                **build_checkout_params(order, customer_email, success_url, cancel_url)
+            )
+            checkout = CheckoutSession.objects.create(
+                order=order, **checkout_fields(checkout_session, order, customer_email, success_url, cancel_url)
             )
 
             return self.success_response(
                 message="Checkout session created",
-                data={
-                    "checkout_url": checkout_session.url,
-                    "session_id": checkout_session.id,
-                    "email": customer_email
-                }
+                data=checkout_data(checkout)
             )
 
         except Exception as e:
@@ -161,21 +221,20 @@ class ConfirmPaymentView(BaseAPIView):
             )
 
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
-
-            if session.payment_status == "paid":
-                order.is_paid = True
-                order.save()
-                return self.success_response(
-                    message="Payment confirmed successfully",
-                    data={"order_id": order.id, "paid": True}
-                )
-            else:
-                return self.error_response(
-                    message="Payment not completed",
-                    data={"error": "Stripe session not paid"},
-                    status_code=status.HTTP_402_PAYMENT_REQUIRED
-                )
+            session = get_gateway().retrieve_checkout_session(session_id)
+
+            error = confirmation_error(order, session)
+            if error is not None:
+                message, data, status_code = error
+                return self.error_response(message=message, data=data, status_code=status_code)
+
+            # Same write as the webhook, which is usually racing this
+            # request from the success page
+            mark_orders_paid([session])
+            return self.success_response(
+                message="Payment confirmed successfully",
+                data={"order_id": order.id, "paid": True}
+            )
 
         except Exception as e:
             return self.error_response(
@@ -185,3 +244,30 @@ class ConfirmPaymentView(BaseAPIView):
             )
 
 
+class CheckoutStatusView(BaseAPIView):
+    def get(self, request, order_id):
+        if not request.user.is_authenticated:
+            return self.error_response(
+                message="Authentication required",
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+
+        try:
+            order = status_orders(request.user).get(id=order_id)
+        except Order.DoesNotExist:
+            return self.error_response(
+                message="Order not found",
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+
+        checkout = order.checkout_sessions.first()
+        if checkout is None:
+            return self.error_response(
+                message="No checkout session for this order",
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+
+        return self.success_response(
+            message="Checkout status retrieved successfully",
+            data=checkout_status_data(order, checkout)
+        )
@@ -0,0 +1,150 @@
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.orders.models import Order
+from apps.orders.signals import invalidate_lists_for_orders
+from apps.orders.stats import STATS_FIELDS, record_changes
+from .models import Payment, StripeEvent
+from .outbox import retry_delay
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_EVENTS = {'checkout.session.completed', 'checkout.session.async_payment_succeeded'}
+
+
+def record_event(event):
+    """
+    Store a verified event for the worker. A redelivered event hits the
+    unique event_id and is dropped, so Stripe can retry as often as it likes.
+    """
+    StripeEvent.objects.bulk_create([
+        StripeEvent(event_id=event['id'], type=event['type'], payload=event)
+    ], ignore_conflicts=True)
+
+
+def claim_due_events(batch_size):
+    # Same lease scheme as the checkout outbox, see claim_due_sessions
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if events:
+            StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                next_attempt_at=now + timedelta(seconds=settings.STRIPE_WEBHOOK_LEASE_SECONDS)
+            )
+    return events
+
+
+def paid_session(event):
+    if event.type not in PAYMENT_EVENTS:
+        return None
+    session = event.payload['data']['object']
+    if session.get('payment_status') != 'paid':
+        return None
+    return session
+
+
+def mark_orders_paid(sessions):
+    """
+    Record a payment for each paid checkout session and flag its order paid,
+    with one insert and one update however many sessions there are. Safe to
+    repeat - payments are unique per session and paid orders stay paid.
+    """
+    payments = [
+        Payment(
+            order_id=int(session['metadata']['order_id']),
+            stripe_session_id=session['id'],
+            amount=Decimal(session['amount_total']) / 100,  # cents → dollars
+            currency=session['currency'],
+            payment_status='paid',
+            customer_email=session.get('customer_email'),
+        )
+        for session in sessions
+    ]
+    paid_ids = {payment.order_id for payment in payments}
+    with transaction.atomic():
+        Payment.objects.bulk_create(payments, ignore_conflicts=True)
+        unpaid = Order.objects.select_for_update().filter(id__in=paid_ids, is_paid=False)
+        before = list(unpaid.values(*STATS_FIELDS))
+        unpaid.update(is_paid=True, updated_at=timezone.now())
+        # Bulk writes skip the model signals
+        record_changes(before, [dict(row, is_paid=True) for row in before])
+        if paid_ids:
+            invalidate_lists_for_orders(paid_ids)
+    return paid_ids
+
+
+def apply_events(events):
+    sessions = {}
+    for event in events:
+        session = paid_session(event)
+        if session is not None:
+            sessions[event.pk] = session
+
+    order_ids = {int(session['metadata']['order_id']) for session in sessions.values()}
+    existing = set(Order.objects.filter(id__in=order_ids).values_list('id', flat=True))
+
+    now = timezone.now()
+    paid = []
+    for event in events:
+        session = sessions.get(event.pk)
+        event.attempts += 1
+        event.processed_at = now
+        event.last_error = None
+        if session is None:
+            event.status = 'ignored'
+            continue
+        order_id = int(session['metadata']['order_id'])
+        if order_id not in existing:
+            event.status = 'ignored'
+            event.last_error = f"Order {order_id} not found"
+            continue
+        event.status = 'processed'
+        paid.append(session)
+
+    mark_orders_paid(paid)
+    StripeEvent.objects.bulk_update(events, ['status', 'attempts', 'processed_at', 'last_error'])
+
+
+def record_failure(event, error):
+    event.attempts += 1
+    event.last_error = str(error)
+    if event.attempts >= settings.STRIPE_WEBHOOK_MAX_ATTEMPTS:
+        event.status = 'failed'
+        logger.error("Giving up on Stripe event %s: %s", event.event_id, error)
+    else:
+        event.next_attempt_at = timezone.now() + retry_delay(
+            event.attempts, settings.STRIPE_WEBHOOK_RETRY_BASE_DELAY, settings.STRIPE_WEBHOOK_RETRY_MAX_DELAY
+        )
+        logger.warning("Stripe event %s failed (attempt %s): %s", event.event_id, event.attempts, error)
+    event.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error'])
+
+
+def process_pending_events(batch_size=100):
+    events = claim_due_events(batch_size)
+    if not events:
+        return events
+    attempts = {event.pk: event.attempts for event in events}
+    try:
+        with transaction.atomic():
+            apply_events(events)
+    except Exception:
+        # Find the bad events one by one instead of holding up the batch
+        logger.warning("Stripe event batch failed, retrying events individually", exc_info=True)
+        for event in events:
+            event.status, event.attempts = 'pending', attempts[event.pk]
+            try:
+                with transaction.atomic():
+                    apply_events([event])
+            except Exception as e:
+                event.status, event.attempts = 'pending', attempts[event.pk]
+                record_failure(event, e)
+    return events
@@ -0,0 +1,122 @@
+"""
+Concurrent checkout requests against a slow (fake) Stripe: the sync view on
+a threaded WSGI worker vs the async view on a single ASGI event loop.
+
+    python -m benchmarks.asgi_concurrency --concurrency 10,50,200 --stripe-latency 0.2 --threads 8
+
+Each round fires `concurrency` simultaneous requests and times them from the
+moment they are all submitted, so queueing for a free WSGI thread counts
+towards latency. Every request gets an unpaid order no earlier request has
+touched, so session reuse never answers one without calling Stripe. Both
+sides run in process (test clients against the WSGI and ASGI handlers), so
+the numbers compare the two request models, not server implementations.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from benchmarks.utils import seed, setup_django, summarize
+
+
+def wsgi_round(requests, threads):
+    from django.test import Client
+
+    started = time.perf_counter()
+
+    def send(request):
+        path, headers = request
+        response = Client().post(path, data={}, content_type='application/json', headers=headers)
+        return (time.perf_counter() - started) * 1000, response.status_code
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(send, requests))
+    return time.perf_counter() - started, results
+
+
+async def asgi_round(requests):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    started = time.perf_counter()
+
+    async def send(request):
+        path, headers = request
+        response = await client.post(path, data={}, content_type='application/json', headers=headers)
+        return (time.perf_counter() - started) * 1000, response.status_code
+
+    results = await asyncio.gather(*(send(request) for request in requests))
+    return time.perf_counter() - started, results
+
+
+def report(wall, results, stripe_calls):
+    codes = {}
+    for _, code in results:
+        codes[str(code)] = codes.get(str(code), 0) + 1
+    summary = summarize([elapsed for elapsed, _ in results])
+    summary.update({
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(len(results) / wall, 1),
+        'status_codes': codes,
+        'stripe_calls': stripe_calls,
+    })
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default='10,50,200', help="Comma separated concurrency levels")
+    parser.add_argument('--stripe-latency', type=float, default=0.2, help="Seconds per fake Stripe call")
+    parser.add_argument('--threads', type=int, default=8, help="WSGI worker threads")
+    parser.add_argument('--db', help="SQLite file to use (default: a new temporary file)")
+    args = parser.parse_args(argv)
+    levels = [int(value) for value in args.concurrency.split(',') if value.strip()]
+
+    setup_django(args.db)
+    from django.conf import settings
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+    settings.STRIPE_GATEWAY = 'apps.payments.gateway.FakeStripeGateway'
+
+    from rest_framework_simplejwt.tokens import AccessToken
+    from apps.accounts.models import User
+    from apps.orders.models import Order
+    from apps.payments.gateway import FakeStripeGateway
+
+    # One fresh unpaid order per request, across both legs of every round
+    seed(users=200, couriers=10, orders=2 * sum(levels), tracking_per_order=0)
+    Order.objects.update(is_paid=False)
+    fresh = iter(Order.objects.order_by('id').values_list('id', 'user_id'))
+    headers = {user.id: {'Authorization': f"Bearer {AccessToken.for_user(user)}"} for user in User.objects.filter(role='user')}
+
+    FakeStripeGateway.reset()
+    FakeStripeGateway.latency = args.stripe_latency
+
+    def leg(prefix, level, run):
+        requests = [(f'{prefix}/{order_id}/', headers[user_id]) for order_id, user_id in islice(fresh, level)]
+        sessions = len(FakeStripeGateway.sessions)
+        wall, results = run(requests)
+        return report(wall, results, len(FakeStripeGateway.sessions) - sessions)
+
+    rounds = []
+    for level in levels:
+        rounds.append({
+            'concurrency': level,
+            'wsgi': leg('/api/v1/payments/create-checkout-session', level, lambda requests: wsgi_round(requests, args.threads)),
+            'asgi': leg('/api/v1/async/payments/create-checkout-session', level, lambda requests: asyncio.run(asgi_round(requests))),
+        })
+
+    json.dump({
+        'stripe_latency_seconds': args.stripe_latency,
+        'wsgi_threads': args.threads,
+        'asgi_event_loops': 1,
+        'rounds': rounds,
+    }, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
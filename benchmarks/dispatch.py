@@ -0,0 +1,85 @@
+"""
+Dispatch engine throughput: plan and write assignments for a backlog of
+pending paid orders.
+
+    python -m benchmarks.dispatch --orders 50000 --couriers 2000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from decimal import Decimal
+
+from benchmarks.utils import seed, setup_django
+
+
+def seed_backlog(orders, couriers, preassigned, batch_size=5000):
+    from apps.accounts.models import User
+    from apps.orders.models import Order
+
+    _, courier_ids = seed(users=1000, couriers=couriers, orders=0)
+    # Give couriers uneven capacity and an existing workload to balance against
+    rng = random.Random(7)
+    User.objects.bulk_update(
+        [User(id=courier_id, delivery_capacity=rng.choice([None, 30, 50])) for courier_id in courier_ids],
+        ['delivery_capacity'], batch_size=batch_size
+    )
+    user_id = User.objects.filter(role='user').values_list('id', flat=True).first()
+    template = dict(
+        user_id=user_id, pickup_address="Dhaka", delivery_address="Chattogram", recipient_name="Recipient",
+        recipient_phone="01700000000", package_description="Parcel",
+        package_weight=Decimal('1.00'), delivery_cost=Decimal('100.00'), is_paid=True,
+    )
+    Order.objects.bulk_create(
+        [Order(status='assigned', delivery_man_id=rng.choice(courier_ids), **template) for _ in range(preassigned)]
+        + [Order(status='pending', **template) for _ in range(orders)],
+        batch_size=batch_size
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=50_000)
+    parser.add_argument('--couriers', type=int, default=2_000)
+    parser.add_argument('--preassigned', type=int, default=10_000, help="Orders already assigned before dispatch")
+    parser.add_argument('--db', help="SQLite file to use (default: a new temporary file)")
+    args = parser.parse_args(argv)
+
+    setup_django(args.db)
+    from apps.orders import dispatch
+    from apps.orders.models import Order
+
+    seed_backlog(args.orders, args.couriers, args.preassigned)
+
+    started = time.perf_counter()
+    order_ids = list(dispatch.dispatchable_orders())
+    couriers = dispatch.courier_workload()
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    plan = dispatch.plan_assignments(order_ids, couriers)
+    plan_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    assigned = dispatch.dispatch_orders()
+    total_seconds = time.perf_counter() - started
+
+    report = {
+        'pending_orders': args.orders,
+        'couriers': args.couriers,
+        'preassigned': args.preassigned,
+        'capacity_left': sum(capacity - load for _, load, capacity in couriers if capacity > load),
+        'planned': len(plan),
+        'assigned': assigned,
+        'still_pending': Order.objects.filter(status='pending').count(),
+        'load_seconds': round(load_seconds, 3),
+        'plan_seconds': round(plan_seconds, 3),
+        'dispatch_total_seconds': round(total_seconds, 3),
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""
+Replay the API endpoints against a seeded database and a fake Stripe
+gateway, and report throughput, latency percentiles and queries per
+request as JSON.
+
+    python -m benchmarks.loadtest --orders 100000 --requests 500 -o before.json
+    python -m benchmarks.loadtest --orders 100000 --requests 500 --compare before.json
+
+Requests go through the full Django stack (middleware, JWT authentication,
+views, rendering) in process via the test client, so the numbers measure
+server time only, not the network or a WSGI server.
+"""
+import argparse
+import hashlib
+import hmac
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from benchmarks.utils import seed, setup_django, summarize
+
+SCENARIOS = (
+    'order_list', 'order_list_admin', 'order_detail', 'order_create',
+    'status_update', 'tracking', 'checkout', 'webhook',
+)
+WEBHOOK_SECRET = 'whsec_loadtest'
+
+
+def configure():
+    from django.conf import settings
+
+    # Production-like settings: DEBUG keeps every query in memory
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+    settings.STRIPE_GATEWAY = 'apps.payments.gateway.FakeStripeGateway'
+    settings.STRIPE_WEBHOOK_SECRET = WEBHOOK_SECRET
+
+
+def sign_webhook(payload, secret=WEBHOOK_SECRET):
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+class Fixtures:
+    """Users, tokens and order pools the scenarios draw from."""
+
+    def __init__(self, rng):
+        from rest_framework_simplejwt.tokens import AccessToken
+        from apps.accounts.models import User
+        from apps.orders.models import Order
+
+        self.rng = rng
+        self._tokens = {}
+        self._token_class = AccessToken
+        self._lock = threading.Lock()
+
+        self.admin = User.objects.create_user(username='loadtest_admin', password='!', role='admin')
+        self.user_ids = list(User.objects.filter(role='user').values_list('id', flat=True))
+        self.owned = list(Order.objects.values_list('id', 'user_id'))
+        self.assigned = list(
+            Order.objects.filter(status='assigned').values_list('id', 'delivery_man_id')
+        )
+        self.unpaid = list(Order.objects.filter(is_paid=False).values_list('id', 'user_id'))
+        self._counters = {name: itertools.count() for name in SCENARIOS}
+
+    def token(self, user_id):
+        with self._lock:
+            if user_id not in self._tokens:
+                from apps.accounts.models import User
+                self._tokens[user_id] = str(self._token_class.for_user(User.objects.get(id=user_id)))
+            return self._tokens[user_id]
+
+    def auth(self, user_id):
+        return {'HTTP_AUTHORIZATION': f"Bearer {self.token(user_id)}"}
+
+    def next(self, scenario, pool):
+        # Walk each pool in order so write scenarios don't keep hitting one row
+        with self._lock:
+            return pool[next(self._counters[scenario]) % len(pool)]
+
+    def choice(self, pool):
+        with self._lock:
+            return self.rng.choice(pool)
+
+
+def build_request(scenario, fixtures):
+    """Return (method, path, kwargs) for one request of the scenario."""
+    if scenario == 'order_list':
+        return 'get', '/api/v1/orders/', fixtures.auth(fixtures.choice(fixtures.user_ids))
+    if scenario == 'order_list_admin':
+        # A random upper bound makes most requests miss the list cache
+        status = fixtures.choice(['pending', 'assigned', 'delivered'])
+        before = (date.today() - timedelta(days=fixtures.choice(range(365)))).isoformat()
+        path = f'/api/v1/orders/?status={status}&created_before={before}&page_size=50'
+        return 'get', path, fixtures.auth(fixtures.admin.id)
+    if scenario == 'order_detail':
+        order_id, user_id = fixtures.choice(fixtures.owned)
+        return 'get', f'/api/v1/orders/{order_id}/', fixtures.auth(user_id)
+    if scenario == 'tracking':
+        order_id, user_id = fixtures.choice(fixtures.owned)
+        return 'get', f'/api/v1/orders/{order_id}/tracking/', fixtures.auth(user_id)
+    if scenario == 'order_create':
+        body = {
+            'pickup_address': "House 1, Road 2, Dhaka",
+            'delivery_address': "House 3, Road 4, Chattogram",
+            'recipient_name': "Load Test",
+            'recipient_phone': "01700000000",
+            'package_description': "Load test parcel",
+            'package_weight': '1.50',
+            'delivery_cost': '120.00',
+        }
+        kwargs = fixtures.auth(fixtures.choice(fixtures.user_ids))
+        return 'post', '/api/v1/orders/', dict(kwargs, data=body, content_type='application/json')
+    if scenario == 'status_update':
+        order_id, courier_id = fixtures.next(scenario, fixtures.assigned)
+        status = fixtures.choice(['assigned', 'delivered'])
+        kwargs = fixtures.auth(courier_id)
+        return 'put', f'/api/v1/orders/{order_id}/status/', dict(kwargs, data={'status': status}, content_type='application/json')
+    if scenario == 'checkout':
+        order_id, user_id = fixtures.next(scenario, fixtures.unpaid)
+        kwargs = fixtures.auth(user_id)
+        return 'post', f'/api/v1/payments/create-checkout-session/{order_id}/', dict(kwargs, data={}, content_type='application/json')
+    if scenario == 'webhook':
+        from django.urls import reverse
+        order_id, user_id = fixtures.next(scenario, fixtures.unpaid)
+        session_id = f"cs_test_loadtest_{order_id}"
+        payload = json.dumps({
+            'id': f"evt_loadtest_{order_id}_{time.perf_counter_ns()}",
+            'object': 'event',
+            'type': 'checkout.session.completed',
+            'data': {'object': {
+                'id': session_id,
+                'object': 'checkout.session',
+                'payment_status': 'paid',
+                'amount_total': 12000,
+                'metadata': {'order_id': str(order_id), 'user_id': str(user_id)},
+            }},
+        })
+        return 'post', reverse('stripe-webhook'), {
+            'data': payload, 'content_type': 'application/json', 'HTTP_STRIPE_SIGNATURE': sign_webhook(payload),
+        }
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def scenario_available(scenario, fixtures):
+    from django.urls import NoReverseMatch, reverse
+
+    pools = {'status_update': fixtures.assigned, 'checkout': fixtures.unpaid, 'webhook': fixtures.unpaid}
+    if scenario in pools and not pools[scenario]:
+        return "no matching orders in the seed data"
+    if scenario == 'webhook':
+        try:
+            reverse('stripe-webhook')
+        except NoReverseMatch:
+            return "the Stripe webhook is not routed"
+    return None
+
+
+def run_scenario(scenario, fixtures, requests, concurrency, warmup):
+    from django.db import connection
+    from django.test import Client
+
+    local = threading.local()
+
+    def send():
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        method, path, kwargs = build_request(scenario, fixtures)
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            response = getattr(local.client, method)(path, **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, queries[0], response.status_code
+
+    for _ in range(warmup):
+        send()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: send(), range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed for elapsed, _, _ in results]
+    queries = [count for _, count, _ in results]
+    status_codes = {}
+    for _, _, code in results:
+        status_codes[str(code)] = status_codes.get(str(code), 0) + 1
+    report = summarize(latencies)
+    report.update({
+        'throughput_rps': round(requests / wall, 1),
+        'errors': sum(count for code, count in status_codes.items() if int(code) >= 400),
+        'status_codes': status_codes,
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    })
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    comparison = {}
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous or 'skipped' in current or 'skipped' in previous:
+            continue
+        comparison[name] = {
+            'p95_ratio': round(current['p95_ms'] / previous['p95_ms'], 2) if previous['p95_ms'] else None,
+            'throughput_ratio': round(current['throughput_rps'] / previous['throughput_rps'], 2) if previous['throughput_rps'] else None,
+            'queries_mean_delta': round(current['queries_mean'] - previous['queries_mean'], 2),
+        }
+    return {'baseline_revision': baseline.get('meta', {}).get('revision'), 'scenarios': comparison}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--couriers', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=20_000)
+    parser.add_argument('--tracking', type=int, default=2, help="Tracking rows per order")
+    parser.add_argument('--requests', type=int, default=300, help="Requests per scenario")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=1, help="Client threads per scenario")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Comma separated subset to run")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help="SQLite file to use (default: a new temporary file)")
+    parser.add_argument('-o', '--output', help="Also write the report to this file")
+    parser.add_argument('--compare', help="Earlier report to compare against")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios).difference(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    setup_django(args.db)
+    configure()
+    import django
+    from django.db import connection
+    from apps.orders.cache import get_order_list_cache
+    from apps.payments.gateway import FakeStripeGateway
+
+    seed_started = time.perf_counter()
+    seed(users=args.users, couriers=args.couriers, orders=args.orders,
+         tracking_per_order=args.tracking, seed_value=args.seed)
+    seed_seconds = time.perf_counter() - seed_started
+
+    FakeStripeGateway.reset()
+    fixtures = Fixtures(random.Random(args.seed))
+
+    results = {}
+    for scenario in scenarios:
+        reason = scenario_available(scenario, fixtures)
+        if reason:
+            results[scenario] = {'skipped': reason}
+            continue
+        results[scenario] = run_scenario(scenario, fixtures, args.requests, args.concurrency, args.warmup)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'users': args.users,
+            'couriers': args.couriers,
+            'orders': args.orders,
+            'tracking_per_order': args.tracking,
+            'requests_per_scenario': args.requests,
+            'concurrency': args.concurrency,
+            'seed_seconds': round(seed_seconds, 2),
+            'order_list_cache': get_order_list_cache().stats(),
+        },
+        'scenarios': results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report['comparison'] = compare(report, json.load(f))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Query plans and latency for the role-scoped order queries before and after
+the composite indexes in orders.0004.
+
+    python -m benchmarks.order_indexes --orders 1000000
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.utils import seed, setup_django, time_call
+
+BEFORE = '0003_order_ordering_id'
+AFTER = '0004_order_composite_indexes'
+
+
+def build_queries(user_id, courier_id, order_id, cursor_created_at):
+    from apps.orders.models import Order, TrackingHistory
+
+    return {
+        'customer_list': Order.objects.filter(user_id=user_id).order_by('-created_at', '-id')[:20],
+        'courier_list': Order.objects.filter(delivery_man_id=courier_id).order_by('-created_at', '-id')[:20],
+        'admin_deep_page': Order.objects.filter(created_at__lt=cursor_created_at).order_by('-created_at', '-id')[:20],
+        'unpaid_scan': Order.objects.filter(is_paid=False).order_by('created_at')[:500],
+        'courier_open_load': Order.objects.filter(delivery_man_id=courier_id, status__in=['pending', 'assigned']),
+        'tracking_history': TrackingHistory.objects.filter(order_id=order_id).order_by('-created_at'),
+    }
+
+
+def explain(queryset):
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def measure(queries, repeat):
+    results = {}
+    for name, queryset in queries.items():
+        if name == 'courier_open_load':
+            run = queryset.count
+            plan = explain(queryset.order_by().values('id'))
+        else:
+            run = lambda qs=queryset: list(qs._chain())
+            plan = explain(queryset)
+        results[name] = {'plan': plan, 'latency': time_call(run, repeat=repeat)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--couriers', type=int, default=500)
+    parser.add_argument('--tracking-per-order', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--db', help="SQLite file to use (default: a new temporary file)")
+    args = parser.parse_args(argv)
+
+    db_path = setup_django(args.db)
+    from django.core.management import call_command
+    from django.db import connection
+    from apps.orders.models import Order
+
+    if not Order.objects.exists():
+        seed(users=args.users, couriers=args.couriers, orders=args.orders, tracking_per_order=args.tracking_per_order)
+
+    # Pick the busiest customer and courier so the plans reflect the worst case
+    from django.db.models import Count
+    user_id = Order.objects.values('user_id').annotate(n=Count('id')).order_by('-n')[0]['user_id']
+    courier_id = Order.objects.exclude(delivery_man=None).values('delivery_man_id').annotate(n=Count('id')).order_by('-n')[0]['delivery_man_id']
+    order_id = Order.objects.order_by('id').values_list('id', flat=True)[Order.objects.count() // 2]
+    cursor_created_at = Order.objects.order_by('-created_at').values_list('created_at', flat=True)[Order.objects.count() // 2]
+
+    report = {'database': db_path, 'vendor': connection.vendor, 'orders': Order.objects.count()}
+    for label, migration in (('before', BEFORE), ('after', AFTER)):
+        call_command('migrate', 'orders', migration, verbosity=0)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        report[label] = measure(build_queries(user_id, courier_id, order_id, cursor_created_at), args.repeat)
+
+    call_command('migrate', verbosity=0)
+    json.dump(report, sys.stdout, indent=2, default=str)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Serialize and render a page of orders the old way (ModelSerializer +
+JSONRenderer), the fast way (values() read serializer + FastJSONRenderer)
+and with the compact view.
+
+    python -m benchmarks.serialization --orders 10000
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.utils import seed, setup_django, time_call
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--db', help="SQLite file to use (default: a new temporary file)")
+    args = parser.parse_args(argv)
+
+    setup_django(args.db)
+    from rest_framework.renderers import JSONRenderer
+    from apps.core.base import build_envelope
+    from apps.core.renderers import FastJSONRenderer
+    from apps.orders.models import Order, TrackingHistory
+    from apps.orders.serializers import (
+        OrderSerializer, OrderReadSerializer, TrackingHistorySerializer, TrackingHistoryReadSerializer
+    )
+
+    seed(users=500, couriers=50, orders=args.orders, tracking_per_order=1)
+    orders = Order.objects.order_by('-created_at', '-id')[:args.orders]
+    history = TrackingHistory.objects.order_by('-created_at')[:args.orders]
+
+    # Fetch once so the serialize/render timings don't include the query
+    order_instances = list(orders.select_related('user', 'delivery_man'))
+    order_rows = list(OrderReadSerializer.values(orders))
+    history_instances = list(history)
+    history_rows = list(TrackingHistoryReadSerializer.values(history))
+
+    model_payload = build_envelope(True, "Orders retrieved successfully", OrderSerializer(order_instances, many=True).data, 200)
+    values_payload = build_envelope(True, "Orders retrieved successfully", OrderReadSerializer(order_rows).data, 200)
+    assert json.loads(JSONRenderer().render(model_payload)) == json.loads(FastJSONRenderer().render(values_payload))
+
+    compact = OrderReadSerializer.views['compact']
+    cases = {
+        'order_fetch_model': lambda: list(orders.select_related('user', 'delivery_man')),
+        'order_fetch_values': lambda: list(OrderReadSerializer.values(orders)),
+        'order_serialize_model': lambda: OrderSerializer(order_instances, many=True).data,
+        'order_serialize_values': lambda: OrderReadSerializer(order_rows).data,
+        'order_render_json': lambda: JSONRenderer().render(model_payload),
+        'order_render_fast': lambda: FastJSONRenderer().render(model_payload),
+        'tracking_serialize_model': lambda: TrackingHistorySerializer(history_instances, many=True).data,
+        'tracking_serialize_values': lambda: TrackingHistoryReadSerializer(history_rows).data,
+        'order_end_to_end_before': lambda: JSONRenderer().render(build_envelope(
+            True, "Orders retrieved successfully",
+            OrderSerializer(orders.select_related('user', 'delivery_man'), many=True).data, 200
+        )),
+        'order_end_to_end_after': lambda: FastJSONRenderer().render(build_envelope(
+            True, "Orders retrieved successfully",
+            OrderReadSerializer(OrderReadSerializer.values(orders)).data, 200
+        )),
+        'order_end_to_end_compact': lambda: FastJSONRenderer().render(build_envelope(
+            True, "Orders retrieved successfully",
+            OrderReadSerializer(OrderReadSerializer.values(orders, compact), compact).data, 200
+        )),
+    }
+    results = {name: time_call(func, repeat=args.repeat) for name, func in cases.items()}
+
+    def speedup(before, after):
+        return round(results[before]['p50_ms'] / results[after]['p50_ms'], 1)
+
+    report = {
+        'orders': len(order_rows),
+        'tracking_events': len(history_rows),
+        'bytes': {
+            'full': len(cases['order_end_to_end_after']()),
+            'compact': len(cases['order_end_to_end_compact']()),
+        },
+        'results': results,
+        'speedup_p50': {
+            'order_fetch': speedup('order_fetch_model', 'order_fetch_values'),
+            'order_serialize': speedup('order_serialize_model', 'order_serialize_values'),
+            'order_render': speedup('order_render_json', 'order_render_fast'),
+            'tracking_serialize': speedup('tracking_serialize_model', 'tracking_serialize_values'),
+            'order_end_to_end': speedup('order_end_to_end_before', 'order_end_to_end_after'),
+            'order_end_to_end_compact': speedup('order_end_to_end_before', 'order_end_to_end_compact'),
+        },
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+
+def setup_django(db_path=None, migrate=True):
+    """
+    Configure Django against a throwaway SQLite file (or, with DB_ENGINE=postgres,
+    the scratch database named by db_path) so benchmarks never touch the
+    development database.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    import django
+    from django.conf import settings
+
+    database = settings.DATABASES['default']
+    if database['ENGINE'] == 'django.db.backends.sqlite3':
+        if db_path is None:
+            db_path = os.path.join(tempfile.mkdtemp(prefix='courier-bench-'), 'bench.sqlite3')
+    elif db_path is None:
+        raise SystemExit("Pass --db with the name of an empty scratch database to benchmark on PostgreSQL")
+    database['NAME'] = db_path
+    django.setup()
+
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+    return db_path
+
+
+@contextmanager
+def manual_timestamps(*models):
+    # auto_now_add would overwrite the spread-out timestamps we generate
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def seed(users=1000, couriers=100, orders=10000, tracking_per_order=2, batch_size=5000, seed_value=42, days=365):
+    """Bulk insert a synthetic data set and return the created user ids."""
+    from django.utils import timezone
+    from apps.accounts.models import User
+    from apps.orders.models import Order, TrackingHistory
+
+    rng = random.Random(seed_value)
+    now = timezone.now()
+    span = int(timedelta(days=days).total_seconds())
+
+    User.objects.bulk_create(
+        [User(username=f'bench_user_{i}', password='!', role='user') for i in range(users)]
+        + [User(username=f'bench_courier_{i}', password='!', role='delivery_man') for i in range(couriers)],
+        batch_size=batch_size
+    )
+    user_ids = list(User.objects.filter(role='user', username__startswith='bench_').values_list('id', flat=True))
+    courier_ids = list(User.objects.filter(role='delivery_man', username__startswith='bench_').values_list('id', flat=True))
+
+    statuses = ['pending', 'assigned', 'delivered', 'cancelled']
+    weights = [10, 15, 70, 5]
+    with manual_timestamps(Order, TrackingHistory):
+        created = 0
+        while created < orders:
+            count = min(batch_size, orders - created)
+            batch = []
+            for _ in range(count):
+                order_status = rng.choices(statuses, weights)[0]
+                created_at = now - timedelta(seconds=rng.randrange(span))
+                batch.append(Order(
+                    user_id=rng.choice(user_ids),
+                    delivery_man_id=None if order_status == 'pending' or not courier_ids else rng.choice(courier_ids),
+                    pickup_address=f"House {rng.randrange(1, 500)}, Road {rng.randrange(1, 50)}, Dhaka",
+                    delivery_address=f"House {rng.randrange(1, 500)}, Road {rng.randrange(1, 50)}, Chattogram",
+                    recipient_name=f"Recipient {rng.randrange(100000)}",
+                    recipient_phone=f"017{rng.randrange(10 ** 8):08d}",
+                    package_description="Synthetic benchmark parcel",
+                    package_weight=Decimal(rng.randrange(10, 2000)) / 100,
+                    delivery_cost=Decimal(rng.randrange(5000, 50000)) / 100,
+                    status=order_status,
+                    is_paid=order_status != 'pending' or rng.random() < 0.5,
+                    created_at=created_at,
+                ))
+            Order.objects.bulk_create(batch, batch_size=batch_size)
+            created += count
+
+        if tracking_per_order:
+            history = []
+            for order_id, created_at, order_status in Order.objects.values_list('id', 'created_at', 'status').iterator(chunk_size=batch_size):
+                for step in range(tracking_per_order):
+                    history.append(TrackingHistory(
+                        order_id=order_id,
+                        status=order_status if step == tracking_per_order - 1 else 'pending',
+                        notes="Synthetic benchmark event",
+                        created_at=created_at + timedelta(minutes=step * 30),
+                    ))
+                if len(history) >= batch_size:
+                    TrackingHistory.objects.bulk_create(history, batch_size=batch_size)
+                    history = []
+            if history:
+                TrackingHistory.objects.bulk_create(history, batch_size=batch_size)
+
+    return user_ids, courier_ids
+
+
+def time_call(func, repeat=20):
+    """Run func repeatedly and return latency statistics in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered), 3) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 50), 3),
+        'p95_ms': round(percentile(ordered, 95), 3),
+        'p99_ms': round(percentile(ordered, 99), 3),
+        'max_ms': round(ordered[-1], 3) if ordered else 0.0,
+    }
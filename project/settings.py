@@ -11,8 +11,10 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import copy
 import os
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -29,6 +31,31 @@ DEBUG = os.getenv('DEBUG', 'False') == 'True'
 # Stripe Configuration
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
+# Use 'apps.payments.gateway.FakeStripeGateway' to work offline
+STRIPE_GATEWAY = os.getenv('STRIPE_GATEWAY', 'apps.payments.gateway.StripeGateway')
+
+# Checkout session outbox (see `manage.py process_checkout_outbox`)
+CHECKOUT_MAX_ATTEMPTS = int(os.getenv('CHECKOUT_MAX_ATTEMPTS', 5))
+CHECKOUT_RETRY_BASE_DELAY = float(os.getenv('CHECKOUT_RETRY_BASE_DELAY', 2))
+CHECKOUT_RETRY_MAX_DELAY = float(os.getenv('CHECKOUT_RETRY_MAX_DELAY', 300))
+CHECKOUT_LEASE_SECONDS = int(os.getenv('CHECKOUT_LEASE_SECONDS', 60))
+# An open session is handed out again until this many seconds before it expires
+CHECKOUT_REUSE_MARGIN = int(os.getenv('CHECKOUT_REUSE_MARGIN', 600))
+
+# Stripe webhook events queue (see `manage.py process_stripe_events`)
+STRIPE_WEBHOOK_MAX_ATTEMPTS = int(os.getenv('STRIPE_WEBHOOK_MAX_ATTEMPTS', 5))
+STRIPE_WEBHOOK_LEASE_SECONDS = int(os.getenv('STRIPE_WEBHOOK_LEASE_SECONDS', 60))
+STRIPE_WEBHOOK_RETRY_BASE_DELAY = float(os.getenv('STRIPE_WEBHOOK_RETRY_BASE_DELAY', 2))
+STRIPE_WEBHOOK_RETRY_MAX_DELAY = float(os.getenv('STRIPE_WEBHOOK_RETRY_MAX_DELAY', 300))
+
+# Stripe API calls per second for `manage.py reconcile_payments`
+STRIPE_RECONCILE_RATE = float(os.getenv('STRIPE_RECONCILE_RATE', 20))
+
+# Stored responses for retried POSTs carrying an Idempotency-Key header
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 60 * 60 * 24))
+# How long a retry answers 409 before taking over a request that never finished
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
 
 
 ALLOWED_HOSTS = [
@@ -48,11 +75,15 @@ AUTH_USER_MODEL = 'accounts.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'apps.core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 SIMPLE_JWT = {
@@ -60,6 +91,41 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
 
+# In-process cache of authenticated users, 0 disables it
+JWT_USER_CACHE_TTL = int(os.getenv('JWT_USER_CACHE_TTL', 60))
+JWT_USER_CACHE_SIZE = int(os.getenv('JWT_USER_CACHE_SIZE', 10000))
+
+# Automatic dispatch (see `manage.py dispatch_orders`)
+DISPATCH_DEFAULT_CAPACITY = int(os.getenv('DISPATCH_DEFAULT_CAPACITY', 20))
+DISPATCH_BATCH_SIZE = int(os.getenv('DISPATCH_BATCH_SIZE', 1000))
+
+# Live tracking (server-sent events), served under ASGI
+EVENTS_BROKER = os.getenv('EVENTS_BROKER', 'apps.core.pubsub.LocalBroker')
+TRACKING_STREAM_HEARTBEAT = int(os.getenv('TRACKING_STREAM_HEARTBEAT', 15))
+# Seconds a tracking stream ticket may be used to open (or reopen) the stream
+TRACKING_STREAM_TICKET_TTL = int(os.getenv('TRACKING_STREAM_TICKET_TTL', 60))
+
+# Tracking history of orders delivered or cancelled this many days ago is
+# compressed into TrackingArchive (see `manage.py archive_tracking`)
+TRACKING_ARCHIVE_AFTER_DAYS = int(os.getenv('TRACKING_ARCHIVE_AFTER_DAYS', 90))
+
+# Per-user order list response cache, invalidated by model signals. Workers,
+# management commands and every web process write orders, so it needs a cache
+# alias they all share (e.g. Redis); off unless ORDER_LIST_CACHE_ALIAS is set
+ORDER_LIST_CACHE_ALIAS = os.getenv('ORDER_LIST_CACHE_ALIAS', '')
+ORDER_LIST_CACHE = {
+    'BACKEND': 'apps.core.cache.DjangoCacheBackend' if ORDER_LIST_CACHE_ALIAS else None,
+    'OPTIONS': {'alias': ORDER_LIST_CACHE_ALIAS},
+    'TTL': int(os.getenv('ORDER_LIST_CACHE_TTL', 300)),
+}
+
+# Per-route latency/query metrics at /metrics (bearer METRICS_TOKEN; open only in DEBUG without one)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Log requests slower than this with their slowest SQL, 0 disables it
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 0))
+SLOW_REQUEST_SQL_LIMIT = int(os.getenv('SLOW_REQUEST_SQL_LIMIT', 10))
+
 
 # Application definition
 
@@ -75,6 +141,7 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
+    'apps.core',
     'apps.accounts',
     'apps.orders',
     'apps.payments',
@@ -82,6 +149,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.core.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -114,12 +182,76 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (default) or postgres
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'courier'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
-}
+    if os.getenv('DB_POOL', 'False') == 'True':
+        # psycopg's pool keeps the connections open, Django requires
+        # CONN_MAX_AGE = 0 alongside it
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {},
+        }
+    }
+    if os.getenv('SQLITE_PRAGMAS', 'True') == 'True':
+        # IMMEDIATE transactions take the write lock up front instead of
+        # failing with "database is locked" when a read transaction tries
+        # to upgrade; these pragmas only last for the connection
+        init_command = (
+            f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))};"
+            f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))};"
+            'PRAGMA temp_store=MEMORY;'
+        )
+        if os.getenv('SQLITE_WAL', 'False') == 'True':
+            # WAL lets readers run alongside the single writer. It is written
+            # into the database file and keeps -wal/-shm files next to it, so
+            # it is opt-in; synchronous=NORMAL is only safe with WAL
+            init_command = 'PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;' + init_command
+        DATABASES['default']['OPTIONS'].update({
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': init_command,
+        })
+else:
+    raise ImproperlyConfigured(f"Unsupported DB_ENGINE: {DB_ENGINE}")
+
+# Read replicas for the read-only API endpoints: comma separated SQLite files
+# or PostgreSQL hosts, sharing the primary's other settings
+REPLICA_DATABASES = []
+for index, replica in enumerate(value.strip() for value in os.getenv('DB_REPLICAS', '').split(',') if value.strip()):
+    alias = f'replica_{index}'
+    DATABASES[alias] = copy.deepcopy(DATABASES['default'])
+    DATABASES[alias]['HOST' if DB_ENGINE == 'postgres' else 'NAME'] = replica
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['apps.core.routers.ReplicaRouter']
+# Users read from the primary for this long after a write (read-your-writes);
+# use a shared cache alias when running several processes
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_CACHE = os.getenv('REPLICA_PIN_CACHE', 'default')
 
 
 # Password validation
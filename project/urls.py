@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenRefreshView
+from apps.core.views import metrics
 
 # Custom admin site settings
 admin.site.site_header = 'Courier Management System Administration'
@@ -28,5 +29,8 @@ urlpatterns = [
     path('api/v1/auth/', include('apps.accounts.urls')),
     path('api/v1/orders/', include('apps.orders.urls')),
     path('api/v1/payments/', include('apps.payments.urls')),
+    path('api/v1/async/orders/', include('apps.orders.async_urls')),
+    path('api/v1/async/payments/', include('apps.payments.async_urls')),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('metrics', metrics, name='metrics'),
 ]
\ No newline at end of file